@@ -0,0 +1,77 @@
+# app/api/concurrency.py
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from fastapi import HTTPException
+
+# Límites por endpoint para las llamadas bloqueantes que hace la API (PRAW, Redis/Celery).
+#   max_concurrency: llamadas simultáneas permitidas (también es el tamaño de su pool de hilos)
+#   queue_timeout_s: cuánto puede esperar una petición por un lugar antes de responder 503
+#   timeout_s:       tiempo máximo de la llamada antes de responder 504
+# Cada grupo tiene su propio pool, así una vista previa lenta de Reddit nunca ocupa
+# los hilos que usan la consulta de estado o el encolado.
+try:
+    from app.core.config import API_ENDPOINT_LIMITS
+except ImportError:
+    API_ENDPOINT_LIMITS = {
+        "reddit_preview": {"max_concurrency": 4, "queue_timeout_s": 2.0, "timeout_s": 20.0},
+        "enqueue": {"max_concurrency": 8, "queue_timeout_s": 2.0, "timeout_s": 5.0},
+        "task_status": {"max_concurrency": 32, "queue_timeout_s": 1.0, "timeout_s": 5.0},
+        "delivery": {"max_concurrency": 32, "queue_timeout_s": 1.0, "timeout_s": 5.0},
+    }
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _get_executor(limit_name: str) -> ThreadPoolExecutor:
+    executor = _executors.get(limit_name)
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=API_ENDPOINT_LIMITS[limit_name]["max_concurrency"],
+            thread_name_prefix=f"api_{limit_name}",
+        )
+        _executors[limit_name] = executor
+    return executor
+
+
+def _get_semaphore(limit_name: str) -> asyncio.Semaphore:
+    # Se crea dentro del event loop de Uvicorn la primera vez que se usa
+    semaphore = _semaphores.get(limit_name)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(API_ENDPOINT_LIMITS[limit_name]["max_concurrency"])
+        _semaphores[limit_name] = semaphore
+    return semaphore
+
+
+async def run_blocking(limit_name: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta una función bloqueante fuera del event loop, respetando el límite de
+    concurrencia y el timeout del grupo 'limit_name'. Lanza HTTPException 503 si el
+    grupo está saturado y 504 si la llamada tarda más de lo permitido.
+    """
+    limits = API_ENDPOINT_LIMITS[limit_name]
+    semaphore = _get_semaphore(limit_name)
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=limits["queue_timeout_s"])
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Servidor ocupado ({limit_name}). Intenta de nuevo en unos segundos.",
+            headers={"Retry-After": str(max(1, int(limits["queue_timeout_s"])))},
+        )
+
+    loop = asyncio.get_running_loop()
+    concurrent_future = _get_executor(limit_name).submit(functools.partial(func, *args, **kwargs))
+    # El lugar se libera cuando el hilo realmente termina (aunque la petición ya haya expirado),
+    # así el límite refleja el trabajo que de verdad está en curso.
+    concurrent_future.add_done_callback(lambda _: loop.call_soon_threadsafe(semaphore.release))
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(concurrent_future), timeout=limits["timeout_s"])
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"La operación '{limit_name}' excedió el tiempo máximo de {limits['timeout_s']}s.",
+        )
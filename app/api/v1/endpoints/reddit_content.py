@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Query, Body # Body puede ser útil si envías JSON
 from app.services import scraping_service # Importamos nuestro módulo de servicio
+from app.api.concurrency import run_blocking # Ejecuta llamadas bloqueantes fuera del event loop
 from typing import Any, Optional # Para tipos
 
 # Podríamos definir modelos Pydantic para request y response para mayor claridad y validación
@@ -59,11 +60,16 @@ async def fetch_reddit_post_data(
     # Aquí podrías añadir validación más robusta para la URL si Pydantic HttpUrl no se usa.
 
     try:
-        # Llamamos a nuestro servicio, pasando ambos parámetros
-        post_data = scraping_service.get_post_data_from_url(
+        # Llamamos a nuestro servicio (PRAW es síncrono y va a la red) en el pool acotado
+        # de vistas previas, para no congelar el event loop de Uvicorn.
+        post_data = await run_blocking(
+            "reddit_preview",
+            scraping_service.get_post_data_from_url,
             reddit_url=reddit_url, 
             num_top_comments=num_comments
         )
+    except HTTPException:
+        raise # 503 (saturado) o 504 (timeout) de run_blocking
     except Exception as e:
         # Si el servicio mismo no maneja la excepción y la relanza, la capturamos aquí.
         # O si hay un error antes de llamar al servicio.
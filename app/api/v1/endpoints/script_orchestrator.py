@@ -4,8 +4,12 @@ import uuid
 import json 
 import os
 
-# --- Importar la tarea Celery ---
-from app.workers.tasks.video_processing_tasks import generate_script_and_audio_for_post_task # <--- NUEVA IMPORTACIÓN
+# --- Encolar la tarea Celery por nombre ---
+# No importamos video_processing_tasks: eso cargaría todo el stack de medios en la API.
+from app.workers.celery_app import celery_app, GENERATE_SCRIPT_TASK_NAME
+from app.workers import singleflight
+
+from app.api.concurrency import run_blocking
 
 # --- Importar modelos Pydantic ---
 from app.api.v1.schemas import (
@@ -44,26 +48,58 @@ async def enqueue_generate_full_script_task( # Renombrado para claridad (opciona
         current_project_id = f"project_{uuid.uuid4().hex[:12]}"
     print(f"Usando project_id: {current_project_id}")
 
+    reddit_url = str(request_data.reddit_url)
+    task_kwargs = {
+        "reddit_url": reddit_url,
+        "num_comments": request_data.num_comments,
+        "project_id": current_project_id,
+        "tts_mode": request_data.tts_mode or "sentence",
+        "tts_backend": request_data.tts_backend,
+        "target_duration_s": request_data.target_duration_s,
+        "profile": bool(request_data.profile),
+        # target_narration_language podrías añadirlo al request_data y pasarlo aquí si quieres
+    }
+    if request_data.idempotency_key:
+        dedupe_key = singleflight.idempotency_key("script", request_data.idempotency_key)
+        release_on_finish = False
+    else:
+        # El mismo post con las mismas opciones mientras su tarea sigue en curso se adjunta a ella
+        normalized_url = reddit_url.split("?")[0].rstrip("/").lower()
+        dedupe_key = singleflight.work_key(
+            "script", normalized_url, request_data.num_comments, task_kwargs["tts_mode"], request_data.tts_backend,
+            request_data.target_duration_s, request_data.project_id, task_kwargs["profile"]
+        )
+        release_on_finish = True
+
     # --- LLAMAR A LA TAREA CELERY ---
     try:
-        # Usamos .delay() que es un atajo para .apply_async()
-        # Pasamos los argumentos que espera nuestra tarea Celery
-        task = generate_script_and_audio_for_post_task.delay(
-            reddit_url=str(request_data.reddit_url),
-            num_comments=request_data.num_comments,
-            project_id=current_project_id
-            # target_narration_language podrías añadirlo al request_data y pasarlo aquí si quieres
+        # send_task publica la tarea por nombre con el task_id reservado por singleflight.
+        # Publicar en Redis es I/O bloqueante: se hace en el pool acotado de encolado.
+        entry, created = await run_blocking(
+            "enqueue",
+            singleflight.enqueue_once,
+            dedupe_key,
+            lambda task_id: celery_app.send_task(GENERATE_SCRIPT_TASK_NAME, kwargs=task_kwargs, task_id=task_id),
+            metadata={"project_id": current_project_id},
+            release_on_finish=release_on_finish
         )
-        
-        print(f"Tarea Celery encolada con ID: {task.id} para project_id: {current_project_id}")
-        
+
+        if created:
+            print(f"Tarea Celery encolada con ID: {entry['task_id']} para project_id: {entry['project_id']}")
+        else:
+            print(f"Solicitud duplicada: se reutiliza la tarea {entry['task_id']} del project_id: {entry['project_id']}")
+
         return ScriptGenerationQueuedResponse(
-            project_id=current_project_id,
-            task_id=task.id,
-            status="QUEUED", # O "PENDING", Celery maneja el estado exacto
-            message="La tarea de generación de guion y audio ha sido encolada."
+            project_id=entry["project_id"],
+            task_id=entry["task_id"],
+            status="QUEUED" if created else "ATTACHED", # O "PENDING", Celery maneja el estado exacto
+            message="La tarea de generación de guion y audio ha sido encolada." if created
+                    else "Ya hay una tarea idéntica en curso; se devuelve su ID.",
+            deduplicated=not created
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         # Esto capturaría errores al *intentar encolar* la tarea (ej. si Redis no está disponible)
         # Los errores *dentro* de la tarea Celery se manejarán en el worker y se registrarán allí.
@@ -1,25 +1,18 @@
 # app/api/v1/endpoints/tasks_status.py
 from fastapi import APIRouter, HTTPException, Path
 from celery.result import AsyncResult # Para obtener el resultado de una tarea Celery
-from typing import Any, Optional # Para manejar tipos opcionales
+import json
+from typing import Any, Dict, List, Optional # Para manejar tipos opcionales
+from app.core.redis_client import get_redis_client
 from app.workers.celery_app import celery_app # Importamos nuestra instancia de Celery
-from app.api.v1.schemas import TaskStatusResponse # Importamos el nuevo schema
+from app.workers import assembly_scheduler, task_results
+from app.api.v1.schemas import TaskStatusResponse, TaskStatusSummary, BulkTaskStatusRequest, BulkTaskStatusResponse, TaskTracebackResponse
+from app.api.concurrency import run_blocking
 
 router = APIRouter()
 
-@router.get(
-    "/status/{task_id}",
-    response_model=TaskStatusResponse,
-    summary="Consulta el estado y resultado de una tarea Celery."
-)
-async def get_task_status(
-    task_id: str = Path(..., description="El ID de la tarea Celery a consultar.")
-):
-    """
-    Obtiene el estado actual de una tarea Celery.
-    Si la tarea fue exitosa, también devuelve su resultado.
-    Si la tarea falló, devuelve información del error.
-    """
+def _read_task_status(task_id: str) -> TaskStatusResponse:
+    """Lectura síncrona del estado en el backend de resultados (Redis). Se ejecuta fuera del event loop."""
     # Creamos un objeto AsyncResult para la tarea específica usando su ID
     # y nuestra instancia de la aplicación Celery.
     task_result = AsyncResult(task_id, app=celery_app)
@@ -29,6 +22,8 @@ async def get_task_status(
 
     if task_result.successful():
         result_data = task_result.result # Obtener el resultado (lo que devolvió la función de la tarea)
+        if isinstance(result_data, dict) and "error_details" in result_data: # Resultados antiguos con el traceback adentro
+            result_data = {k: v for k, v in result_data.items() if k != "error_details"}
     elif task_result.failed():
         # Intentar obtener el traceback o la excepción como string
         try:
@@ -42,10 +37,107 @@ async def get_task_status(
         except Exception as e:
             error_data = f"Error al obtener detalles del fallo de la tarea: {str(e)}"
 
+    schedule = None
+    if not task_result.ready():
+        try:
+            schedule = assembly_scheduler.get_schedule_info(task_id)
+        except Exception as e:
+            print(f"[WARN] No se pudo leer la planificación de la tarea {task_id}: {e}")
+
     # El estado puede ser: PENDING, STARTED, RETRY, FAILURE, SUCCESS, REVOKED
     return TaskStatusResponse(
         task_id=task_result.id,
         status=task_result.status,
         result=result_data,
-        error_info=error_data
-    )
\ No newline at end of file
+        error_info=error_data,
+        profile=result_data.get("profile") if isinstance(result_data, dict) else None,
+        schedule=schedule
+    )
+
+@router.get(
+    "/status/{task_id}",
+    response_model=TaskStatusResponse,
+    summary="Consulta el estado y resultado de una tarea Celery."
+)
+async def get_task_status(
+    task_id: str = Path(..., description="El ID de la tarea Celery a consultar.")
+):
+    """
+    Obtiene el estado actual de una tarea Celery.
+    Si la tarea fue exitosa, también devuelve su resultado.
+    Si la tarea falló, devuelve información del error.
+    """
+    # Cada acceso a AsyncResult consulta Redis: se hace en el pool acotado de consultas de estado
+    return await run_blocking("task_status", _read_task_status, task_id)
+
+
+
+def _summarize_task(task_id: str, meta_value: Optional[str], job_value: Optional[str], include_result: bool) -> TaskStatusSummary:
+    # Sin meta en Redis la tarea está en cola (o no existe / expiró): Celery lo reporta como PENDING
+    meta = json.loads(meta_value) if meta_value else {"status": "PENDING", "result": None}
+    summary = TaskStatusSummary(task_id=task_id, status=meta["status"], date_done=meta.get("date_done"))
+    result = meta.get("result")
+    if meta["status"] == "FAILURE":
+        if isinstance(result, dict): # Excepción serializada por Celery
+            summary.error_info = f"{result.get('exc_type', 'Error')}: {result.get('exc_message')}"
+        summary.has_traceback = bool(meta.get("traceback"))
+    elif isinstance(result, dict):
+        summary.project_id = result.get("project_id")
+        summary.result_status = result.get("status")
+        summary.message = result.get("message")
+        summary.delivery_url = result.get("delivery_url")
+        summary.has_traceback = bool(result.get("has_traceback") or result.get("error_details"))
+        if include_result:
+            summary.result = {k: v for k, v in result.items() if k != "error_details"}
+    elif include_result:
+        summary.result = result
+    if meta["status"] not in ("SUCCESS", "FAILURE", "REVOKED"):
+        summary.schedule = assembly_scheduler.compact_job_info(job_value)
+    return summary
+
+
+def _read_bulk_task_status(task_ids: List[str], include_result: bool) -> BulkTaskStatusResponse:
+    """Todas las metas de Celery y los trabajos del planificador en un solo viaje a Redis (pipeline de dos MGET)."""
+    task_ids = list(dict.fromkeys(task_ids)) # Sin duplicados, en el orden pedido
+    meta_keys = [celery_app.backend.get_key_for_task(task_id).decode() for task_id in task_ids]
+    pipeline = get_redis_client().pipeline(transaction=False)
+    pipeline.mget(meta_keys)
+    pipeline.mget([assembly_scheduler.job_key(task_id) for task_id in task_ids])
+    meta_values, job_values = pipeline.execute()
+    return BulkTaskStatusResponse(tasks=[
+        _summarize_task(task_id, meta_value, job_value, include_result)
+        for task_id, meta_value, job_value in zip(task_ids, meta_values, job_values)
+    ])
+
+
+@router.post(
+    "/status/bulk",
+    response_model=BulkTaskStatusResponse,
+    response_model_exclude_none=True,
+    summary="Consulta el estado de muchas tareas en una sola petición (resumen compacto)."
+)
+async def get_bulk_task_status(request_data: BulkTaskStatusRequest):
+    """
+    Pensado para tableros que siguen cientos de tareas: una sola lectura de Redis por petición.
+    Los tracebacks no se incluyen; se piden con GET /tasks/{task_id}/traceback.
+    """
+    return await run_blocking("task_status", _read_bulk_task_status, request_data.task_ids, bool(request_data.include_result))
+
+
+def _read_task_traceback(task_id: str) -> Optional[str]:
+    # Fallos devueltos por nuestras tareas: clave aparte. Excepciones no atrapadas: en la meta de Celery.
+    return task_results.get_traceback(task_id) or AsyncResult(task_id, app=celery_app).traceback
+
+
+@router.get(
+    "/{task_id}/traceback",
+    response_model=TaskTracebackResponse,
+    summary="Devuelve el traceback de una tarea fallida."
+)
+async def get_task_traceback(
+    task_id: str = Path(..., description="El ID de la tarea Celery fallida.")
+):
+    traceback_text = await run_blocking("task_status", _read_task_traceback, task_id)
+    if not traceback_text:
+        raise HTTPException(status_code=404, detail=f"No hay traceback guardado para la tarea {task_id}.")
+    return TaskTracebackResponse(task_id=task_id, traceback=traceback_text)
@@ -3,8 +3,12 @@ from fastapi import APIRouter, HTTPException, Body
 # from typing import Optional # Ya deberías tenerlo
 import uuid # Lo usamos si el project_id se genera aquí, pero ahora lo recibimos
 
-# --- Importar la nueva tarea Celery ---
-from app.workers.tasks.video_processing_tasks import assemble_video_from_project_id_task # <--- NUEVA IMPORTACIÓN
+# --- Encolar la tarea Celery por nombre (sin importar el módulo de tareas en la API) ---
+from app.workers.celery_app import celery_app, ASSEMBLE_VIDEO_TASK_NAME
+from app.workers import singleflight, assembly_scheduler
+from app.services import render_cost_service, retention_service
+
+from app.api.concurrency import run_blocking
 
 # --- Importar modelos Pydantic ---
 from app.api.v1.schemas import AssembleVideoRequest, VideoAssemblyQueuedResponse # <--- USA EL NUEVO RESPONSE MODEL
@@ -32,20 +36,60 @@ async def enqueue_assemble_video_task( # Renombrado para claridad
 
     print(f"Recibida solicitud para encolar ensamblaje de video para el proyecto: {project_id}")
 
+    task_kwargs = {
+        "project_id": project_id,
+        "output_filename": output_filename,
+        "intro_asset": request_data.intro_asset,
+        "outro_asset": request_data.outro_asset,
+        "output_profiles": request_data.output_profiles,
+        "profile": bool(request_data.profile),
+        "caption_mode": request_data.caption_mode,
+    }
+    if request_data.idempotency_key:
+        dedupe_key = singleflight.idempotency_key("assembly", request_data.idempotency_key)
+        release_on_finish = False
+    else:
+        # Un ensamblaje idéntico en curso se reutiliza; uno distinto del mismo proyecto
+        # se encola y el worker lo serializa con el lock del proyecto.
+        dedupe_key = singleflight.work_key("assembly", task_kwargs)
+        release_on_finish = True
+
     try:
-        task = assemble_video_from_project_id_task.delay(
-            project_id=project_id,
-            output_filename=output_filename
+        # Costo estimado desde el header del manifiesto: decide la cola y el orden (trabajo más corto primero)
+        estimate = await run_blocking("enqueue", render_cost_service.estimate_render_cost, project_id, request_data.output_profiles)
+        await run_blocking("enqueue", retention_service.touch_project, project_id) # La recolección no toca proyectos en uso
+
+        def send(task_id: str):
+            if estimate is None: # Sin manifiesto no hay costo: se publica directo y la tarea reporta el error
+                return celery_app.send_task(ASSEMBLE_VIDEO_TASK_NAME, kwargs=task_kwargs, task_id=task_id, queue=assembly_scheduler.LIGHT_QUEUE)
+            return assembly_scheduler.submit_assembly(task_id, task_kwargs, estimate)
+
+        # Publicar en Redis es I/O bloqueante: se hace en el pool acotado de encolado
+        entry, created = await run_blocking(
+            "enqueue",
+            singleflight.enqueue_once,
+            dedupe_key,
+            send,
+            metadata={"project_id": project_id},
+            release_on_finish=release_on_finish
         )
-        
-        print(f"Tarea Celery de ensamblaje de video encolada con ID: {task.id} para project_id: {project_id}")
-        
+
+        if created:
+            print(f"Tarea Celery de ensamblaje de video encolada con ID: {entry['task_id']} para project_id: {project_id}")
+        else:
+            print(f"Ensamblaje duplicado para project_id {project_id}: se reutiliza la tarea {entry['task_id']}")
+
         return VideoAssemblyQueuedResponse(
-            project_id=project_id,
-            task_id=task.id,
-            status="QUEUED",
-            message="La tarea de ensamblaje de video ha sido encolada."
+            project_id=entry["project_id"],
+            task_id=entry["task_id"],
+            status="QUEUED" if created else "ATTACHED",
+            message="La tarea de ensamblaje de video ha sido encolada." if created
+                    else "Ya hay un ensamblaje idéntico en curso; se devuelve su ID.",
+            deduplicated=not created,
+            estimated_cost_s=estimate["estimated_cost_s"] if estimate else None
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al intentar encolar la tarea Celery de ensamblaje: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno al encolar la tarea de ensamblaje: {str(e)}")
\ No newline at end of file
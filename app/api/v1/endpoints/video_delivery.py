@@ -0,0 +1,160 @@
+# app/api/v1/endpoints/video_delivery.py
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import anyio
+from fastapi import APIRouter, HTTPException, Path, Request
+from fastapi.responses import RedirectResponse, Response
+
+from app.api.concurrency import run_blocking
+from app.services import storage_service, retention_service
+
+# Con nginx delante se puede delegar el envío del archivo (sendfile del kernel, sin pasar por Python):
+# DELIVERY_ACCEL_REDIRECT_PREFIX = "/protected/" con una location 'internal' que apunte a /usr/src/app/.
+try:
+    from app.core.config import DELIVERY_ACCEL_REDIRECT_PREFIX
+except ImportError:
+    DELIVERY_ACCEL_REDIRECT_PREFIX = None
+
+DELIVERY_CHUNK_SIZE_BYTES = 256 * 1024 # Memoria máxima por descarga cuando el servidor no soporta zero-copy
+MEDIA_TYPES = {".mp4": "video/mp4", ".srt": "application/x-subrip", ".ass": "text/x-ssa"}
+
+router = APIRouter()
+
+
+class _FileRangeResponse(Response):
+    """
+    Envía los bytes [start, end] del archivo. Si el servidor ASGI ofrece la extensión
+    'http.response.zerocopysend' se usa sendfile; si no, se lee por bloques sin cargar el archivo.
+    """
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: Dict[str, str], send_body: bool):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path, self.start, self.end, self.send_body = path, start, end, send_body
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if not self.send_body or count <= 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": self.start, "count": count})
+            return
+        remaining = count
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(DELIVERY_CHUNK_SIZE_BYTES, remaining))
+                if not chunk: # El archivo se acortó mientras se enviaba
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b""})
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (inicio, fin) inclusivos de un header 'Range: bytes=...' de un solo rango. None si se ignora
+    (formato no soportado o varios rangos: se responde el archivo completo). 416 si no se puede satisfacer.
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first and last and int(last) < int(first): # Rango inválido: se ignora (RFC 9110)
+        return None
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else: # Sufijo: los últimos N bytes
+        start, end = max(0, size - int(last)), size - 1
+    if start >= size or (not first and int(last) == 0):
+        raise HTTPException(status_code=416, detail="Rango no satisfacible.", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _stat_deliverable(key: str, count_access: bool) -> Optional[os.stat_result]:
+    path = os.path.join(storage_service.APP_BASE_DIR, key)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if count_access: # Una vez por reproducción, no por cada petición de rango
+        retention_service.touch_project(key.split("/")[2])
+    return stat
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+@router.api_route(
+    "/files/{key:path}",
+    methods=["GET", "HEAD"],
+    summary="Entrega un video final o un archivo de subtítulos (Range, ETag, HEAD)."
+)
+async def deliver_file(
+    request: Request,
+    key: str = Path(..., description="Clave del archivo, ej. outputs/videos/<project_id>/<project_id>_final_video.mp4")
+):
+    """
+    Sirve archivos de outputs/videos/ y outputs/subtitles/ con soporte de Range (reproducción y
+    búsqueda inmediatas en el navegador), ETag/Last-Modified con respuestas 304 y HEAD.
+    Con el backend S3 redirige a una URL firmada (S3 ya soporta Range).
+    """
+    if not storage_service.is_deliverable_key(key):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado.")
+    storage = storage_service.get_storage()
+    if storage.name != "local":
+        url = await run_blocking("delivery", storage.presigned_url, key)
+        if not url:
+            raise HTTPException(status_code=404, detail="Archivo no encontrado.")
+        return RedirectResponse(url, status_code=307)
+
+    range_header = request.headers.get("range")
+    count_access = request.method == "GET" and (not range_header or range_header.strip().startswith("bytes=0-"))
+    stat = await run_blocking("delivery", _stat_deliverable, key, count_access)
+    if stat is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado.")
+
+    filename = os.path.basename(key)
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": "no-cache", # Se puede guardar, pero se revalida (un re-render reemplaza el archivo)
+        "Content-Type": MEDIA_TYPES.get(os.path.splitext(filename)[1].lower(), "application/octet-stream"),
+        "Content-Disposition": f'inline; filename="{filename}"',
+    }
+    if DELIVERY_ACCEL_REDIRECT_PREFIX:
+        return Response(status_code=200, headers={**headers, "X-Accel-Redirect": DELIVERY_ACCEL_REDIRECT_PREFIX + key})
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k not in ("Content-Type", "Content-Disposition")})
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() in (etag, last_modified)):
+        byte_range = _parse_range(range_header, stat.st_size)
+    if byte_range is None:
+        start, end, status_code = 0, stat.st_size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return _FileRangeResponse(os.path.join(storage_service.APP_BASE_DIR, key), start, end, status_code, headers,
+                              send_body=request.method == "GET")
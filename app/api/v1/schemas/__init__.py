@@ -3,6 +3,7 @@
 # Asumiendo que tus modelos Pydantic están en un archivo llamado 'models.py' 
 # dentro de esta misma carpeta 'schemas/'
 from .schemas import GenerateScriptRequest, GenerateScriptResponse, ScriptSegmentOutput, AssembleVideoRequest, AssembleVideoResponse, ScriptGenerationQueuedResponse, VideoAssemblyQueuedResponse, TaskStatusResponse
+from .schemas import TaskStatusSummary, BulkTaskStatusRequest, BulkTaskStatusResponse, TaskTracebackResponse
 
 # O si tienes diferentes archivos para diferentes tipos de schemas:
 # from .request_schemas import GenerateScriptRequest
@@ -1,6 +1,6 @@
 # video_generator_reddit/app/api/v1/schemas.py
 from pydantic import BaseModel, HttpUrl, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 import uuid # Lo quitamos de aquí si project_id se genera solo en el endpoint
 
 class GenerateScriptRequest(BaseModel):
@@ -14,6 +14,28 @@ class GenerateScriptRequest(BaseModel):
         None, 
         description="ID de proyecto opcional. Si no se provee, se generará uno en el endpoint."
     )
+    tts_mode: Optional[Literal["sentence", "block_ssml"]] = Field(
+        "sentence",
+        description="'sentence': un request TTS por frase. 'block_ssml': un solo request SSML con marks por bloque (un audio por escena)."
+    )
+    tts_backend: Optional[Literal["google", "local"]] = Field(
+        None,
+        description="Motor TTS del proyecto. 'google': Google Cloud TTS. 'local': motor en CPU sin red (borradores rápidos y sin costo). Si no se indica, se usa TTS_BACKEND_DEFAULT."
+    )
+    target_duration_s: Optional[float] = Field(
+        None,
+        gt=0,
+        description="Duración objetivo de la narración en segundos. Los bloques que no caben se omiten o recortan antes de generar el TTS."
+    )
+    idempotency_key: Optional[str] = Field(
+        None,
+        max_length=128,
+        description="Clave opcional del cliente. Repetir el request con la misma clave devuelve la misma tarea en vez de encolar otra."
+    )
+    profile: Optional[bool] = Field(
+        False,
+        description="Perfila la tarea (cProfile + muestreo de pilas). Los artefactos quedan en outputs/profiles/<project_id>/ y se enlazan en /status/{task_id}."
+    )
 
 class ScriptSegmentOutput(BaseModel):
     id: str
@@ -21,6 +43,7 @@ class ScriptSegmentOutput(BaseModel):
     text_chunk: str
     actual_tts_audio_url: str # Ruta al archivo de audio local por ahora
     actual_tts_duration_ms: int
+    audio_offset_ms: Optional[int] = 0
     source_type: str
     visual_type: str
     visual_prompt_or_keyword: str
@@ -38,6 +61,26 @@ class GenerateScriptResponse(BaseModel):
 
 class AssembleVideoRequest(BaseModel):
     project_id: str = Field(..., description="El ID del proyecto para el cual ensamblar el video. Se asume que el guion y los audios ya existen.")
+    intro_asset: Optional[str] = Field(None, description="Nombre del asset estándar a usar como intro (ej. 'intro'). Se pega por stream copy.")
+    outro_asset: Optional[str] = Field(None, description="Nombre del asset estándar a usar como outro (ej. 'outro').")
+    output_profiles: Optional[List[str]] = Field(
+        None,
+        description="Perfiles de salida a renderizar en una sola pasada (ej. ['landscape_1080p', 'shorts_1080x1920', 'landscape_720p'])."
+    )
+    caption_mode: Optional[Literal["textclip", "burn_in", "soft"]] = Field(
+        None,
+        description="'burn_in': subtítulos ASS dibujados por libass al codificar. 'soft': pista de subtítulos seleccionable. "
+                    "'textclip': TextClip de MoviePy. Por defecto, CAPTION_MODE de la configuración. Siempre se generan ASS/SRT descargables."
+    )
+    idempotency_key: Optional[str] = Field(
+        None,
+        max_length=128,
+        description="Clave opcional del cliente. Repetir el request con la misma clave devuelve la misma tarea en vez de encolar otra."
+    )
+    profile: Optional[bool] = Field(
+        False,
+        description="Perfila la tarea (cProfile + muestreo de pilas y tiempos por frame del render). Los artefactos quedan en outputs/profiles/<project_id>/ y se enlazan en /status/{task_id}."
+    )
     # Opcionalmente, podrías pasar output_filename, resolution, fps aquí si quieres que sean configurables por API
     # output_filename: Optional[str] = "final_video.mp4" 
 
@@ -50,17 +93,47 @@ class AssembleVideoResponse(BaseModel):
 class ScriptGenerationQueuedResponse(BaseModel):
     project_id: str
     task_id: str
-    status: str # ej. "QUEUED", "PENDING"
+    status: str # ej. "QUEUED", "PENDING", "ATTACHED" (se reutilizó una tarea idéntica en curso)
     message: str
+    deduplicated: Optional[bool] = False
 
 class VideoAssemblyQueuedResponse(BaseModel):
     project_id: str
     task_id: str
     status: str
     message: str
+    deduplicated: Optional[bool] = False
+    estimated_cost_s: Optional[float] = None # Segundos de render estimados desde el manifiesto
 
 class TaskStatusResponse(BaseModel):
     task_id: str
     status: str  # Ej: "PENDING", "STARTED", "SUCCESS", "FAILURE", "RETRY", "REVOKED"
     result: Optional[Any] = None # El resultado de la tarea si está lista y fue exitosa (puede ser un dict, string, etc.)
-    error_info: Optional[str] = None # Información del error si la tarea falló
\ No newline at end of file
+    error_info: Optional[str] = None # Información del error si la tarea falló
+    profile: Optional[Dict[str, Any]] = None # Enlaces a los artefactos de perfilado si la tarea se pidió con 'profile'
+    schedule: Optional[Dict[str, Any]] = None # Ensamblajes: cola, posición e inicio/fin estimados (epoch)
+
+class TaskStatusSummary(BaseModel):
+    # Versión compacta para consultas masivas: sin el resultado completo ni tracebacks
+    task_id: str
+    status: str
+    project_id: Optional[str] = None
+    result_status: Optional[str] = None # 'status' devuelto por la tarea (SUCCESS, FAILURE, COMPLETED_EMPTY...)
+    message: Optional[str] = None
+    delivery_url: Optional[str] = None
+    error_info: Optional[str] = None
+    has_traceback: Optional[bool] = False # Se pide aparte: GET /tasks/{task_id}/traceback
+    date_done: Optional[str] = None
+    schedule: Optional[Dict[str, Any]] = None # Ensamblajes pendientes/en curso: cola, costo estimado e inicio
+    result: Optional[Any] = None # Solo con include_result
+
+class BulkTaskStatusRequest(BaseModel):
+    task_ids: List[str] = Field(..., min_length=1, max_length=1000, description="IDs de tareas a consultar (hasta 1000).")
+    include_result: Optional[bool] = Field(False, description="Incluye el resultado completo de cada tarea (sin tracebacks).")
+
+class BulkTaskStatusResponse(BaseModel):
+    tasks: List[TaskStatusSummary]
+
+class TaskTracebackResponse(BaseModel):
+    task_id: str
+    traceback: str
\ No newline at end of file
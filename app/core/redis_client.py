@@ -0,0 +1,17 @@
+# app/core/redis_client.py
+import os
+from functools import lru_cache
+
+# Redis compartido por el broker de Celery y los servicios que coordinan workers
+# (rate limiter, locks...). 'redis' es el nombre del servicio en docker-compose.yml.
+try:
+    from app.core.config import REDIS_URL
+except ImportError:
+    REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+
+
+@lru_cache(maxsize=1)
+def get_redis_client():
+    """Devuelve el cliente Redis del proceso (el pool de conexiones es thread-safe)."""
+    import redis # Import local: la API solo lo necesita si usa servicios que coordinan por Redis
+    return redis.Redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=5, socket_connect_timeout=5)
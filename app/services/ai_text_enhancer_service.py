@@ -1,6 +1,6 @@
 # video_generator_reddit/app/services/ai_text_enhancer_service.py
-from openai import OpenAI # Nueva forma de importar
 from typing import Optional, Tuple, List
+from app.services import rate_limiter_service
 
 # Intentar importar la clave API desde config. Es mejor si el cliente la toma de variables de entorno
 # o se le pasa explícitamente al instanciarlo.
@@ -20,7 +20,9 @@ def enhance_text_and_extract_keywords(
         return text_to_process, None
 
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        from openai import OpenAI # Import local: el SDK de OpenAI es pesado y solo lo usa esta función
+        # Los reintentos ante 429 los coordina el rate limiter compartido, no el SDK
+        client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
 
         system_prompt = (
             "Eres un asistente experto en edición y pulido de textos para ser narrados por una voz TTS. "
@@ -41,7 +43,10 @@ def enhance_text_and_extract_keywords(
 
         print(f"[AI Text Enhancer] Enviando texto (primeros 50 chars): '{text_to_process[:50]}...' al modelo {model_name}")
 
-        response = client.chat.completions.create(
+        # with_raw_response: así el limiter ve las cabeceras x-ratelimit-* también en las respuestas exitosas
+        raw_response = rate_limiter_service.call_with_rate_limit(
+            "openai",
+            client.chat.completions.with_raw_response.create,
             model=model_name,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -49,6 +54,7 @@ def enhance_text_and_extract_keywords(
             ],
             temperature=0.3,
         )
+        response = raw_response.parse()
         
         full_response_content = response.choices[0].message.content.strip()
         
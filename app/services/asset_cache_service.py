@@ -0,0 +1,160 @@
+# app/services/asset_cache_service.py
+import os
+import threading
+from typing import Dict, Optional, Tuple, List
+
+from app.services import ffmpeg_utils
+
+# Assets estándar (intro, outro, transición) que se reutilizan en todos los renders.
+# 'path' es relativo al WORKDIR (/usr/src/app). start_s/end_s recortan el clip original.
+# Se pueden sobreescribir desde app/core/config.py con STANDARD_VIDEO_ASSETS.
+try:
+    from app.core.config import STANDARD_VIDEO_ASSETS
+except ImportError:
+    STANDARD_VIDEO_ASSETS = {
+        "transition": {"path": "assets/videos/transi-5.mp4", "start_s": 3.0, "end_s": 5.0},
+        # "intro": {"path": "assets/videos/intro.mp4", "start_s": 0.0, "end_s": None},
+        # "outro": {"path": "assets/videos/outro.mp4", "start_s": 0.0, "end_s": None},
+    }
+
+# Combinaciones (resolución, fps) que se precalientan al arrancar cada worker.
+try:
+    from app.core.config import ASSET_CACHE_WARM_PROFILES
+except ImportError:
+    ASSET_CACHE_WARM_PROFILES = [((1920, 1080), 24)]
+
+APP_BASE_DIR = "/usr/src/app"
+ASSET_CACHE_DIR = os.path.join(APP_BASE_DIR, "outputs", "cache", "assets")
+
+# Cache en memoria (por proceso worker): (nombre, ancho, alto, fps) -> ruta del segmento normalizado
+_normalized_asset_paths: Dict[Tuple[str, int, int, int], str] = {}
+_cache_lock = threading.Lock()
+
+
+def _normalized_asset_filename(asset_name: str, video_resolution: tuple, fps: int) -> str:
+    target_w, target_h = video_resolution
+    return f"{asset_name}_{target_w}x{target_h}_{fps}fps.mp4"
+
+
+def _encode_normalized_asset(asset_spec: dict, output_path: str, video_resolution: tuple, fps: int) -> bool:
+    """
+    Recorta, escala (cubriendo), recorta al centro y codifica el asset con los parámetros
+    estándar para que pueda concatenarse por stream copy con la salida del render.
+    """
+    source_path = os.path.join(APP_BASE_DIR, asset_spec["path"])
+    if not os.path.exists(source_path):
+        print(f"[Asset Cache] [WARN] Asset fuente no encontrado: {source_path}")
+        return False
+
+    target_w, target_h = video_resolution
+    start_s = asset_spec.get("start_s") or 0.0
+    end_s = asset_spec.get("end_s")
+
+    input_args = ["-ss", str(start_s)]
+    if end_s is not None:
+        input_args += ["-to", str(end_s)]
+    input_args += ["-i", source_path]
+
+    video_filter = (
+        f"scale={target_w}:{target_h}:force_original_aspect_ratio=increase,"
+        f"crop={target_w}:{target_h},setsar=1,fps={fps}"
+    )
+
+    if ffmpeg_utils.has_audio_stream(source_path):
+        audio_args = ["-map", "0:v:0", "-map", "0:a:0"]
+    else:
+        # Pista de silencio para que todos los segmentos tengan la misma estructura de streams
+        input_args += ["-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo"]
+        audio_args = ["-map", "0:v:0", "-map", "1:a:0", "-shortest"]
+
+    # Escribir a un temporal y renombrar: varios procesos worker pueden calentar a la vez
+    tmp_output_path = f"{output_path}.{os.getpid()}.tmp.mp4"
+    ok = ffmpeg_utils.run_ffmpeg(
+        input_args + ["-vf", video_filter] + audio_args
+        + ffmpeg_utils.STANDARD_VIDEO_CODEC_ARGS + ffmpeg_utils.STANDARD_AUDIO_CODEC_ARGS
+        + [tmp_output_path],
+        description=f"normalizar asset '{asset_spec['path']}'",
+    )
+    if ok:
+        os.replace(tmp_output_path, output_path)
+    elif os.path.exists(tmp_output_path):
+        os.remove(tmp_output_path)
+    return ok
+
+
+def get_normalized_asset_path(asset_name: str, video_resolution: tuple = (1920, 1080), fps: int = 24) -> Optional[str]:
+    """
+    Devuelve la ruta a la versión normalizada (lista para concatenar) del asset estándar,
+    codificándola la primera vez. Devuelve None si el asset no está configurado o falla.
+    """
+    asset_spec = STANDARD_VIDEO_ASSETS.get(asset_name)
+    if not asset_spec:
+        print(f"[Asset Cache] [WARN] Asset estándar '{asset_name}' no configurado.")
+        return None
+
+    cache_key = (asset_name, int(video_resolution[0]), int(video_resolution[1]), int(fps))
+    cached_path = _normalized_asset_paths.get(cache_key)
+    if cached_path and os.path.exists(cached_path):
+        return cached_path
+
+    with _cache_lock:
+        cached_path = _normalized_asset_paths.get(cache_key)
+        if cached_path and os.path.exists(cached_path):
+            return cached_path
+
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        output_path = os.path.join(ASSET_CACHE_DIR, _normalized_asset_filename(asset_name, video_resolution, fps))
+        if not os.path.exists(output_path):
+            print(f"[Asset Cache] Normalizando '{asset_name}' para {video_resolution[0]}x{video_resolution[1]}@{fps}fps...")
+            if not _encode_normalized_asset(asset_spec, output_path, video_resolution, fps):
+                return None
+        _normalized_asset_paths[cache_key] = output_path
+        return output_path
+
+
+def get_spacer_segment_path(video_resolution: tuple = (1920, 1080), fps: int = 24, frame_count: int = 24) -> Optional[str]:
+    """
+    Segmento negro de frame_count frames (transición entre escenas), solo video y codificado con
+    los parámetros estándar, para concatenarlo por stream copy. Se genera una vez por
+    (resolución, fps, frames); el audio del cuerpo va en una sola pista continua aparte.
+    """
+    asset_name = f"spacer_{frame_count}f"
+    cache_key = (asset_name, int(video_resolution[0]), int(video_resolution[1]), int(fps))
+    cached_path = _normalized_asset_paths.get(cache_key)
+    if cached_path and os.path.exists(cached_path):
+        return cached_path
+
+    with _cache_lock:
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        output_path = os.path.join(ASSET_CACHE_DIR, _normalized_asset_filename(asset_name, video_resolution, fps))
+        if not os.path.exists(output_path):
+            target_w, target_h = video_resolution
+            tmp_output_path = f"{output_path}.{os.getpid()}.tmp.mp4"
+            ok = ffmpeg_utils.run_ffmpeg(
+                ["-f", "lavfi", "-i", f"color=c=black:s={target_w}x{target_h}:r={fps}",
+                 "-frames:v", str(frame_count), "-an"]
+                + ffmpeg_utils.STANDARD_VIDEO_CODEC_ARGS + [tmp_output_path],
+                description=f"segmento espaciador {frame_count} frames",
+            )
+            if not ok:
+                if os.path.exists(tmp_output_path):
+                    os.remove(tmp_output_path)
+                return None
+            os.replace(tmp_output_path, output_path)
+        _normalized_asset_paths[cache_key] = output_path
+        return output_path
+
+
+def warm_standard_assets(profiles: Optional[List[tuple]] = None) -> Dict[str, str]:
+    """
+    Precalienta la cache de assets normalizados para cada (resolución, fps) configurado.
+    Pensado para llamarse al iniciar el proceso worker.
+    """
+    warmed = {}
+    for video_resolution, fps in (profiles or ASSET_CACHE_WARM_PROFILES):
+        for asset_name in STANDARD_VIDEO_ASSETS:
+            path = get_normalized_asset_path(asset_name, tuple(video_resolution), fps)
+            if path:
+                warmed[f"{asset_name}@{video_resolution[0]}x{video_resolution[1]}_{fps}"] = path
+    print(f"[Asset Cache] Assets estándar listos: {len(warmed)}")
+    return warmed
@@ -0,0 +1,211 @@
+# app/services/ffmpeg_utils.py
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import json
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Parámetros de codificación "estándar" de nuestros videos. Todo segmento que se vaya a
+# concatenar por stream copy (-c copy) con la salida de MoviePy debe usar exactamente estos
+# mismos parámetros (codec, pixel format, sample rate y canales de audio).
+STANDARD_VIDEO_CODEC_ARGS = ["-c:v", "libx264", "-preset", "medium", "-pix_fmt", "yuv420p"]
+STANDARD_AUDIO_CODEC_ARGS = ["-c:a", "aac", "-ar", "44100", "-ac", "2"]
+# Todo MP4 que se entrega (o que puede convertirse en la salida final) lleva el átomo moov al
+# principio para que la reproducción arranque sin descargar el archivo completo.
+FASTSTART_ARGS = ["-movflags", "+faststart"]
+
+
+@lru_cache(maxsize=1)
+def get_ffmpeg_binary() -> str:
+    """
+    Devuelve la ruta al binario de ffmpeg. Respeta la variable de entorno FFMPEG_BINARY
+    (la misma que usa MoviePy), luego el PATH del sistema y por último el binario de imageio.
+    """
+    env_binary = os.environ.get("FFMPEG_BINARY")
+    if env_binary and env_binary not in ("ffmpeg-imageio", "auto-detect"):
+        return env_binary
+    system_binary = shutil.which("ffmpeg")
+    if system_binary:
+        return system_binary
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+@lru_cache(maxsize=1)
+def get_ffprobe_binary() -> str:
+    """Devuelve la ruta al binario de ffprobe (instalado junto a ffmpeg en el Dockerfile)."""
+    return shutil.which("ffprobe") or "ffprobe"
+
+
+def run_ffmpeg(args: List[str], description: str = "ffmpeg") -> bool:
+    """
+    Ejecuta ffmpeg con los argumentos dados (sin el binario). Devuelve True si terminó bien.
+    """
+    cmd = [get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error"] + args
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except Exception as e:
+        print(f"[FFMPEG] No se pudo ejecutar ffmpeg para '{description}': {e}")
+        return False
+    if result.returncode != 0:
+        print(f"[FFMPEG] Error en '{description}' (código {result.returncode}): {result.stderr.strip()[-1000:]}")
+        return False
+    return True
+
+
+def has_audio_stream(media_path: str) -> bool:
+    """Indica si el archivo tiene al menos una pista de audio (usando ffprobe)."""
+    cmd = [get_ffprobe_binary(), "-v", "error", "-select_streams", "a",
+           "-show_entries", "stream=index", "-of", "json", media_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            return False
+        return bool(json.loads(result.stdout or "{}").get("streams"))
+    except Exception as e:
+        print(f"[FFMPEG] Error al inspeccionar audio de '{media_path}': {e}")
+        return False
+
+
+def probe_video_info(media_path: str) -> Optional[dict]:
+    """Devuelve {width, height, fps, duration} del primer stream de video (usando ffprobe) o None."""
+    cmd = [get_ffprobe_binary(), "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=width,height,avg_frame_rate:format=duration", "-of", "json", media_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        info = json.loads(result.stdout or "{}")
+        stream = (info.get("streams") or [{}])[0]
+        num, _, den = (stream.get("avg_frame_rate") or "0/1").partition("/")
+        return {
+            "width": int(stream.get("width") or 0),
+            "height": int(stream.get("height") or 0),
+            "fps": round(float(num) / float(den or 1), 3) if float(den or 1) else 0.0,
+            "duration": float(info.get("format", {}).get("duration") or 0),
+        }
+    except Exception as e:
+        print(f"[FFMPEG] Error al inspeccionar video de '{media_path}': {e}")
+        return None
+
+
+def concat_segments_stream_copy(segment_paths: List[str], output_path: str) -> Optional[str]:
+    """
+    Concatena segmentos ya codificados con los parámetros estándar usando el demuxer
+    concat de ffmpeg y copia de streams (sin recodificar). Devuelve la ruta de salida o None.
+    """
+    segment_paths = [p for p in segment_paths if p]
+    if not segment_paths:
+        return None
+
+    list_fd, list_path = tempfile.mkstemp(suffix=".txt", prefix="concat_")
+    try:
+        with os.fdopen(list_fd, "w", encoding="utf-8") as f:
+            for path in segment_paths:
+                # El demuxer concat requiere escapar las comillas simples
+                escaped_path = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+
+        ok = run_ffmpeg(
+            ["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy"] + FASTSTART_ARGS + [output_path],
+            description=f"concat de {len(segment_paths)} segmentos",
+        )
+        return output_path if ok else None
+    finally:
+        if os.path.exists(list_path):
+            try: os.remove(list_path)
+            except Exception as e_remove: print(f"[WARN] No se pudo eliminar la lista de concat: {e_remove}")
+
+
+class RawFramePipeWriter:
+    """
+    Escribe frames RGB24 crudos en el stdin de un proceso ffmpeg sin copias intermedias:
+    cada frame (buffer uint8 contiguo) se pasa como memoryview a os.write. Un hilo escritor
+    hace la escritura al pipe mientras el llamador compone el frame siguiente (doble buffer).
+
+    Contrato de buffers: cuando write() retorna, el frame ANTERIOR ya se escribió por completo,
+    así que un productor con 2 buffers alternados puede reutilizarlos sin que se pisen.
+    """
+
+    def __init__(self, cmd: List[str]):
+        self._stderr_file = tempfile.TemporaryFile()
+        # bufsize=0: stdin es un FileIO sin buffer de Python (nada de copias a un BufferedWriter)
+        self._process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=self._stderr_file, bufsize=0)
+        self._stdin_fd = self._process.stdin.fileno()
+        self._pending = None # Frame entregado al hilo escritor
+        self._frame_ready = threading.Semaphore(0)
+        self._frame_written = threading.Semaphore(1)
+        self._error: Optional[BaseException] = None
+        self._closing = False
+        self.stats = {"frames": 0, "bytes": 0, "copies": 0, "pipe_write_s": 0.0, "producer_wait_s": 0.0}
+        self._writer_thread = threading.Thread(target=self._writer_loop, name="raw_frame_writer", daemon=True)
+        self._started_at = time.perf_counter()
+        self._writer_thread.start()
+
+    def _writer_loop(self):
+        while True:
+            self._frame_ready.acquire()
+            view = self._pending
+            if view is None: # close()
+                return
+            try:
+                write_start = time.perf_counter()
+                while view:
+                    written = os.write(self._stdin_fd, view)
+                    view = view[written:]
+                self.stats["pipe_write_s"] += time.perf_counter() - write_start
+            except BaseException as e: # ej. BrokenPipeError si ffmpeg terminó con error
+                self._error = e
+            finally:
+                self._pending = None
+                self._frame_written.release()
+
+    def write(self, frame):
+        """Encola un frame (ndarray HxWx3). Solo copia si no es un buffer uint8 C-contiguo."""
+        if self._error is not None:
+            raise self._error
+        if getattr(frame, "dtype", None) != "uint8" or not frame.flags["C_CONTIGUOUS"]:
+            import numpy as np
+            frame = np.ascontiguousarray(frame, dtype=np.uint8)
+            self.stats["copies"] += 1
+        view = memoryview(frame).cast("B")
+        wait_start = time.perf_counter()
+        self._frame_written.acquire() # Espera a que termine la escritura del frame anterior
+        self.stats["producer_wait_s"] += time.perf_counter() - wait_start
+        if self._error is not None:
+            self._frame_written.release()
+            raise self._error
+        self._pending = view
+        self.stats["frames"] += 1
+        self.stats["bytes"] += view.nbytes
+        self._frame_ready.release()
+
+    def close(self) -> Tuple[int, str]:
+        """Espera el último frame, cierra stdin y devuelve (código de salida de ffmpeg, stderr)."""
+        if not self._closing:
+            self._closing = True
+            self._frame_written.acquire()
+            self._pending = None
+            self._frame_ready.release()
+            self._writer_thread.join()
+            try: self._process.stdin.close()
+            except OSError: pass
+        returncode = self._process.wait()
+        self._stderr_file.seek(0)
+        stderr_output = self._stderr_file.read().decode("utf-8", errors="replace")
+        self._stderr_file.close()
+        elapsed_s = time.perf_counter() - self._started_at
+        self.stats.update(
+            elapsed_s=round(elapsed_s, 3),
+            fps=round(self.stats["frames"] / elapsed_s, 2) if elapsed_s else None,
+            pipe_write_s=round(self.stats["pipe_write_s"], 3),
+            producer_wait_s=round(self.stats["producer_wait_s"], 3),
+        )
+        return returncode, stderr_output
@@ -0,0 +1,332 @@
+# app/services/media_library_service.py
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.services import storage_service
+
+# Biblioteca local de clips de stock compartida entre proyectos.
+#   enabled:             si es False, cada escena vuelve a buscar en Pexels (comportamiento original)
+#   min_similarity:      similitud coseno TF-IDF mínima para considerar un clip de la biblioteca
+#   max_uses_per_clip:   variedad: tras N usos un clip deja de ofrecerse
+#   reuse_cooldown_s:    variedad: no repetir un clip usado hace menos de este tiempo en otro proyecto
+#   fresh_search_ratio:  frescura: fracción de búsquedas que van a Pexels aunque haya coincidencia,
+#                        para que la biblioteca siga creciendo (decidido por hash, es determinista)
+try:
+    from app.core.config import MEDIA_LIBRARY
+except ImportError:
+    MEDIA_LIBRARY = {
+        "enabled": True,
+        "min_similarity": 0.35,
+        "max_uses_per_clip": 20,
+        "reuse_cooldown_s": 6 * 3600,
+        "fresh_search_ratio": 0.15,
+    }
+
+LIBRARY_INDEX_KEY = "outputs/media_library/index.json"
+LIBRARY_VIDEOS_PREFIX = "outputs/media_library/videos"
+INDEX_CACHE_TTL_S = 30 # En S3 el índice se vuelve a descargar como mucho cada 30 s
+# El uso de cada clip (variedad) cambia en cada escena: vive en un hash de Redis por clip, no en el índice
+_USAGE_KEY_PREFIX = "media_library:usage:"
+
+_STOPWORDS = {
+    # español
+    "de", "la", "el", "los", "las", "un", "una", "unos", "unas", "y", "o", "en", "con", "por", "para",
+    "del", "al", "que", "se", "su", "sus", "es", "lo", "como", "mas", "sin", "sobre",
+    # inglés
+    "the", "a", "an", "and", "or", "of", "in", "on", "with", "for", "to", "at", "by", "from", "video",
+}
+
+_index_lock = threading.Lock()
+_index_cache: Dict[str, Any] = {"loaded_at": 0.0, "index": None}
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin acentos, sin stopwords y con un singular aproximado (plurales en -s)."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text):
+        if len(token) < 3 or token in _STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def library_clip_key(pexels_video_id: Any, pexels_file_id: Any) -> str:
+    """Clave estable del clip en la biblioteca (el mismo archivo de Pexels se descarga una sola vez)."""
+    return storage_service.storage_key(LIBRARY_VIDEOS_PREFIX, f"pexels_{pexels_video_id}_{pexels_file_id}.mp4")
+
+
+def _empty_index() -> Dict[str, Any]:
+    return {"version": 1, "clips": {}}
+
+
+def _load_index(force: bool = False) -> Dict[str, Any]:
+    storage = storage_service.get_storage()
+    if not force and _index_cache["index"] is not None and time.time() - _index_cache["loaded_at"] < INDEX_CACHE_TTL_S:
+        return _index_cache["index"]
+    index_path = storage.ensure_local(LIBRARY_INDEX_KEY, refresh=True)
+    index = _empty_index()
+    if index_path:
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except Exception as e:
+            print(f"[Media Library] [WARN] No se pudo leer el índice, se usa uno vacío: {e}")
+    _index_cache.update(loaded_at=time.time(), index=index)
+    return index
+
+
+def _save_index(index: Dict[str, Any]):
+    storage = storage_service.get_storage()
+    index_path = storage.local_path(LIBRARY_INDEX_KEY)
+    tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    storage.save_file(LIBRARY_INDEX_KEY)
+    _index_cache.update(loaded_at=time.time(), index=index)
+
+
+def _update_index(mutate):
+    """
+    Lee, modifica y guarda el índice bajo un lock de hilos y de Redis (entre workers). Si no se
+    obtiene el lock de Redis se lanza RuntimeError: escribir sin él pisaría la actualización de otro.
+    """
+    from app.core.redis_client import get_redis_client
+    redis_lock = get_redis_client().lock("media_library:index", timeout=30, blocking_timeout=10)
+    if not redis_lock.acquire():
+        raise RuntimeError("no se obtuvo el lock del índice")
+    try:
+        with _index_lock:
+            index = _load_index(force=True)
+            mutate(index)
+            _save_index(index)
+    finally:
+        try: redis_lock.release()
+        except Exception: pass
+
+
+def _record_clip_use(clip_key: str, project_id: str):
+    from app.core.redis_client import get_redis_client
+    pipe = get_redis_client().pipeline()
+    pipe.hincrby(_USAGE_KEY_PREFIX + clip_key, "use_count", 1)
+    pipe.hset(_USAGE_KEY_PREFIX + clip_key, mapping={"last_used_at": time.time(), "last_used_project": project_id})
+    pipe.execute()
+
+
+def _clip_usage(clips: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Uso de cada clip: el de Redis más el que quedó guardado en el índice antes de mover el uso a Redis.
+    Sin Redis se usa solo el del índice.
+    """
+    clip_keys = list(clips)
+    usage = {key: {"use_count": clip.get("use_count", 0), "last_used_at": clip.get("last_used_at", 0.0),
+                   "last_used_project": clip.get("last_used_project")} for key, clip in clips.items()}
+    try:
+        from app.core.redis_client import get_redis_client
+        pipe = get_redis_client().pipeline()
+        for clip_key in clip_keys:
+            pipe.hgetall(_USAGE_KEY_PREFIX + clip_key)
+        for clip_key, redis_usage in zip(clip_keys, pipe.execute()):
+            if not redis_usage:
+                continue
+            usage[clip_key]["use_count"] += int(redis_usage.get("use_count", 0))
+            if float(redis_usage.get("last_used_at", 0)) >= usage[clip_key]["last_used_at"]:
+                usage[clip_key]["last_used_at"] = float(redis_usage["last_used_at"])
+                usage[clip_key]["last_used_project"] = redis_usage.get("last_used_project")
+    except Exception as e:
+        print(f"[Media Library] [WARN] No se pudo leer el uso de los clips desde Redis: {e}")
+    return usage
+
+
+def _tags_from_pexels_video(video_info: Dict[str, Any]) -> List[str]:
+    # Pexels no siempre manda 'tags'; la URL pública trae un slug descriptivo (ej. /video/aerial-view-of-a-forest-123/)
+    tags = list(video_info.get("tags") or [])
+    slug_match = re.search(r"/video/([a-z0-9-]+?)-?\d*/?$", video_info.get("url") or "")
+    if slug_match:
+        tags.append(slug_match.group(1).replace("-", " "))
+    return tags
+
+
+def register_clip(
+    clip_key: str,
+    keywords: str,
+    project_id: str,
+    video_info: Optional[Dict[str, Any]] = None,
+    file_info: Optional[Dict[str, Any]] = None,
+    probed_info: Optional[Dict[str, Any]] = None
+):
+    """
+    Agrega (o enriquece) un clip descargado en el índice con sus keywords y metadatos y registra
+    el uso. El índice solo se reescribe si el clip es nuevo o trae keywords/tags nuevos.
+    """
+    video_info, file_info, probed_info = video_info or {}, file_info or {}, probed_info or {}
+    try:
+        _record_clip_use(clip_key, project_id)
+    except Exception as e:
+        print(f"[Media Library] [WARN] No se pudo registrar el uso del clip '{clip_key}': {e}")
+
+    known_clip = _load_index().get("clips", {}).get(clip_key)
+    new_tags = _tags_from_pexels_video(video_info)
+    if known_clip and (not keywords or keywords in known_clip["keywords"]) and all(tag in known_clip["tags"] for tag in new_tags):
+        return
+
+    def mutate(index):
+        clip = index["clips"].setdefault(clip_key, {
+            "keywords": [], "tags": [], "added_at": time.time(), "use_count": 0,
+            "last_used_at": 0.0, "last_used_project": None,
+        })
+        if keywords and keywords not in clip["keywords"]:
+            clip["keywords"].append(keywords)
+        for tag in new_tags:
+            if tag not in clip["tags"]:
+                clip["tags"].append(tag)
+        clip.update({
+            "pexels_video_id": video_info.get("id", clip.get("pexels_video_id")),
+            "width": file_info.get("width") or probed_info.get("width") or clip.get("width") or 0,
+            "height": file_info.get("height") or probed_info.get("height") or clip.get("height") or 0,
+            "fps": file_info.get("fps") or probed_info.get("fps") or clip.get("fps") or 0,
+            "duration": video_info.get("duration") or probed_info.get("duration") or clip.get("duration") or 0,
+        })
+
+    try:
+        _update_index(mutate)
+    except Exception as e:
+        print(f"[Media Library] [WARN] No se pudo registrar el clip '{clip_key}': {e}")
+
+
+def mark_clip_used(clip_key: str, project_id: str):
+    """Registra que el proyecto usa el clip (solo Redis: no descarga ni sube el índice)."""
+    try:
+        _record_clip_use(clip_key, project_id)
+    except Exception as e:
+        print(f"[Media Library] [WARN] No se pudo actualizar el uso del clip '{clip_key}': {e}")
+
+
+def _tfidf_vectors(documents: Dict[str, List[str]], query_tokens: List[str]) -> Tuple[Dict[str, Dict[str, float]], Dict[str, float]]:
+    document_frequency = Counter()
+    for tokens in documents.values():
+        document_frequency.update(set(tokens))
+    total_documents = len(documents) + 1
+
+    def vectorize(tokens: List[str]) -> Dict[str, float]:
+        counts = Counter(tokens)
+        vector = {term: (1 + math.log(count)) * math.log(total_documents / (1 + document_frequency[term])) + 1e-6
+                  for term, count in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {term: v / norm for term, v in vector.items()}
+
+    return {key: vectorize(tokens) for key, tokens in documents.items()}, vectorize(query_tokens)
+
+
+def should_search_fresh(keywords: str, project_id: str) -> bool:
+    """Regla de frescura: una fracción fija (y reproducible) de búsquedas va a Pexels de todos modos."""
+    ratio = MEDIA_LIBRARY.get("fresh_search_ratio", 0)
+    if ratio <= 0:
+        return False
+    bucket = int(hashlib.sha1(f"{project_id}|{keywords}".encode("utf-8")).hexdigest()[:8], 16) % 1000
+    return bucket < ratio * 1000
+
+
+def find_library_clip(
+    keywords: str,
+    project_id: str,
+    target_resolution: Tuple[int, int] = (1920, 1080),
+    min_duration_s: Optional[float] = None,
+    exclude_keys: Optional[Set[str]] = None,
+    apply_variety_rules: bool = True
+) -> Optional[str]:
+    """
+    Busca en la biblioteca el clip más parecido a las keywords (TF-IDF sobre keywords y tags de
+    Pexels) que sirva para la resolución/orientación destino. Devuelve su clave o None.
+    """
+    if not MEDIA_LIBRARY.get("enabled", True):
+        return None
+    query_tokens = tokenize(keywords)
+    if not query_tokens:
+        return None
+    index = _load_index()
+    clips = index.get("clips", {})
+    if not clips:
+        return None
+
+    target_w, target_h = target_resolution
+    wants_portrait = target_h > target_w
+    now = time.time()
+    exclude_keys = exclude_keys or set()
+    documents = {key: tokenize(" ".join(clip.get("keywords", []) + clip.get("tags", []))) for key, clip in clips.items()}
+    vectors, query_vector = _tfidf_vectors(documents, query_tokens)
+    usage = _clip_usage(clips)
+
+    best_key, best_rank = None, None
+    for clip_key, clip in clips.items():
+        if clip_key in exclude_keys:
+            continue
+        width, height = clip.get("width") or 0, clip.get("height") or 0
+        if width and height:
+            if (height > width) != wants_portrait or width < target_w or height < target_h:
+                continue
+        if apply_variety_rules:
+            if usage[clip_key]["use_count"] >= MEDIA_LIBRARY.get("max_uses_per_clip", 20):
+                continue
+            if usage[clip_key]["last_used_project"] != project_id and now - usage[clip_key]["last_used_at"] < MEDIA_LIBRARY.get("reuse_cooldown_s", 0):
+                continue
+        similarity = sum(weight * vectors[clip_key].get(term, 0.0) for term, weight in query_vector.items())
+        if similarity < MEDIA_LIBRARY.get("min_similarity", 0.35):
+            continue
+        long_enough = not min_duration_s or (clip.get("duration") or 0) >= min_duration_s
+        # Más parecido primero; a igualdad, el que alcanza la duración de la escena y el menos usado
+        rank = (round(similarity, 3), long_enough, -usage[clip_key]["use_count"], clip_key)
+        if best_rank is None or rank > best_rank:
+            best_key, best_rank = clip_key, rank
+
+    if best_key is None or not storage_service.get_storage().exists(best_key):
+        return None
+    print(f"[Media Library] Coincidencia para '{keywords}': {best_key} (similitud {best_rank[0]:.2f})")
+    return best_key
+
+
+def library_clip_keys() -> Set[str]:
+    """Claves de todos los clips indexados (incluye clips antiguos que siguen en outputs/temp_assets)."""
+    return set(_load_index().get("clips", {}))
+
+
+def rebuild_index_from_manifests() -> int:
+    """
+    Indexa los videos de stock ya descargados por proyectos anteriores (outputs/temp_assets)
+    usando las keywords de escena de sus manifiestos. Devuelve cuántos clips se registraron.
+    """
+    from app.services import script_manifest_service, ffmpeg_utils
+    storage = storage_service.get_storage()
+    project_ids = sorted({key.split("/")[2] for key in storage.list_keys("outputs/scripts/")
+                          if key.endswith(script_manifest_service.MANIFEST_FILENAME)})
+    registered = 0
+    for project_id in project_ids:
+        manifest = script_manifest_service.open_project_manifest(project_id)
+        if manifest is None:
+            continue
+        for scene in manifest.scenes:
+            clip_key = scene.get("visual_asset_url")
+            if scene.get("visual_type") != "static_video" or not clip_key or not scene.get("keywords"):
+                continue
+            clip_path = storage.ensure_local(clip_key)
+            if not clip_path:
+                continue
+            register_clip(clip_key, scene["keywords"], project_id, probed_info=ffmpeg_utils.probe_video_info(clip_path))
+            registered += 1
+    return registered
+
+
+# Indexar clips existentes: python -m app.services.media_library_service
+if __name__ == "__main__":
+    print(f"Clips registrados en la biblioteca: {rebuild_index_from_manifests()}")
@@ -0,0 +1,201 @@
+# app/services/profiling_service.py
+import contextvars
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services import storage_service
+
+# Perfilado opcional por tarea (flag 'profile' en los requests).
+#   PROFILE_SAMPLE_INTERVAL_S: cada cuánto el muestreador toma las pilas de TODOS los hilos
+#                              (cProfile solo ve el hilo de la tarea; el muestreo ve también los pools)
+#   PROFILE_MAX_STACK_DEPTH:   profundidad máxima de pila que se guarda por muestra
+try:
+    from app.core.config import PROFILE_SAMPLE_INTERVAL_S, PROFILE_MAX_STACK_DEPTH
+except ImportError:
+    PROFILE_SAMPLE_INTERVAL_S = 0.01
+    PROFILE_MAX_STACK_DEPTH = 128
+
+PROFILES_PREFIX = "outputs/profiles"
+SLOWEST_FRAMES_REPORTED = 20
+
+# Perfilador de la tarea en curso (el render corre en el mismo hilo/contexto que la tarea)
+_active_profiler: contextvars.ContextVar[Optional["TaskProfiler"]] = contextvars.ContextVar("active_profiler", default=None)
+
+
+class _StackSampler(threading.Thread):
+    """Muestrea periódicamente las pilas de todos los hilos y las acumula en formato 'collapsed'."""
+
+    def __init__(self, interval_s: float):
+        super().__init__(name="profiling_sampler", daemon=True)
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval_s):
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None and len(names) < PROFILE_MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    names.append(f"{code.co_name}@{os.path.basename(code.co_filename)}:{code.co_firstlineno}")
+                    frame = frame.f_back
+                names.append(thread_names.get(thread_id, f"thread-{thread_id}").replace(" ", "_"))
+                # Formato de flamegraph.pl / speedscope: raíz primero, separada por ';'
+                self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=5)
+
+
+class TaskProfiler:
+    """
+    Perfila una tarea: cProfile sobre el hilo de la tarea, muestreo de pilas de todos los hilos
+    y tiempos por frame (wall/CPU) del render de MoviePy cuando el clip se instrumenta.
+    """
+
+    def __init__(self, project_id: str, task_label: str, task_id: Optional[str] = None):
+        self.project_id = project_id
+        self.task_label = task_label
+        self.task_id = task_id or "local"
+        self.frame_timings: List[List[float]] = [] # [t, compose_wall_ms, compose_cpu_ms, step_wall_ms]
+        self._profile = cProfile.Profile()
+        self._sampler = _StackSampler(PROFILE_SAMPLE_INTERVAL_S)
+        self._context_token = None
+        self._last_frame_start: Optional[float] = None
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.extra_stats: Dict[str, Any] = {} # Métricas de secciones instrumentadas (ej. el escritor de frames)
+
+    def __enter__(self):
+        self._context_token = _active_profiler.set(self)
+        self._wall_start, self._cpu_start = time.perf_counter(), time.process_time()
+        self._sampler.start()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profile.disable()
+        self._sampler.stop()
+        self.wall_s = time.perf_counter() - self._wall_start
+        self.cpu_s = time.process_time() - self._cpu_start
+        _active_profiler.reset(self._context_token)
+        return False
+
+    def record_frame(self, t: float, compose_wall_s: float, compose_cpu_s: float, frame_start: float):
+        # step = desde el inicio del frame anterior: composición + escritura al pipe de ffmpeg
+        step_wall_s = frame_start - self._last_frame_start if self._last_frame_start is not None else compose_wall_s
+        self._last_frame_start = frame_start
+        self.frame_timings.append([round(t, 4), round(compose_wall_s * 1000, 3), round(compose_cpu_s * 1000, 3), round(step_wall_s * 1000, 3)])
+
+    def frame_summary(self) -> Dict[str, Any]:
+        if not self.frame_timings:
+            return {"frames": 0}
+
+        def percentiles(values: List[float]) -> Dict[str, float]:
+            ordered = sorted(values)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return {"mean_ms": round(sum(ordered) / len(ordered), 3), "p50_ms": pick(0.50),
+                    "p95_ms": pick(0.95), "max_ms": ordered[-1]}
+
+        step_total_s = sum(row[3] for row in self.frame_timings) / 1000
+        return {
+            "frames": len(self.frame_timings),
+            "render_fps": round(len(self.frame_timings) / step_total_s, 2) if step_total_s else None,
+            "compose_wall": percentiles([row[1] for row in self.frame_timings]),
+            "compose_cpu": percentiles([row[2] for row in self.frame_timings]),
+            "step_wall": percentiles([row[3] for row in self.frame_timings]),
+            "slowest_frames": sorted(self.frame_timings, key=lambda row: row[1], reverse=True)[:SLOWEST_FRAMES_REPORTED],
+        }
+
+    def save_artifacts(self) -> Optional[Dict[str, Any]]:
+        """Guarda pstats, pilas 'collapsed' y tiempos por frame junto a las salidas del proyecto."""
+        storage = storage_service.get_storage()
+        base_name = f"{self.task_label}_{self.task_id}"
+        keys = {
+            "pstats": storage_service.storage_key(PROFILES_PREFIX, self.project_id, f"{base_name}.pstats"),
+            "collapsed_stacks": storage_service.storage_key(PROFILES_PREFIX, self.project_id, f"{base_name}.collapsed.txt"),
+            "frame_timings": storage_service.storage_key(PROFILES_PREFIX, self.project_id, f"{base_name}.frames.json"),
+        }
+        try:
+            self._profile.dump_stats(storage.local_path(keys["pstats"]))
+            with open(storage.local_path(keys["collapsed_stacks"]), "w", encoding="utf-8") as f:
+                for stack, count in self._sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            summary = self.frame_summary()
+            with open(storage.local_path(keys["frame_timings"]), "w", encoding="utf-8") as f:
+                json.dump({"summary": summary, "extra_stats": self.extra_stats, "columns": ["t", "compose_wall_ms", "compose_cpu_ms", "step_wall_ms"],
+                           "frames": self.frame_timings}, f)
+        except Exception as e:
+            print(f"[Profiling - {self.project_id}] Error al escribir los artefactos del perfil: {e}")
+            return None
+
+        artifacts = {"wall_s": round(self.wall_s, 3), "cpu_s": round(self.cpu_s, 3),
+                     "stack_samples": self._sampler.samples, "frames": {k: v for k, v in summary.items() if k != "slowest_frames"},
+                     **self.extra_stats}
+        for name, key in keys.items():
+            if not storage.save_file(key):
+                print(f"[Profiling - {self.project_id}] [WARN] No se pudo guardar '{key}' en el almacenamiento ({storage.name}).")
+                continue
+            artifacts[f"{name}_key"] = key
+            artifacts[f"{name}_url"] = storage.presigned_url(key)
+        print(f"[Profiling - {self.project_id}] Perfil guardado en {PROFILES_PREFIX}/{self.project_id}/{base_name}.* "
+              f"(wall {self.wall_s:.1f}s, CPU {self.cpu_s:.1f}s, {len(self.frame_timings)} frames)")
+        return artifacts
+
+
+def instrument_frames(clip):
+    """
+    Si hay un perfil activo, envuelve la función de frames del clip para medir el tiempo
+    (wall y CPU del hilo) de componer cada frame. Sin perfil activo devuelve el clip intacto.
+    Sirve tanto para write_videofile como para iter_frames.
+    """
+    profiler = _active_profiler.get()
+    if profiler is None or clip is None:
+        return clip
+    attribute = "frame_function" if hasattr(clip, "frame_function") else "make_frame" # MoviePy 2 / 1.x
+    original_frame_function = getattr(clip, attribute)
+
+    def timed_frame_function(t):
+        frame_start, cpu_start = time.perf_counter(), time.thread_time()
+        frame = original_frame_function(t)
+        profiler.record_frame(t, time.perf_counter() - frame_start, time.thread_time() - cpu_start, frame_start)
+        return frame
+
+    setattr(clip, attribute, timed_frame_function)
+    return clip
+
+
+def record_stats(section: str, stats: Dict[str, Any]):
+    """Adjunta métricas de una sección (ej. 'frame_writer') al perfil activo, si lo hay."""
+    profiler = _active_profiler.get()
+    if profiler is not None:
+        profiler.extra_stats[section] = dict(stats)
+
+
+def call_profiled(enabled: bool, project_id: str, task_label: str, task_id: Optional[str], func: Callable, *args, **kwargs):
+    """
+    Ejecuta func(*args, **kwargs); con enabled, bajo un TaskProfiler. Si el resultado es un dict,
+    le agrega 'profile' con las claves/URLs de los artefactos (así aparecen en /status/{task_id}).
+    """
+    if not enabled:
+        return func(*args, **kwargs)
+    profiler = TaskProfiler(project_id, task_label, task_id)
+    with profiler:
+        result = func(*args, **kwargs)
+    artifacts = profiler.save_artifacts()
+    if isinstance(result, dict) and artifacts:
+        result["profile"] = artifacts
+    return result
@@ -0,0 +1,275 @@
+# app/services/rate_limiter_service.py
+import math
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.redis_client import get_redis_client
+
+# Límites por proveedor externo, compartidos por TODOS los workers (token bucket en Redis).
+#   rate_per_s:    tokens que se reponen por segundo (ritmo sostenido)
+#   burst:         capacidad del bucket (ráfaga máxima)
+#   max_retries:   reintentos ante un 429 antes de propagar el error
+#   base_backoff_s / max_backoff_s: backoff exponencial cuando el 429 no trae cabeceras útiles
+#   max_wait_s:    espera máxima por un token antes de rendirse
+try:
+    from app.core.config import PROVIDER_RATE_LIMITS
+except ImportError:
+    PROVIDER_RATE_LIMITS = {
+        "openai": {"rate_per_s": 5.0, "burst": 10, "max_retries": 6, "base_backoff_s": 2.0, "max_backoff_s": 60.0, "max_wait_s": 300.0},
+        "google_tts": {"rate_per_s": 10.0, "burst": 20, "max_retries": 6, "base_backoff_s": 1.0, "max_backoff_s": 60.0, "max_wait_s": 300.0},
+        # Pexels: 200 peticiones/hora por defecto (solo cuenta la búsqueda, no la descarga del CDN)
+        "pexels": {"rate_per_s": 200 / 3600.0, "burst": 20, "max_retries": 3, "base_backoff_s": 5.0, "max_backoff_s": 120.0, "max_wait_s": 600.0},
+        # Reddit OAuth: 100 peticiones/minuto; se cuenta cada petición HTTP de PRAW (ver scraping_service)
+        "reddit": {"rate_per_s": 1.5, "burst": 10, "max_retries": 4, "base_backoff_s": 5.0, "max_backoff_s": 120.0, "max_wait_s": 120.0},
+    }
+
+_DEFAULT_LIMITS = {"rate_per_s": 1.0, "burst": 5, "max_retries": 3, "base_backoff_s": 2.0, "max_backoff_s": 60.0, "max_wait_s": 120.0}
+_KEY_PREFIX = "ratelimit"
+
+# Token bucket atómico. Usa el reloj de Redis (TIME) para que todos los workers compartan la misma hora.
+# KEYS[1]: hash del bucket (tokens, ts)  KEYS[2]: "bloqueado hasta" (ms) fijado por un 429 / cabeceras
+# ARGV: rate_per_s, capacidad, tokens pedidos. Devuelve 0 si se concedieron, o los ms a esperar.
+_TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local blocked_until = tonumber(redis.call('GET', KEYS[2]) or '0')
+if blocked_until > now then
+  return blocked_until - now
+end
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000.0)
+if tokens < requested then
+  return math.ceil((requested - tokens) * 1000.0 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - requested), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000.0 / rate) + 60000)
+return 0
+"""
+
+# Extiende (nunca acorta) el bloqueo del proveedor. ARGV[1]: ms de bloqueo desde ahora.
+_BLOCK_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local block_ms = tonumber(ARGV[1])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if now + block_ms > current then
+  redis.call('SET', KEYS[1], now + block_ms, 'PX', block_ms)
+end
+return block_ms
+"""
+
+_scripts: Dict[str, Any] = {}
+_scripts_lock = threading.Lock()
+
+
+class RateLimitWaitTimeout(Exception):
+    """No se obtuvo un token del proveedor dentro de su max_wait_s."""
+
+
+def _limits(provider: str) -> Dict[str, Any]:
+    return {**_DEFAULT_LIMITS, **PROVIDER_RATE_LIMITS.get(provider, {})}
+
+
+def _script(name: str, source: str):
+    if name not in _scripts:
+        with _scripts_lock:
+            if name not in _scripts:
+                _scripts[name] = get_redis_client().register_script(source)
+    return _scripts[name]
+
+
+def _record_metrics(provider: str, waited_ms: float, rate_limited: bool = False):
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        key = f"{_KEY_PREFIX}:metrics:{provider}"
+        if rate_limited:
+            pipe.hincrby(key, "rate_limited_responses", 1)
+        else:
+            pipe.hincrby(key, "acquisitions", 1)
+            if waited_ms > 0:
+                pipe.hincrby(key, "waits", 1)
+                pipe.hincrbyfloat(key, "wait_ms_total", round(waited_ms, 1))
+        pipe.execute()
+    except Exception as e:
+        print(f"[Rate Limiter] [WARN] No se pudieron registrar métricas de '{provider}': {e}")
+
+
+def acquire(provider: str, tokens: int = 1) -> float:
+    """
+    Bloquea hasta obtener 'tokens' del bucket compartido del proveedor. Devuelve los ms esperados.
+    Con tokens=0 solo espera a que termine una pausa del proveedor (los tokens se toman en otro lado).
+    Si Redis no responde, deja pasar la llamada (mejor sin coordinación que sin video).
+    """
+    limits = _limits(provider)
+    tokens = min(tokens, limits["burst"]) # Una petición mayor que el bucket nunca se concedería
+    started = time.monotonic()
+    while True:
+        try:
+            wait_ms = int(_script("bucket", _TOKEN_BUCKET_LUA)(
+                keys=[f"{_KEY_PREFIX}:bucket:{provider}", f"{_KEY_PREFIX}:blocked:{provider}"],
+                args=[limits["rate_per_s"], limits["burst"], tokens],
+            ))
+        except Exception as e:
+            print(f"[Rate Limiter] [WARN] Redis no disponible para '{provider}', se continúa sin límite: {e}")
+            return 0.0
+        waited_s = time.monotonic() - started
+        if wait_ms <= 0:
+            if tokens > 0:
+                _record_metrics(provider, waited_s * 1000)
+            return waited_s * 1000
+        if waited_s + wait_ms / 1000.0 > limits["max_wait_s"]:
+            _record_metrics(provider, waited_s * 1000)
+            raise RateLimitWaitTimeout(f"'{provider}' no concedió {tokens} token(s) en {limits['max_wait_s']}s.")
+        # Pequeño jitter para que los workers que esperan no despierten todos a la vez
+        time.sleep(min(wait_ms / 1000.0, 5.0) * random.uniform(1.0, 1.2))
+
+
+def block_provider(provider: str, seconds: float):
+    """Pausa el proveedor para todos los workers durante 'seconds' (ej. tras un 429)."""
+    block_ms = max(1, int(math.ceil(seconds * 1000)))
+    try:
+        _script("block", _BLOCK_LUA)(keys=[f"{_KEY_PREFIX}:blocked:{provider}"], args=[block_ms])
+    except Exception as e:
+        print(f"[Rate Limiter] [WARN] No se pudo registrar el bloqueo de '{provider}': {e}")
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+
+def _parse_seconds(value: Optional[str]) -> Optional[float]:
+    """Interpreta '12', '1.5', '6m0s', '20ms' o una fecha HTTP / epoch como segundos desde ahora."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        number = float(value)
+        # Pexels manda el reset como epoch UNIX; Reddit y Retry-After, como segundos restantes
+        return max(0.0, number - time.time()) if number > 1e9 else max(0.0, number)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        factors = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+        return sum(float(amount) * factors[unit] for amount, unit in parts)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalize_headers(headers: Any) -> Dict[str, str]:
+    if not headers:
+        return {}
+    try:
+        return {str(k).lower(): v for k, v in headers.items()}
+    except AttributeError:
+        return {}
+
+
+def backoff_from_headers(headers: Any) -> Optional[float]:
+    """
+    Segundos que hay que esperar según las cabeceras de la respuesta (Retry-After, o
+    remaining=0 + reset de OpenAI / Pexels / Reddit). None si no indican nada.
+    """
+    headers = _normalize_headers(headers)
+    retry_after = _parse_seconds(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    for remaining_name, reset_name in (
+        ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"), # OpenAI
+        ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"), # OpenAI (tokens por minuto)
+        ("x-ratelimit-remaining", "x-ratelimit-reset"), # Pexels / Reddit
+    ):
+        try:
+            remaining = float(headers.get(remaining_name, "nan"))
+        except (TypeError, ValueError):
+            continue
+        if remaining < 1:
+            reset_s = _parse_seconds(headers.get(reset_name))
+            if reset_s:
+                return reset_s
+    return None
+
+
+def update_from_headers(provider: str, headers: Any):
+    """Con una respuesta exitosa: si el proveedor avisa que se agotó la cuota, pausa a todos hasta el reset."""
+    wait_s = backoff_from_headers(headers)
+    if wait_s:
+        print(f"[Rate Limiter] '{provider}' indica cuota agotada; pausando {wait_s:.1f}s para todos los workers.")
+        block_provider(provider, wait_s)
+
+
+def _rate_limit_info(error: Exception) -> Tuple[bool, Any]:
+    """Detecta un 429 en las excepciones de requests, prawcore, OpenAI y google-api-core."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    code = getattr(error, "code", None)
+    if status is None and isinstance(code, int):
+        status = code # google.api_core.exceptions.ResourceExhausted.code == 429
+    if status != 429:
+        return False, None
+    if code == "insufficient_quota": # OpenAI: sin saldo, reintentar no sirve
+        return False, None
+    return True, getattr(response, "headers", None)
+
+
+def call_with_rate_limit(provider: str, func: Callable[..., Any], *args, tokens: int = 1, **kwargs) -> Any:
+    """
+    Ejecuta func(*args, **kwargs) respetando el límite compartido del proveedor. Ante un 429
+    pausa al proveedor para todos los workers (según Retry-After / reset, o backoff exponencial)
+    y reintenta; cualquier otro error se propaga tal cual.
+    """
+    limits = _limits(provider)
+    for attempt in range(limits["max_retries"] + 1):
+        acquire(provider, tokens)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            is_rate_limited, headers = _rate_limit_info(e)
+            if not is_rate_limited:
+                raise
+            _record_metrics(provider, 0, rate_limited=True)
+            if attempt >= limits["max_retries"]:
+                print(f"[Rate Limiter] '{provider}' sigue respondiendo 429 tras {attempt} reintentos.")
+                raise
+            delay_s = backoff_from_headers(headers)
+            if delay_s is None:
+                delay_s = min(limits["max_backoff_s"], limits["base_backoff_s"] * (2 ** attempt)) * random.uniform(0.8, 1.2)
+            print(f"[Rate Limiter] 429 de '{provider}' (intento {attempt + 1}); pausando {delay_s:.1f}s y reintentando.")
+            block_provider(provider, delay_s)
+            continue
+        update_from_headers(provider, getattr(result, "headers", None))
+        return result
+
+
+def get_rate_limit_metrics() -> Dict[str, Dict[str, float]]:
+    """Métricas acumuladas por proveedor: adquisiciones, esperas, ms esperados y 429 recibidos."""
+    client = get_redis_client()
+    metrics = {}
+    for provider in PROVIDER_RATE_LIMITS:
+        raw = client.hgetall(f"{_KEY_PREFIX}:metrics:{provider}")
+        acquisitions = int(raw.get("acquisitions", 0))
+        wait_ms_total = float(raw.get("wait_ms_total", 0))
+        metrics[provider] = {
+            "acquisitions": acquisitions,
+            "waits": int(raw.get("waits", 0)),
+            "wait_ms_total": wait_ms_total,
+            "avg_wait_ms": round(wait_ms_total / acquisitions, 1) if acquisitions else 0.0,
+            "rate_limited_responses": int(raw.get("rate_limited_responses", 0)),
+        }
+    return metrics
+
+
+# Ver métricas: python -m app.services.rate_limiter_service
+if __name__ == "__main__":
+    for provider_name, provider_metrics in get_rate_limit_metrics().items():
+        print(f"{provider_name:<12} {provider_metrics}")
@@ -0,0 +1,102 @@
+# app/services/render_cost_service.py
+from typing import Any, Dict, List, Optional
+
+from app.core.redis_client import get_redis_client
+from app.services import script_manifest_service
+
+# Modelo de costo del render (segundos de worker). Se estima solo con el header del manifiesto:
+#   fixed_s:               arranque del render, audio temporal, pegado de intro/outro
+#   per_scene_s:           abrir el fondo de cada escena y preparar sus subtítulos
+#   compose_s_per_s:       segundos de composición por segundo de video, según el fondo de la escena
+#   still_frame_s_per_s:   escenas con imagen fija en el camino rápido de ffmpeg (sin componer frames)
+#   encode_s_per_s_1080p:  segundos de codificación por segundo de video y por salida de 1920x1080
+# Las estimaciones se corrigen con la razón real/estimado observada en los renders anteriores.
+try:
+    from app.core.config import RENDER_COST_MODEL
+except ImportError:
+    RENDER_COST_MODEL = {
+        "fixed_s": 15.0,
+        "per_scene_s": 2.0,
+        "compose_s_per_s": {"static_video": 0.9, "static_image": 0.25, "default": 0.25},
+        "still_frame_s_per_s": 0.08,
+        "encode_s_per_s_1080p": 0.6,
+    }
+
+_CALIBRATION_KEY = "rendercost:actual_over_estimate"
+_CALIBRATION_ALPHA = 0.2 # Peso de cada render nuevo en la media móvil de la corrección
+_CALIBRATION_BOUNDS = (0.25, 4.0)
+_REFERENCE_PIXELS = 1920 * 1080
+
+
+def _output_pixel_ratio(output_profiles: Optional[List[str]]) -> float:
+    """Suma de píxeles de las salidas relativa a una salida 1080p (el modo simple renderiza 1920x1080)."""
+    if not output_profiles:
+        return 1.0
+    from app.services.video_assembly_service import OUTPUT_PROFILES # Import local: solo lee la tabla de perfiles
+    ratio = 0.0
+    for name in output_profiles:
+        width, height = OUTPUT_PROFILES.get(name, {}).get("resolution", (1920, 1080))
+        ratio += (width * height) / _REFERENCE_PIXELS
+    return ratio
+
+
+def get_calibration_ratio() -> float:
+    try:
+        value = get_redis_client().get(_CALIBRATION_KEY)
+        return float(value) if value else 1.0
+    except Exception:
+        return 1.0
+
+
+def record_actual_cost(estimated_s: float, actual_s: float):
+    """Actualiza la media móvil de real/estimado con un render terminado."""
+    if estimated_s <= 0 or actual_s <= 0:
+        return
+    low, high = _CALIBRATION_BOUNDS
+    sample = min(high, max(low, actual_s / estimated_s))
+    try:
+        client = get_redis_client()
+        current = client.get(_CALIBRATION_KEY)
+        updated = sample if current is None else (1 - _CALIBRATION_ALPHA) * float(current) + _CALIBRATION_ALPHA * sample
+        client.set(_CALIBRATION_KEY, round(updated, 4))
+    except Exception as e:
+        print(f"[Render Cost] [WARN] No se pudo actualizar la calibración del costo: {e}")
+
+
+def estimate_render_cost(project_id: str, output_profiles: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Estima el costo del ensamblaje del proyecto a partir del header del manifiesto (duración
+    narrada, escenas y tipo de fondo) y de las salidas pedidas. Devuelve None si no hay manifiesto.
+    """
+    manifest = script_manifest_service.open_project_manifest(project_id)
+    if manifest is None:
+        return None
+    model = RENDER_COST_MODEL
+    compose_factors = model["compose_s_per_s"]
+    scenes = [scene for scene in manifest.scenes if scene.get("duration_ms", 0) > 0]
+    narration_s = sum(scene["duration_ms"] for scene in scenes) / 1000.0
+    video_scenes = sum(1 for scene in scenes if scene.get("visual_type") == "static_video")
+    # Mismo criterio que el render: el camino rápido solo existe en el modo de una salida
+    from app.services.video_assembly_service import use_still_frame_path # Import local: no carga MoviePy
+    still_frame_path = not output_profiles and use_still_frame_path(manifest)
+
+    render_s = 0.0
+    for scene in scenes:
+        scene_s = scene["duration_ms"] / 1000.0
+        if still_frame_path and scene.get("visual_type") == "static_image":
+            render_s += scene_s * model["still_frame_s_per_s"]
+        else: # Escena compuesta frame a frame (con el compositor) y codificada
+            render_s += scene_s * (compose_factors.get(scene.get("visual_type"), compose_factors["default"])
+                                   + model["encode_s_per_s_1080p"] * _output_pixel_ratio(output_profiles))
+    raw_estimate_s = model["fixed_s"] + model["per_scene_s"] * len(scenes) + render_s
+    calibration = get_calibration_ratio()
+    return {
+        "estimated_cost_s": round(raw_estimate_s * calibration, 1),
+        "raw_estimate_s": round(raw_estimate_s, 1),
+        "calibration": calibration,
+        "narration_s": round(narration_s, 1),
+        "scenes": len(scenes),
+        "video_scenes": video_scenes,
+        "still_frame_fast_path": still_frame_path,
+        "outputs": len(output_profiles) if output_profiles else 1,
+    }
@@ -0,0 +1,277 @@
+# app/services/retention_service.py
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.core.redis_client import get_redis_client
+from app.services import storage_service
+
+# Ciclo de vida de las salidas por proyecto (tarea periódica de Celery beat).
+#   intermediate_grace_s:   tras confirmar el video final, cuánto se conservan audios por segmento,
+#                           videos de stock propios y temporales (permite re-renderizar sin regenerar)
+#   min_idle_s:             nunca se toca un proyecto accedido hace menos de esto
+#   quota_bytes:            tope global de los artefactos de proyectos (no cuenta la biblioteca ni la cache)
+#   quota_low_watermark:    al pasar la cuota se libera espacio hasta esta fracción de la cuota
+#   evict_whole_projects:   si liberar intermedios no alcanza, borrar proyectos completos (LRU)
+#   dry_run:                solo reportar lo que se borraría
+try:
+    from app.core.config import RETENTION_POLICY
+except ImportError:
+    RETENTION_POLICY = {
+        "intermediate_grace_s": 24 * 3600,
+        "min_idle_s": 3600,
+        "quota_bytes": 100 * 1024 ** 3,
+        "quota_low_watermark": 0.8,
+        "evict_whole_projects": True,
+        "dry_run": False,
+    }
+
+# Prefijos con artefactos por proyecto: <prefijo>/<project_id>/...
+PROJECT_PREFIXES = {
+    "scripts": "outputs/scripts",
+    "audio": "outputs/audio",
+    "stock": "outputs/temp_assets",
+    "videos": "outputs/videos",
+    "subtitles": "outputs/subtitles",
+    "profiles": "outputs/profiles",
+}
+# Categorías que solo sirven para producir el video final
+INTERMEDIATE_CATEGORIES = ("audio", "stock")
+
+_KEY_PREFIX = "retention"
+_LRU_KEY = f"{_KEY_PREFIX}:lru" # zset project_id -> último acceso (epoch)
+_LAST_REPORT_KEY = f"{_KEY_PREFIX}:last_report"
+
+
+def _project_key(project_id: str) -> str:
+    return f"{_KEY_PREFIX}:project:{project_id}"
+
+
+def touch_project(project_id: str):
+    """Marca el proyecto como usado ahora (solo actualiza el orden LRU; no recorre archivos)."""
+    try:
+        get_redis_client().zadd(_LRU_KEY, {project_id: time.time()})
+    except Exception as e:
+        print(f"[Retention] [WARN] No se pudo registrar el acceso al proyecto {project_id}: {e}")
+
+
+def _project_files(project_id: str) -> Dict[str, Dict[str, Any]]:
+    """{categoría: {clave: (bytes, mtime)}} de los artefactos del proyecto."""
+    storage = storage_service.get_storage()
+    return {category: storage.key_stats(storage_service.storage_key(prefix, project_id) + "/")
+            for category, prefix in PROJECT_PREFIXES.items()}
+
+
+def track_project(project_id: str, last_access: Optional[float] = None, touch: bool = True) -> Dict[str, int]:
+    """
+    Recalcula los tamaños por categoría del proyecto y, si touch, actualiza su último acceso.
+    El último acceso solo avanza (ZADD GT): un valor viejo nunca pisa un touch_project más reciente.
+    """
+    sizes = {category: sum(size for size, _ in files.values()) for category, files in _project_files(project_id).items()}
+    try:
+        client = get_redis_client()
+        client.hset(_project_key(project_id), mapping={"sizes": json.dumps(sizes), "bytes": sum(sizes.values())})
+        if touch:
+            client.zadd(_LRU_KEY, {project_id: last_access or time.time()}, gt=True)
+    except Exception as e:
+        print(f"[Retention] [WARN] No se pudo registrar el tamaño del proyecto {project_id}: {e}")
+    return sizes
+
+
+def confirm_final_video(project_id: str, final_keys: List[str]) -> bool:
+    """
+    Registra los videos finales del proyecto si existen y no están vacíos. Solo los proyectos con
+    video final confirmado pierden sus intermedios (y los finales nunca cuentan como intermedios).
+    """
+    stats = _project_files(project_id)["videos"]
+    if not final_keys or any(stats.get(key, (0, 0))[0] <= 0 for key in final_keys):
+        print(f"[Retention - {project_id}] [WARN] Video final no confirmado (falta o está vacío): {final_keys}")
+        return False
+    try:
+        client = get_redis_client()
+        # Los finales de renders anteriores (ej. otros perfiles de salida) se conservan mientras existan
+        previous_keys = json.loads(client.hget(_project_key(project_id), "final_keys") or "[]")
+        kept_keys = set(final_keys) | {key for key in previous_keys if key in stats}
+        client.hset(_project_key(project_id), mapping={
+            "final_keys": json.dumps(sorted(kept_keys)), "final_confirmed_at": time.time()})
+    except Exception as e:
+        print(f"[Retention - {project_id}] [WARN] No se pudo registrar el video final: {e}")
+        return False
+    track_project(project_id)
+    return True
+
+
+def _intermediate_keys(project_id: str, final_keys: Set[str], protected_keys: Set[str]) -> Dict[str, int]:
+    """{clave: bytes} de los intermedios: audios, stock propio y todo lo de videos/ que no es final."""
+    files = _project_files(project_id)
+    intermediates = {}
+    for category in INTERMEDIATE_CATEGORIES + ("videos",):
+        for key, (size, _) in files[category].items():
+            if category == "videos" and key in final_keys:
+                continue
+            if key not in protected_keys:
+                intermediates[key] = size
+    return intermediates
+
+
+def _all_project_keys(project_id: str, protected_keys: Set[str]) -> Dict[str, int]:
+    return {key: size for files in _project_files(project_id).values()
+            for key, (size, _) in files.items() if key not in protected_keys}
+
+
+def _delete_keys(keys: List[str]) -> int:
+    storage = storage_service.get_storage()
+    deleted = 0
+    parent_dirs = set()
+    for key in keys:
+        try:
+            if storage.delete(key):
+                deleted += 1
+                parent_dirs.add(os.path.dirname(os.path.join(storage_service.APP_BASE_DIR, key)))
+        except Exception as e:
+            print(f"[Retention] [WARN] No se pudo borrar '{key}': {e}")
+    # Quitar directorios vacíos: con cientos de proyectos los recorridos de outputs/ se vuelven lentos
+    for directory in sorted(parent_dirs, key=len, reverse=True):
+        while directory.startswith(os.path.join(storage_service.APP_BASE_DIR, "outputs", "")):
+            try:
+                os.rmdir(directory)
+            except OSError: # No está vacío o ya no existe
+                break
+            directory = os.path.dirname(directory)
+    return deleted
+
+
+def run_gc(dry_run: Optional[bool] = None, is_busy: Optional[Callable[[str], bool]] = None) -> Dict[str, Any]:
+    """
+    1) Borra los intermedios de proyectos con video final confirmado hace más de intermediate_grace_s.
+    2) Si el total supera quota_bytes, libera en orden LRU (intermedios primero y, si la política lo
+       permite, proyectos completos) hasta quota_low_watermark. Devuelve el reporte de la pasada.
+    'is_busy(project_id)' permite saltar proyectos con trabajo en curso (ej. un ensamblaje).
+    El último acceso y el estado ocupado se vuelven a leer justo antes de cada borrado: la lista
+    inicial solo fija el orden de la pasada.
+    """
+    from app.services import media_library_service # Import local: el índice solo se lee al recolectar
+    policy = RETENTION_POLICY
+    dry_run = policy["dry_run"] if dry_run is None else dry_run
+    client = get_redis_client()
+    now = time.time()
+    protected_keys = media_library_service.library_clip_keys() # Clips antiguos indexados in situ en temp_assets
+
+    projects = []
+    for project_id, last_access in client.zrange(_LRU_KEY, 0, -1, withscores=True): # Más antiguo primero
+        info = client.hgetall(_project_key(project_id))
+        projects.append({
+            "project_id": project_id,
+            "last_access": last_access,
+            "bytes": int(info.get("bytes", 0)),
+            "final_keys": set(json.loads(info["final_keys"])) if info.get("final_keys") else set(),
+            "final_confirmed_at": float(info["final_confirmed_at"]) if info.get("final_confirmed_at") else None,
+        })
+    total_before = sum(project["bytes"] for project in projects)
+    report: Dict[str, Any] = {"dry_run": dry_run, "started_at": now, "tracked_projects": len(projects),
+                              "total_bytes_before": total_before, "quota_bytes": policy["quota_bytes"],
+                              "actions": [], "skipped_busy": []}
+    total = total_before
+
+    def evictable(project) -> bool:
+        last_access = client.zscore(_LRU_KEY, project["project_id"]) # Pudo tocarse durante la pasada
+        if last_access is None or time.time() - last_access < policy["min_idle_s"]:
+            return False
+        if is_busy is not None and is_busy(project["project_id"]):
+            report["skipped_busy"].append(project["project_id"])
+            return False
+        return True
+
+    def apply(project, action: str, keys: Dict[str, int]) -> int:
+        freed = sum(keys.values())
+        if dry_run and action == "evict_project":
+            freed -= project.get("freed", 0) # En dry-run los intermedios ya contados siguen en la lista
+        project["freed"] = project.get("freed", 0) + freed
+        report["actions"].append({"project_id": project["project_id"], "action": action, "files": len(keys), "bytes": freed})
+        print(f"[Retention] {'[DRY-RUN] ' if dry_run else ''}{action} {project['project_id']}: "
+              f"{len(keys)} archivos, {freed / 1024 ** 2:.1f} MB")
+        if not dry_run:
+            _delete_keys(list(keys))
+            if action == "evict_project":
+                client.delete(_project_key(project["project_id"]))
+                client.zrem(_LRU_KEY, project["project_id"])
+            else:
+                track_project(project["project_id"], touch=False) # Recolectar no es un acceso
+        project["intermediates_done"] = True
+        return freed
+
+    # 1) Intermedios de proyectos terminados
+    for project in projects:
+        confirmed_at = project["final_confirmed_at"]
+        if confirmed_at is None or now - confirmed_at < policy["intermediate_grace_s"]:
+            continue
+        keys = _intermediate_keys(project["project_id"], project["final_keys"], protected_keys)
+        if keys and evictable(project):
+            total -= apply(project, "delete_intermediates", keys)
+
+    # 2) Cuota global, en orden LRU
+    target = policy["quota_bytes"] * policy["quota_low_watermark"]
+    if total > policy["quota_bytes"]:
+        for project in projects:
+            if total <= target:
+                break
+            if project["final_confirmed_at"] is None or project.get("intermediates_done"):
+                continue
+            keys = _intermediate_keys(project["project_id"], project["final_keys"], protected_keys)
+            if keys and evictable(project):
+                total -= apply(project, "delete_intermediates", keys)
+        if policy["evict_whole_projects"]:
+            for project in projects:
+                if total <= target:
+                    break
+                if project["project_id"] in report["skipped_busy"]:
+                    continue
+                keys = _all_project_keys(project["project_id"], protected_keys)
+                if keys and evictable(project):
+                    total -= apply(project, "evict_project", keys)
+        if total > policy["quota_bytes"]:
+            print(f"[Retention] [WARN] Sigue sobre la cuota ({total / 1024 ** 3:.1f} GB): proyectos recientes, ocupados o clips de la biblioteca.")
+
+    report.update(total_bytes_after=total, freed_bytes=total_before - total, finished_at=time.time())
+    report["skipped_busy"] = sorted(set(report["skipped_busy"]))
+    try:
+        client.set(_LAST_REPORT_KEY, json.dumps(report))
+    except Exception as e:
+        print(f"[Retention] [WARN] No se pudo guardar el reporte: {e}")
+    print(f"[Retention] {'[DRY-RUN] ' if dry_run else ''}{len(report['actions'])} acciones, "
+          f"{report['freed_bytes'] / 1024 ** 3:.2f} GB liberados ({total / 1024 ** 3:.2f} GB en uso).")
+    return report
+
+
+def get_last_report() -> Optional[Dict[str, Any]]:
+    value = get_redis_client().get(_LAST_REPORT_KEY)
+    return json.loads(value) if value else None
+
+
+def rebuild_tracking() -> int:
+    """
+    Registra los proyectos ya existentes en outputs/ (anteriores a este servicio). El último
+    acceso inicial es la modificación más reciente de sus archivos. Devuelve cuántos se registraron.
+    """
+    storage = storage_service.get_storage()
+    project_ids = set()
+    for prefix in PROJECT_PREFIXES.values():
+        project_ids.update(key.split("/")[2] for key in storage.list_keys(prefix + "/") if key.count("/") >= 3)
+    for project_id in sorted(project_ids):
+        mtimes = [mtime for files in _project_files(project_id).values() for _, mtime in files.values()]
+        track_project(project_id, last_access=max(mtimes) if mtimes else None)
+    return len(project_ids)
+
+
+# Registrar proyectos existentes y ver qué se borraría:
+#   python -m app.services.retention_service --rebuild --dry-run
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Recolección de salidas de proyectos")
+    parser.add_argument("--rebuild", action="store_true", help="Registrar los proyectos existentes en outputs/")
+    parser.add_argument("--dry-run", action="store_true", help="Solo reportar lo que se borraría")
+    args = parser.parse_args()
+    if args.rebuild:
+        print(f"Proyectos registrados: {rebuild_tracking()}")
+    print(json.dumps(run_gc(dry_run=args.dry_run or None), indent=2))
@@ -1,31 +1,267 @@
 # app/services/script_generation_service.py
-import nltk
 from typing import List, Dict, Any, Optional
 import os
+import json
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 # Importar nuestros otros servicios
 from app.services import tts_service
 from app.services import ai_text_enhancer_service # Asumiendo que ya está creado y funciona
 from app.services import stock_media_service
+from app.services import media_library_service
+from app.services import storage_service
+from app.services import script_journal_service
+
+# Hilos del pipeline de generación: el enhancer procesa los bloques en orden (1 hilo, va hasta
+# ENHANCER_LOOKAHEAD_BLOCKS bloques por delante del TTS) y la búsqueda/descarga en Pexels corre en
+# segundo plano por escena. La ventana acotada evita pagar la IA por bloques que el presupuesto de
+# duración termina descartando.
+try:
+    from app.core.config import STOCK_PREFETCH_WORKERS
+except ImportError:
+    STOCK_PREFETCH_WORKERS = 3
+try:
+    from app.core.config import ENHANCER_LOOKAHEAD_BLOCKS
+except ImportError:
+    ENHANCER_LOOKAHEAD_BLOCKS = 1
+
+# Planificación por duración: estimamos la narración por caracteres con una tabla de calibración
+# (ms por carácter por voz y modo TTS) aprendida de los actual_tts_duration_ms de proyectos anteriores.
+try:
+    from app.core.config import DEFAULT_MS_PER_CHAR, SCENE_TRANSITION_BUDGET_MS, DURATION_BUDGET_TOLERANCE
+except ImportError:
+    DEFAULT_MS_PER_CHAR = 65.0 # ~15 caracteres/s, voz Wavenet en español a velocidad normal
+    SCENE_TRANSITION_BUDGET_MS = 1000 # Transición entre escenas que agrega el ensamblador
+    DURATION_BUDGET_TOLERANCE = 0.05 # Se acepta pasarse hasta un 5% del objetivo
+
+CALIBRATION_KEY = "outputs/calibration/tts_speaking_rate.json"
+CALIBRATION_VOICE_NAME = tts_service.GOOGLE_TTS_VOICE_NAME # Voz por defecto de tts_service
+CALIBRATION_MAX_CHARS = 200000 # Por encima, los totales se escalan para que pesen más los proyectos recientes
+
+
+def _calibration_entry_name(tts_mode: str, voice_name: str = CALIBRATION_VOICE_NAME) -> str:
+    # En modo SSML por bloque hay menos silencios entre frases, así que se calibra aparte
+    return f"{voice_name}|{tts_mode}"
+
+
+def load_speaking_rate_calibration() -> Dict[str, Dict[str, float]]:
+    storage = storage_service.get_storage()
+    calibration_path = storage.ensure_local(CALIBRATION_KEY, refresh=True) # La escriben todos los workers
+    if not calibration_path:
+        return {}
+    try:
+        with open(calibration_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[SCRIPT_GEN] [WARN] No se pudo leer la calibración de velocidad de habla: {e}")
+        return {}
+
+
+def get_ms_per_char(tts_mode: str = "sentence", calibration: Optional[Dict[str, Dict[str, float]]] = None,
+                    voice_name: str = CALIBRATION_VOICE_NAME) -> float:
+    calibration = load_speaking_rate_calibration() if calibration is None else calibration
+    entry = calibration.get(_calibration_entry_name(tts_mode, voice_name))
+    if entry and entry.get("total_chars"):
+        return entry["total_ms"] / entry["total_chars"]
+    return DEFAULT_MS_PER_CHAR
+
+
+def estimate_narration_ms(text: str, ms_per_char: float) -> int:
+    return int(len(text.strip()) * ms_per_char)
+
+
+def _accumulate_calibration_entry(entry: Dict[str, Any], segments: List[Dict[str, Any]]) -> bool:
+    """Suma los caracteres y duraciones reales de un proyecto a la entrada. False si no aporta datos."""
+    total_chars = sum(len((seg.get("text_chunk") or "").strip()) for seg in segments if seg.get("actual_tts_duration_ms"))
+    total_ms = sum(int(seg.get("actual_tts_duration_ms") or 0) for seg in segments)
+    if not total_chars or not total_ms:
+        return False
+    entry["total_chars"] += total_chars
+    entry["total_ms"] += total_ms
+    entry["projects"] += 1
+    if entry["total_chars"] > CALIBRATION_MAX_CHARS:
+        scale = CALIBRATION_MAX_CHARS / entry["total_chars"]
+        entry["total_chars"] = int(entry["total_chars"] * scale)
+        entry["total_ms"] = int(entry["total_ms"] * scale)
+    entry["ms_per_char"] = round(entry["total_ms"] / entry["total_chars"], 2)
+    entry["updated_at"] = time.time()
+    return True
+
+
+def _empty_calibration_entry() -> Dict[str, Any]:
+    return {"total_chars": 0, "total_ms": 0, "projects": 0}
+
+
+def _modify_calibration_entry(entry_name: str, modify) -> Optional[Dict[str, Any]]:
+    """
+    Lee, modifica y guarda la tabla compartida bajo un lock de Redis (varios workers la actualizan;
+    en S3 cada nodo tiene su copia). Sin el lock no se escribe: se perdería la actualización de otro.
+    modify(entry_actual_o_None) devuelve la entrada nueva, o None para no escribir.
+    """
+    try:
+        from app.core.redis_client import get_redis_client
+        redis_lock = get_redis_client().lock("calibration:tts_speaking_rate", timeout=30, blocking_timeout=10)
+        if not redis_lock.acquire():
+            print(f"[SCRIPT_GEN] [WARN] Calibración '{entry_name}' sin actualizar: no se obtuvo el lock.")
+            return None
+    except Exception as e:
+        print(f"[SCRIPT_GEN] [WARN] Calibración '{entry_name}' sin actualizar: sin lock de Redis ({e}).")
+        return None
+    storage = storage_service.get_storage()
+    calibration_path = storage.local_path(CALIBRATION_KEY)
+    tmp_path = f"{calibration_path}.{os.getpid()}.tmp"
+    try:
+        calibration = load_speaking_rate_calibration() # Revalidada: la última versión, aunque la haya escrito otro nodo
+        entry = modify(calibration.get(entry_name))
+        if entry is None:
+            return None
+        calibration[entry_name] = entry
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(calibration, f, indent=2)
+        os.replace(tmp_path, calibration_path)
+        storage.save_file(CALIBRATION_KEY)
+        print(f"[SCRIPT_GEN] Calibración '{entry_name}' actualizada: {entry['ms_per_char']} ms/carácter.")
+        return entry
+    except Exception as e:
+        print(f"[SCRIPT_GEN] [WARN] No se pudo guardar la calibración de velocidad de habla: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    finally:
+        try: redis_lock.release()
+        except Exception: pass
+
+
+def update_speaking_rate_calibration(segments: List[Dict[str, Any]], tts_mode: str = "sentence",
+                                     voice_name: str = CALIBRATION_VOICE_NAME):
+    """Acumula caracteres y duraciones reales de los segmentos generados en la tabla de calibración."""
+    def modify(entry):
+        entry = entry or _empty_calibration_entry()
+        return entry if _accumulate_calibration_entry(entry, segments) else None
+    _modify_calibration_entry(_calibration_entry_name(tts_mode, voice_name), modify)
+
+
+def _manifest_tts_info(manifest, segments: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Modo y voz TTS del proyecto. Los manifiestos anteriores no los guardan: se deducen de los audios."""
+    tts_info = manifest.header.get("tts")
+    if tts_info:
+        return tts_info
+    audio_names = [os.path.basename(seg.get("actual_tts_audio_url") or "") for seg in segments]
+    # En modo por bloque los audios se llaman block_NN (uno por escena); en modo por frase, segment_NNN
+    mode = "block_ssml" if any(name.startswith("block_") for name in audio_names) else "sentence"
+    voice_id = CALIBRATION_VOICE_NAME if all(name.endswith(".mp3") for name in audio_names if name) else None
+    return {"mode": mode, "voice_id": voice_id}
+
+
+def rebuild_speaking_rate_calibration_from_manifests(tts_mode: str = "sentence", tts_backend: Optional[str] = None) -> int:
+    """
+    Rehace desde cero la entrada del modo y la voz con todos los manifiestos existentes (en orden
+    de creación) y la escribe una vez. Devuelve cuántos proyectos se usaron.
+    """
+    backend = tts_service.get_tts_backend(tts_backend)
+    from app.services import script_manifest_service
+    storage = storage_service.get_storage()
+    project_ids = sorted({
+        key.split("/")[2] for key in storage.list_keys("outputs/scripts/")
+        if key.endswith(script_manifest_service.MANIFEST_FILENAME)
+    })
+    projects = []
+    for project_id in project_ids:
+        manifest = script_manifest_service.open_project_manifest(project_id)
+        if manifest is None:
+            continue
+        segments = manifest.load_all_segments()
+        tts_info = _manifest_tts_info(manifest, segments)
+        if tts_info.get("mode") == tts_mode and tts_info.get("voice_id") == backend.voice_id:
+            projects.append((manifest.header.get("created_at", 0), segments))
+
+    entry = _empty_calibration_entry()
+    used = sum(1 for _, segments in sorted(projects, key=lambda p: p[0]) if _accumulate_calibration_entry(entry, segments))
+    if used:
+        _modify_calibration_entry(_calibration_entry_name(tts_mode, backend.voice_id), lambda _: entry)
+    return used
+
+
+def fit_sentences_to_budget(sentences: List[str], budget_ms: float, ms_per_char: float) -> List[str]:
+    """Conserva las frases iniciales cuya narración estimada cabe en budget_ms."""
+    kept, used_ms = [], 0
+    for sentence in sentences:
+        sentence_ms = estimate_narration_ms(sentence, ms_per_char)
+        if used_ms + sentence_ms > budget_ms:
+            break
+        kept.append(sentence)
+        used_ms += sentence_ms
+    return kept
+
+
+def plan_text_blocks_for_duration(
+    text_blocks: List[Dict[str, Any]],
+    target_duration_s: float,
+    ms_per_char: float
+) -> List[Dict[str, Any]]:
+    """
+    Elige los bloques (título, selftext, comentarios) que caben en target_duration_s antes de
+    pagar IA, TTS o Pexels. El título siempre va; el selftext se recorta por frases si no cabe
+    entero; un comentario que no cabe entero se omite (uno cortado se entiende mal) y se prueba
+    con los siguientes.
+    """
+    budget_ms = target_duration_s * 1000 * (1 + DURATION_BUDGET_TOLERANCE)
+    planned_blocks, used_ms = [], 0
+    for block_info in text_blocks:
+        transition_ms = SCENE_TRANSITION_BUDGET_MS if planned_blocks else 0
+        block_ms = estimate_narration_ms(block_info["text"], ms_per_char)
+        remaining_ms = budget_ms - used_ms - transition_ms
+        if block_info["type"] == "title" or block_ms <= remaining_ms:
+            planned_blocks.append(block_info)
+            used_ms += transition_ms + block_ms
+            continue
+        if block_info["type"] == "selftext" and remaining_ms > 0:
+            kept_sentences = fit_sentences_to_budget(segment_text_into_sentences(block_info["text"]), remaining_ms, ms_per_char)
+            if kept_sentences:
+                truncated_text = " ".join(kept_sentences)
+                planned_blocks.append({**block_info, "text": truncated_text})
+                used_ms += transition_ms + estimate_narration_ms(truncated_text, ms_per_char)
+                print(f"  [SCRIPT_GEN] Selftext recortado a {len(kept_sentences)} frases para respetar la duración objetivo.")
+                continue
+        print(f"  [SCRIPT_GEN] Bloque '{block_info['type']}' ({block_ms / 1000:.1f}s estimados) omitido: no cabe en la duración objetivo.")
+    print(f"  [SCRIPT_GEN] Plan: {len(planned_blocks)}/{len(text_blocks)} bloques, ~{used_ms / 1000:.1f}s estimados "
+          f"(objetivo {target_duration_s:.0f}s, {ms_per_char:.1f} ms/carácter).")
+    return planned_blocks
 
 # (Tu función segment_text_into_sentences(...) permanece igual)
 def segment_text_into_sentences(text: str) -> List[str]:
     if not text: return []
     # Asegúrate que 'punkt' esté disponible como lo configuramos en Dockerfile
+    import nltk # Import local: NLTK es pesado y solo se usa aquí
     sentences = nltk.sent_tokenize(text, language='spanish') 
     return [s.strip() for s in sentences if s.strip()]
 
+def _block_source_tag(block_info: Dict[str, Any]) -> str:
+    if block_info["type"] == "comment":
+        return f"comment_{block_info['comment_idx']}"
+    return block_info["type"]
+
 def create_script_segments(
     reddit_data: Dict[str, Any], 
     project_id: str = "default_project",
     target_narration_language: str = "español",
     default_visual_type: str = "static_image",
-    default_visual_asset_url: str = "assets/images/default_background.jpg"
+    default_visual_asset_url: str = "assets/images/default_background.jpg",
+    tts_mode: str = "sentence", # "sentence": un request TTS por frase; "block_ssml": un request SSML con marks por bloque
+    tts_backend: Optional[str] = None, # "google" o "local" (motor en CPU para borradores); None = TTS_BACKEND_DEFAULT
+    target_duration_s: Optional[float] = None # Si se indica, se recortan bloques/frases ANTES de pagar TTS y Pexels
 ) -> List[Dict[str, Any]]:
     print(f"\n[SCRIPT_GEN - {project_id}] Iniciando para project_id: {project_id}")
     script_segments_for_json = []
     global_segment_counter = 0
+    tts_file_counter = 0 # Numeración de los audios por frase (no se reutiliza el nombre de una frase que falló)
+    backend = tts_service.get_tts_backend(tts_backend)
+    print(f"[SCRIPT_GEN - {project_id}] Motor TTS: {backend.name} ({backend.voice_id})")
+    # Si una ejecución anterior murió a medias, sus unidades terminadas se retoman del diario
+    journal = script_journal_service.open_journal(project_id)
 
     # --- Helper anidado ---
     def process_sentences_to_segments(
@@ -38,23 +274,54 @@ def create_script_segments(
         current_project_id: str
     ):
         nonlocal global_segment_counter
+        nonlocal tts_file_counter
         nonlocal script_segments_for_json
 
         if not sentences: # ... (sin cambios) ...
             return
 
         print(f"    [SCRIPT_GEN_HELPER - {current_project_id}] Procesando {len(sentences)} frases para '{source_type_tag}' con visual '{scene_visual_type}'. Keywords del bloque: '{block_keywords_str}'")
-        for i, sentence_chunk in enumerate(sentences):
-            global_segment_counter += 1
-            # ... (lógica de TTS, audio_filename, generated_path, duration_ms - sin cambios) ...
-            tts_type_subfolder = source_type_tag
-            audio_filename = f"segment_{global_segment_counter:03d}.mp3"
-            generated_path = tts_service.synthesize_text_to_audio_file(
-                text_to_speak=sentence_chunk, output_filename=audio_filename,
-                project_id=current_project_id, type_subfolder=tts_type_subfolder
+        tts_type_subfolder = source_type_tag
+        synthesized_sentences = [] # (frase, ruta_audio, offset_ms, duracion_ms)
+        sentence_file_start = tts_file_counter
+        if tts_mode != "block_ssml":
+            tts_file_counter += len(sentences)
+        tts_unit = script_journal_service.unit_id(source_type_tag, backend.name, backend.voice_id, tts_mode, sentences)
+        journaled_tts = journal.get("tts", tts_unit)
+        if journaled_tts and journal.files_intact(journaled_tts["files"]):
+            synthesized_sentences = [tuple(item) for item in journaled_tts["sentences"]]
+            print(f"    [SCRIPT_GEN_HELPER - {current_project_id}] TTS de '{source_type_tag}' retomado del diario ({len(synthesized_sentences)} frases).")
+        elif tts_mode == "block_ssml":
+            # Un solo audio por bloque; los límites de cada frase salen de los timepoints SSML (Google)
+            # o de la concatenación de los WAV (motor local)
+            for part_idx, part_sentences in enumerate(backend.split_block(sentences)):
+                audio_filename = f"block_{part_idx + 1:02d}.{backend.audio_extension}"
+                synthesis_result = backend.synthesize_block(
+                    part_sentences, audio_filename, project_id=current_project_id, type_subfolder=tts_type_subfolder
+                )
+                if not synthesis_result: continue
+                block_audio_path, sentence_offsets_ms = synthesis_result
+                block_duration_ms = tts_service.get_audio_duration_ms(block_audio_path) or 0
+                sentence_ends_ms = sentence_offsets_ms[1:] + [block_duration_ms]
+                for sentence_chunk, offset_ms, end_ms in zip(part_sentences, sentence_offsets_ms, sentence_ends_ms):
+                    synthesized_sentences.append((sentence_chunk, block_audio_path, offset_ms, max(0, end_ms - offset_ms)))
+        else:
+            # El bloque se sintetiza como lote: el motor local lo reparte entre los núcleos del worker
+            audio_filenames = [f"segment_{sentence_file_start + i + 1:03d}.{backend.audio_extension}" for i in range(len(sentences))]
+            generated_paths = backend.synthesize_batch(
+                sentences, audio_filenames, project_id=current_project_id, type_subfolder=tts_type_subfolder
             )
-            if not generated_path: continue
-            duration_ms = tts_service.get_audio_duration_ms(generated_path) or 0
+            for sentence_chunk, generated_path in zip(sentences, generated_paths):
+                if not generated_path: continue
+                duration_ms = tts_service.get_audio_duration_ms(generated_path) or 0
+                synthesized_sentences.append((sentence_chunk, generated_path, 0, duration_ms))
+        if not journaled_tts and len(synthesized_sentences) == len(sentences):
+            # Solo bloques completos: si faltó alguna frase, el reintento vuelve a sintetizar el bloque
+            journal.record("tts", tts_unit, sentences=[list(item) for item in synthesized_sentences],
+                           files={path: script_journal_service.file_sha256(path) for path in {item[1] for item in synthesized_sentences}})
+
+        for sentence_chunk, generated_path, audio_offset_ms, duration_ms in synthesized_sentences:
+            global_segment_counter += 1
             
             # Usar las keywords del bloque, o el chunk como fallback
             prompt_keyword_to_store = block_keywords_str if block_keywords_str else sentence_chunk[:200]
@@ -65,6 +332,7 @@ def create_script_segments(
                 "text_chunk": sentence_chunk,
                 "actual_tts_audio_url": generated_path, 
                 "actual_tts_duration_ms": duration_ms,
+                "audio_offset_ms": audio_offset_ms, # Inicio de la frase dentro del archivo de audio (0 en modo por frase)
                 "source_type": source_type_tag,
                 "visual_type": scene_visual_type,
                 "visual_asset_url": scene_visual_asset_url,
@@ -88,67 +356,218 @@ def create_script_segments(
             if comment.get("body") and comment["body"].strip():
                 text_blocks_to_process.append({"type": "comment", "text": comment["body"], "comment_idx": idx + 1})
 
+    # --- Planificación por duración (antes de cualquier llamada a OpenAI, TTS o Pexels) ---
+    remaining_budget_ms = None
+    ms_per_char = get_ms_per_char(tts_mode, voice_name=backend.voice_id) # También estima la duración de cada escena para elegir el clip de stock
+    if target_duration_s:
+        text_blocks_to_process = plan_text_blocks_for_duration(text_blocks_to_process, target_duration_s, ms_per_char)
+        remaining_budget_ms = target_duration_s * 1000 * (1 + DURATION_BUDGET_TOLERANCE)
 
-    for block_info in text_blocks_to_process:
-        original_text = block_info["text"]
-        source_type = block_info["type"]
-        comment_idx = block_info["comment_idx"]
-        current_source_tag = source_type
-        if source_type == "comment":
-            current_source_tag = f"comment_{comment_idx}"
-        
-        print(f"\n[SCRIPT_GEN - {project_id}] Procesando bloque: {current_source_tag.upper()} (Original: '{original_text[:70]}...')")
-
+    # --- Etapas del pipeline (cada una corre en su propio executor) ---
+    def enhance_block(source_tag: str, block_text: str):
+        enhance_unit = script_journal_service.unit_id(source_tag, target_narration_language, block_text)
+        journaled_enhancement = journal.get("enhance", enhance_unit)
+        if journaled_enhancement:
+            print(f"  [SCRIPT_GEN - {project_id}] Mejora de {source_tag} retomada del diario.")
+            return journaled_enhancement["enhanced_text"], journaled_enhancement["keywords"]
         enhanced_text, keywords_list = ai_text_enhancer_service.enhance_text_and_extract_keywords(
-            original_text, target_language=target_narration_language
+            block_text, target_language=target_narration_language
         )
-        if not enhanced_text: enhanced_text = original_text
-        
-        keywords_query_for_stock_video = None # String de keywords para Pexels
-        if keywords_list:
-            keywords_query_for_stock_video = ", ".join(keywords_list) # Unir lista en string
-            print(f"  [SCRIPT_GEN - {project_id}] Keywords extraídas para {current_source_tag}: '{keywords_query_for_stock_video}'")
-        else:
-            print(f"  [SCRIPT_GEN - {project_id}] No se extrajeron keywords para {current_source_tag}.")
-
-        scene_visual_type_to_use = default_visual_type
-        scene_visual_asset_to_use = default_visual_asset_url
-        scene_visual_loopable = False 
-
-        if keywords_query_for_stock_video: # Solo buscar si tenemos keywords
-            print(f"  Buscando video de stock para '{keywords_query_for_stock_video}'...")
-            stock_video_filename = f"{current_source_tag}_bg_video.mp4"
-            downloaded_video_path = stock_media_service.search_and_download_pexels_video(
-                keywords=keywords_query_for_stock_video, project_id=project_id,
-                video_filename=stock_video_filename
+        if enhanced_text:
+            journal.record("enhance", enhance_unit, enhanced_text=enhanced_text, keywords=keywords_list or [])
+        return enhanced_text, keywords_list
+
+    used_library_clips = set() # Variedad dentro del proyecto: no repetir un clip de la biblioteca en dos escenas
+    used_library_clips_lock = threading.Lock()
+
+    def claim_library_clip(keywords_query: str, scene_duration_s: float, apply_variety_rules: bool = True) -> Optional[str]:
+        """
+        Busca sin el lock (el índice puede bajar del almacenamiento) sobre una copia de los clips ya
+        usados y reserva el resultado bajo el lock. Si otra escena lo tomó mientras tanto, se repite
+        la búsqueda excluyéndolo.
+        """
+        while True:
+            with used_library_clips_lock:
+                excluded_keys = set(used_library_clips)
+            clip_key = media_library_service.find_library_clip(
+                keywords_query, project_id, min_duration_s=scene_duration_s,
+                exclude_keys=excluded_keys, apply_variety_rules=apply_variety_rules
             )
-            if downloaded_video_path:
-                print(f"  Video de stock encontrado para {current_source_tag}: {downloaded_video_path}")
-                scene_visual_type_to_use = "static_video"
-                scene_visual_asset_to_use = downloaded_video_path
-                scene_visual_loopable = True 
+            if not clip_key:
+                return None
+            with used_library_clips_lock:
+                if clip_key not in used_library_clips:
+                    used_library_clips.add(clip_key)
+                    return clip_key
+
+    def fetch_scene_visual(keywords_query: str, source_tag: str, scene_duration_s: float) -> Dict[str, Any]:
+        def library_visual(clip_key: str) -> Dict[str, Any]:
+            media_library_service.mark_clip_used(clip_key, project_id)
+            print(f"  Video de la biblioteca local para {source_tag}: {clip_key}")
+            return {"visual_type": "static_video", "visual_asset_url": clip_key, "visual_asset_url_is_loopable": True}
+
+        # 1) Biblioteca local (sin llamar a Pexels), salvo la fracción de búsquedas que se hacen frescas
+        if not media_library_service.should_search_fresh(keywords_query, project_id):
+            clip_key = claim_library_clip(keywords_query, scene_duration_s)
+            if clip_key:
+                return library_visual(clip_key)
+
+        # 2) Pexels
+        print(f"  Buscando video de stock para '{keywords_query}'...")
+        stock_video_filename = f"{source_tag}_bg_video.mp4"
+        downloaded_video_path = stock_media_service.search_and_download_pexels_video(
+            keywords=keywords_query, project_id=project_id,
+            video_filename=stock_video_filename,
+            min_duration_s=scene_duration_s
+        )
+        if downloaded_video_path:
+            with used_library_clips_lock:
+                used_library_clips.add(downloaded_video_path)
+            print(f"  Video de stock encontrado para {source_tag}: {downloaded_video_path}")
+            return {"visual_type": "static_video", "visual_asset_url": downloaded_video_path,
+                    "visual_asset_url_is_loopable": True}
+
+        # 3) Pexels falló (cuota, red): mejor un clip parecido de la biblioteca que el visual por defecto
+        clip_key = claim_library_clip(keywords_query, scene_duration_s, apply_variety_rules=False)
+        if clip_key:
+            return library_visual(clip_key)
+        print(f"  No se encontró video de stock para {source_tag}. Usando visual por defecto.")
+        return default_scene_visual
+
+    def journaled_scene_visual(keywords_query: str, source_tag: str, scene_duration_s: float) -> Dict[str, Any]:
+        visual_unit = script_journal_service.unit_id(source_tag, keywords_query)
+        journaled_visual = journal.get("visual", visual_unit)
+        if journaled_visual and journal.files_intact(journaled_visual["files"]):
+            scene_visual = journaled_visual["visual"]
+            with used_library_clips_lock:
+                used_library_clips.add(scene_visual["visual_asset_url"])
+            print(f"  Visual de {source_tag} retomado del diario: {scene_visual['visual_asset_url']}")
+            return scene_visual
+        scene_visual = fetch_scene_visual(keywords_query, source_tag, scene_duration_s)
+        if scene_visual is not default_scene_visual:
+            asset_key = scene_visual["visual_asset_url"]
+            # Los clips de la biblioteca se comparten entre proyectos (y los verifica su índice): basta con que existan
+            is_library_clip = asset_key.startswith(media_library_service.LIBRARY_VIDEOS_PREFIX)
+            journal.record("visual", visual_unit, visual=scene_visual,
+                           files={asset_key: None if is_library_clip else script_journal_service.file_sha256(asset_key)})
+        return scene_visual
+
+    default_scene_visual = {"visual_type": default_visual_type, "visual_asset_url": default_visual_asset_url,
+                            "visual_asset_url_is_loopable": False}
+
+    # Productor: el enhancer recorre los bloques en orden con una ventana acotada, así que la mejora
+    # del bloque N+1 avanza mientras se sintetiza el TTS del bloque N.
+    enhancer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"enhancer_{project_id}")
+    stock_executor = ThreadPoolExecutor(max_workers=STOCK_PREFETCH_WORKERS, thread_name_prefix=f"stock_{project_id}")
+    scene_visual_jobs = [] # (future o None, índice del primer segmento, índice final) por bloque
+    try:
+        enhancement_futures = {}
+        def submit_enhancement(block_index: int):
+            if block_index < len(text_blocks_to_process) and block_index not in enhancement_futures:
+                block = text_blocks_to_process[block_index]
+                enhancement_futures[block_index] = enhancer_executor.submit(enhance_block, _block_source_tag(block), block["text"])
+        for block_index in range(ENHANCER_LOOKAHEAD_BLOCKS + 1):
+            submit_enhancement(block_index)
+
+        for block_index, block_info in enumerate(text_blocks_to_process):
+            if (remaining_budget_ms is not None and script_segments_for_json
+                    and remaining_budget_ms <= SCENE_TRANSITION_BUDGET_MS):
+                # Ya no cabe nada más: las mejoras pendientes se cancelan al cerrar el executor
+                print(f"[SCRIPT_GEN - {project_id}] Duración objetivo alcanzada; se omiten {len(text_blocks_to_process) - block_index} bloques.")
+                break
+            enhancement_future = enhancement_futures.pop(block_index)
+            submit_enhancement(block_index + ENHANCER_LOOKAHEAD_BLOCKS + 1)
+            original_text = block_info["text"]
+            current_source_tag = _block_source_tag(block_info)
+            
+            print(f"\n[SCRIPT_GEN - {project_id}] Procesando bloque: {current_source_tag.upper()} (Original: '{original_text[:70]}...')")
+
+            enhanced_text, keywords_list = enhancement_future.result()
+            if not enhanced_text: enhanced_text = original_text
+            
+            keywords_query_for_stock_video = None # String de keywords para Pexels
+            if keywords_list:
+                keywords_query_for_stock_video = ", ".join(keywords_list) # Unir lista en string
+                print(f"  [SCRIPT_GEN - {project_id}] Keywords extraídas para {current_source_tag}: '{keywords_query_for_stock_video}'")
             else:
-                print(f"  No se encontró video de stock para {current_source_tag}. Usando visual por defecto.")
-        else: # Si no hubo keywords, usar visual por defecto
-             print(f"  No hay keywords para buscar video de stock para {current_source_tag}. Usando visual por defecto.")
+                print(f"  [SCRIPT_GEN - {project_id}] No se extrajeron keywords para {current_source_tag}.")
+
+            sentences_for_block = segment_text_into_sentences(enhanced_text)
+            if remaining_budget_ms is not None:
+                # La IA puede alargar el texto: se vuelve a ajustar con el presupuesto real restante,
+                # antes de pedir el video de stock o el TTS del bloque. Mismas reglas que el plan:
+                # el título siempre va, el selftext se recorta por frases y un comentario va entero o no va.
+                transition_ms = SCENE_TRANSITION_BUDGET_MS if script_segments_for_json else 0
+                if block_info["type"] != "title":
+                    fitted_sentences = fit_sentences_to_budget(sentences_for_block, remaining_budget_ms - transition_ms, ms_per_char)
+                    if len(fitted_sentences) < len(sentences_for_block):
+                        if block_info["type"] == "comment":
+                            fitted_sentences = []
+                            print(f"  [SCRIPT_GEN - {project_id}] {current_source_tag} omitido: mejorado ya no cabe en la duración objetivo.")
+                        else:
+                            print(f"  [SCRIPT_GEN - {project_id}] {current_source_tag}: {len(sentences_for_block) - len(fitted_sentences)} frases recortadas por la duración objetivo.")
+                    sentences_for_block = fitted_sentences
+                if not sentences_for_block:
+                    continue
+
+            # En cuanto hay keywords, la búsqueda y descarga del visual arranca en segundo plano
+            scene_visual_future = None
+            if keywords_query_for_stock_video: # Solo buscar si tenemos keywords
+                estimated_scene_s = estimate_narration_ms(" ".join(sentences_for_block), ms_per_char) / 1000
+                scene_visual_future = stock_executor.submit(journaled_scene_visual, keywords_query_for_stock_video, current_source_tag, estimated_scene_s)
+            else: # Si no hubo keywords, usar visual por defecto
+                 print(f"  No hay keywords para buscar video de stock para {current_source_tag}. Usando visual por defecto.")
+                
             
-        sentences_for_block = segment_text_into_sentences(enhanced_text)
-        
-        process_sentences_to_segments(
-            sentences_for_block,
-            current_source_tag,
-            scene_visual_type_to_use,
-            scene_visual_asset_to_use,
-            scene_visual_loopable,
-            keywords_query_for_stock_video, # <--- PASAR LAS KEYWORDS DEL BLOQUE
-            project_id
-        )
+            # Los segmentos se crean con el visual por defecto; el visual real se asigna en el punto de unión
+            first_segment_index = len(script_segments_for_json)
+            process_sentences_to_segments(
+                sentences_for_block,
+                current_source_tag,
+                default_scene_visual["visual_type"],
+                default_scene_visual["visual_asset_url"],
+                default_scene_visual["visual_asset_url_is_loopable"],
+                keywords_query_for_stock_video, # <--- PASAR LAS KEYWORDS DEL BLOQUE
+                project_id
+            )
+            scene_visual_jobs.append((scene_visual_future, first_segment_index, len(script_segments_for_json)))
+            if remaining_budget_ms is not None:
+                # Se descuenta la duración real del TTS, no la estimada
+                remaining_budget_ms -= transition_ms + sum(
+                    seg["actual_tts_duration_ms"] for seg in script_segments_for_json[first_segment_index:]
+                )
+
+        # --- Punto de unión: esperar las descargas y asignar el visual de cada escena antes de escribir el manifiesto ---
+        for scene_visual_future, first_segment_index, end_segment_index in scene_visual_jobs:
+            scene_visual = default_scene_visual
+            if scene_visual_future is not None:
+                try:
+                    scene_visual = scene_visual_future.result()
+                except Exception as e_visual:
+                    print(f"  [SCRIPT_GEN - {project_id}] [WARN] Falló la descarga del visual de la escena: {e_visual}. Usando visual por defecto.")
+            for segment_dict_data in script_segments_for_json[first_segment_index:end_segment_index]:
+                segment_dict_data.update(scene_visual)
+    finally:
+        enhancer_executor.shutdown(wait=True, cancel_futures=True) # Si algo falló, no seguir mejorando bloques
+        stock_executor.shutdown(wait=True)
 
+    update_speaking_rate_calibration(script_segments_for_json, tts_mode, backend.voice_id)
     print(f"\n[SCRIPT_GEN - {project_id}] FINALIZADO. Total segmentos para JSON: {len(script_segments_for_json)}")
     return script_segments_for_json
 
 # --- Bloque if __name__ == "__main__": para probar ---
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Prueba de generación de guion, o recalibración de la velocidad de habla.")
+    parser.add_argument("--rebuild-calibration", choices=["sentence", "block_ssml"],
+                        help="Rehace la entrada de calibración del modo con todos los manifiestos y sale.")
+    parser.add_argument("--tts-backend", choices=sorted(tts_service.TTS_BACKENDS), default=None)
+    cli_args = parser.parse_args()
+    if cli_args.rebuild_calibration:
+        used_projects = rebuild_speaking_rate_calibration_from_manifests(cli_args.rebuild_calibration, cli_args.tts_backend)
+        print(f"Calibración '{cli_args.rebuild_calibration}' recalculada con {used_projects} proyectos.")
+        raise SystemExit(0)
+
     # from app.services import scraping_service # Descomentar para usar datos reales de PRAW
     import uuid 
 
@@ -0,0 +1,111 @@
+# app/services/script_journal_service.py
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.services import storage_service
+
+# Diario de progreso de la generación del guion: outputs/scripts/<project_id>/progress_journal.jsonl.
+# Cada unidad terminada agrega una línea JSON (solo se agrega, nunca se reescribe):
+#   "enhance": texto mejorado y keywords de un bloque (título, selftext, comentario)
+#   "visual":  visual de la escena (clip de la biblioteca o descarga de Pexels)
+#   "tts":     audios de las frases de un bloque con sus offsets, duraciones y sha256
+# Si el worker muere y la tarea se reentrega (acks_late), el reintento retoma desde el diario: las
+# unidades cuyas entradas coinciden se saltan y sus archivos se verifican por sha256 en vez de volver
+# a pagar IA, Pexels y TTS. El diario se borra cuando el manifiesto del guion queda escrito.
+JOURNAL_FILENAME = "progress_journal.jsonl"
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def journal_key(project_id: str) -> str:
+    return storage_service.storage_key("outputs/scripts", project_id, JOURNAL_FILENAME)
+
+
+def unit_id(*parts: Any) -> str:
+    """Identificador de una unidad a partir de sus entradas (si cambian las entradas, no se reutiliza)."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def file_sha256(key: str) -> Optional[str]:
+    local_path = storage_service.get_storage().ensure_local(key)
+    if not local_path:
+        return None
+    digest = hashlib.sha256()
+    with open(local_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ProgressJournal:
+    """Diario de un proyecto. Seguro entre hilos (las descargas de visuales registran desde su executor)."""
+
+    def __init__(self, project_id: str):
+        self.project_id = project_id
+        self.key = journal_key(project_id)
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._ends_mid_line = False
+        storage = storage_service.get_storage()
+        local_path = storage.ensure_local(self.key, refresh=True) # Lo pudo escribir otro nodo antes de caer
+        if not local_path:
+            return
+        with open(local_path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._ends_mid_line = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except ValueError: # Última línea cortada por la caída del worker
+                    continue
+                self._entries[(entry["unit"], entry["id"])] = entry # La más reciente gana
+        print(f"[Script Journal - {project_id}] Diario con {len(self._entries)} unidades terminadas; se retoma desde ahí.")
+
+    def get(self, unit: str, unit_key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get((unit, unit_key))
+
+    def record(self, unit: str, unit_key: str, **data: Any):
+        """Agrega la unidad al diario y lo sincroniza con el almacenamiento antes de seguir."""
+        entry = {"unit": unit, "id": unit_key, "at": time.time(), **data}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        storage = storage_service.get_storage()
+        try:
+            with self._lock:
+                with open(storage.local_path(self.key), "a", encoding="utf-8") as f:
+                    if self._ends_mid_line: # No pegar la entrada nueva a la línea cortada
+                        f.write("\n")
+                        self._ends_mid_line = False
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+                storage.save_file(self.key)
+                self._entries[(unit, unit_key)] = entry
+        except Exception as e:
+            # Sin diario la tarea sigue funcionando; solo se pierde la reanudación de esta unidad
+            print(f"[Script Journal - {self.project_id}] [WARN] No se pudo registrar la unidad '{unit}': {e}")
+
+    def files_intact(self, file_hashes: Dict[str, Optional[str]]) -> bool:
+        """True si cada archivo existe y, cuando se registró su sha256, sigue teniendo el mismo contenido."""
+        storage = storage_service.get_storage()
+        for key, expected_sha256 in file_hashes.items():
+            if expected_sha256 is None:
+                if not storage.exists(key):
+                    return False
+            elif file_sha256(key) != expected_sha256:
+                print(f"[Script Journal - {self.project_id}] [WARN] '{key}' falta o cambió desde que se registró; se regenera.")
+                return False
+        return True
+
+
+def open_journal(project_id: str) -> ProgressJournal:
+    return ProgressJournal(project_id)
+
+
+def discard_journal(project_id: str):
+    """Borra el diario cuando el manifiesto ya está escrito (una nueva ejecución empieza de cero)."""
+    try:
+        storage_service.get_storage().delete(journal_key(project_id))
+    except Exception as e:
+        print(f"[Script Journal - {project_id}] [WARN] No se pudo borrar el diario: {e}")
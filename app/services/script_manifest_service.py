@@ -0,0 +1,297 @@
+# app/services/script_manifest_service.py
+import os
+import json
+import struct
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+import msgpack
+
+from app.services import storage_service
+
+# Manifiesto binario del proyecto (reemplaza a script_data.json con indent=4).
+# Estructura del archivo:
+#   MAGIC (4 bytes) | versión (uint8) | largo del header (uint32 big-endian) | header msgpack | bloques de escena
+# El header guarda una vez por escena los campos de escena (visual, loop, keywords) y el offset/largo
+# de su bloque de segmentos; cada bloque es una lista msgpack de registros compactos (listas), cuyos
+# campos se describen en header["segment_fields"]. Así el lector puede cargar una escena a la vez.
+MANIFEST_MAGIC = b"RVGM"
+MANIFEST_FORMAT_VERSION = 1
+MANIFEST_FILENAME = "script_manifest.rvgm"
+LEGACY_JSON_FILENAME = "script_data.json"
+
+_PREAMBLE = struct.Struct(">4sBI")
+
+SEGMENT_FIELDS = [
+    "segment_order",
+    "text_chunk",
+    "actual_tts_audio_url",
+    "actual_tts_duration_ms",
+    "audio_offset_ms", # Inicio de la frase dentro del audio (modo SSML por bloque: un audio por escena)
+    "visual_prompt_override", # None: el prompt por defecto de la escena (ver _default_visual_prompt); False: sin prompt
+    "extra", # Campos del segmento que el esquema no cubre (o que difieren de lo derivado), tal cual; None si no hay
+]
+
+SEGMENT_DEFAULTS = {
+    "transition_to_next": "cut",
+    "subtitles_enabled": True,
+    "voice_options": None,
+}
+
+
+def manifest_key(project_id: str) -> str:
+    return storage_service.storage_key("outputs/scripts", project_id, MANIFEST_FILENAME)
+
+
+def legacy_json_key(project_id: str) -> str:
+    return storage_service.storage_key("outputs/scripts", project_id, LEGACY_JSON_FILENAME)
+
+
+def _group_segments_into_scenes(segments: List[Dict[str, Any]]) -> "OrderedDict[str, List[Dict[str, Any]]]":
+    # Misma agrupación que usaba el ensamblador: por 'source_type', en orden de aparición
+    scenes = OrderedDict()
+    for seg in sorted(segments, key=lambda s: s.get("segment_order", 0)):
+        source_type = seg.get("source_type", f"unknown_scene_{seg.get('segment_order', 0)}")
+        scenes.setdefault(source_type, []).append(seg)
+    return scenes
+
+
+def _default_visual_prompt(scene_keywords: Optional[str], text_chunk: str) -> str:
+    # Prompt que el lector asigna a un segmento sin override: las keywords de la escena o el inicio del texto
+    return scene_keywords or text_chunk[:200]
+
+
+def _expand_record(project_id: str, segment_fields: List[str], segment_defaults: Dict[str, Any],
+                   record: list, scene: Dict[str, Any]) -> Dict[str, Any]:
+    """Segmento completo a partir de su registro compacto y los campos de su escena."""
+    fields = dict(zip(segment_fields, record))
+    order = fields["segment_order"]
+    text_chunk = fields.get("text_chunk", "")
+    duration_ms = fields.get("actual_tts_duration_ms", 0)
+    prompt_override = fields.get("visual_prompt_override")
+    segment = {
+        "id": f"seg_{project_id}_{order:03d}",
+        "segment_order": order,
+        "text_chunk": text_chunk,
+        "actual_tts_audio_url": fields.get("actual_tts_audio_url"),
+        "actual_tts_duration_ms": duration_ms,
+        "audio_offset_ms": fields.get("audio_offset_ms", 0), # Manifiestos sin este campo: un audio por frase
+        "source_type": scene["name"],
+        "visual_type": scene["visual_type"],
+        "visual_asset_url": scene["visual_asset_url"],
+        "visual_asset_url_is_loopable": scene["is_loopable"],
+        "visual_prompt_or_keyword": (None if prompt_override is False else prompt_override) if prompt_override is not None
+                                    else _default_visual_prompt(scene["keywords"], text_chunk),
+        "visual_duration_ms": duration_ms,
+    }
+    # Campos añadidos en escrituras posteriores que este lector no conoce explícitamente
+    for field_name, value in fields.items():
+        if field_name not in segment and field_name not in ("visual_prompt_override", "extra"):
+            segment[field_name] = value
+    segment.update({k: v for k, v in segment_defaults.items() if k not in segment})
+    segment.update(fields.get("extra") or {})
+    return segment
+
+
+def _segment_to_record(project_id: str, seg: Dict[str, Any], scene: Dict[str, Any]) -> list:
+    text_chunk = seg.get("text_chunk", "")
+    prompt = seg.get("visual_prompt_or_keyword")
+    if prompt == _default_visual_prompt(scene["keywords"], text_chunk):
+        prompt_override = None
+    else:
+        prompt_override = False if prompt is None else prompt
+    record = [
+        int(seg.get("segment_order", 0)),
+        text_chunk,
+        seg.get("actual_tts_audio_url"),
+        int(seg.get("actual_tts_duration_ms", 0) or 0),
+        int(seg.get("audio_offset_ms", 0) or 0),
+        prompt_override,
+        None,
+    ]
+    # Todo lo que el lector no reconstruiría igual (campos fuera del esquema, un visual distinto al
+    # de la escena, un id propio...) viaja en "extra" para que la migración no pierda nada
+    expanded = _expand_record(project_id, SEGMENT_FIELDS, SEGMENT_DEFAULTS, record, scene)
+    extra = {key: value for key, value in seg.items() if key not in expanded or expanded[key] != value}
+    record[-1] = extra or None
+    return record
+
+
+def write_manifest(project_id: str, segments: List[Dict[str, Any]], tts_info: Optional[Dict[str, Any]] = None,
+                   extra: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """
+    Escribe el manifiesto compacto del proyecto a partir de la lista de segmentos
+    (el mismo formato que devuelve create_script_segments). tts_info ({"mode", "backend",
+    "voice_id"}) queda en el header para la calibración de velocidad de habla; extra guarda
+    campos de nivel superior sin lugar en el esquema (ej. de un script_data.json antiguo).
+    Devuelve la clave o None.
+    """
+    scenes_meta = []
+    scene_blocks = []
+    data_offset = 0
+    for scene_name, scene_segments in _group_segments_into_scenes(segments).items():
+        first_seg = scene_segments[0]
+        # Si la escena tiene keywords, todos sus segmentos comparten el mismo prompt
+        scene_keywords = first_seg.get("visual_prompt_or_keyword")
+        if scene_keywords == first_seg.get("text_chunk", "")[:200]:
+            scene_keywords = None
+        scene_meta = {
+            "name": scene_name,
+            "visual_type": first_seg.get("visual_type"),
+            "visual_asset_url": first_seg.get("visual_asset_url"),
+            "is_loopable": bool(first_seg.get("visual_asset_url_is_loopable", False)),
+            "keywords": scene_keywords,
+            "segment_count": len(scene_segments),
+            "duration_ms": sum(int(s.get("actual_tts_duration_ms", 0) or 0) for s in scene_segments),
+        }
+        block = msgpack.packb([_segment_to_record(project_id, seg, scene_meta) for seg in scene_segments], use_bin_type=True)
+        scene_meta.update(block_offset=data_offset, block_length=len(block))
+        scenes_meta.append(scene_meta)
+        scene_blocks.append(block)
+        data_offset += len(block)
+
+    header = msgpack.packb({
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "project_id": project_id,
+        "created_at": time.time(),
+        "segment_fields": SEGMENT_FIELDS,
+        "segment_defaults": SEGMENT_DEFAULTS,
+        "scenes": scenes_meta,
+        "tts": tts_info,
+        "extra": extra,
+    }, use_bin_type=True)
+
+    storage = storage_service.get_storage()
+    key = manifest_key(project_id)
+    local_path = storage.local_path(key)
+    tmp_path = f"{local_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_PREAMBLE.pack(MANIFEST_MAGIC, MANIFEST_FORMAT_VERSION, len(header)))
+            f.write(header)
+            for block in scene_blocks:
+                f.write(block)
+        os.replace(tmp_path, local_path)
+    except Exception as e:
+        print(f"[Manifest - {project_id}] Error al escribir el manifiesto: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    if not storage.save_file(key):
+        print(f"[Manifest - {project_id}] No se pudo guardar el manifiesto en el almacenamiento ({storage.name}).")
+        return None
+    print(f"[Manifest - {project_id}] Manifiesto escrito: {len(scenes_meta)} escenas, {len(segments)} segmentos ({os.path.getsize(local_path)} bytes).")
+    return key
+
+
+class ManifestReader:
+    """
+    Lector perezoso del manifiesto: al abrirlo solo lee el header; los segmentos
+    de cada escena se leen (seek + read) cuando se piden.
+    """
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        with open(manifest_path, "rb") as f:
+            magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != MANIFEST_MAGIC:
+                raise ValueError(f"'{manifest_path}' no es un manifiesto de proyecto válido.")
+            if version > MANIFEST_FORMAT_VERSION:
+                raise ValueError(f"Versión de manifiesto no soportada: {version} (máxima {MANIFEST_FORMAT_VERSION}).")
+            self.header = msgpack.unpackb(f.read(header_length), raw=False)
+        self._data_start = _PREAMBLE.size + header_length
+        self.project_id = self.header["project_id"]
+        self.scenes: List[Dict[str, Any]] = self.header["scenes"]
+        self.segment_fields: List[str] = self.header["segment_fields"]
+        self.segment_defaults: Dict[str, Any] = self.header.get("segment_defaults", {})
+        self.extra: Dict[str, Any] = self.header.get("extra") or {} # Campos de nivel superior fuera del esquema
+
+    @property
+    def total_segments(self) -> int:
+        return sum(scene["segment_count"] for scene in self.scenes)
+
+    @property
+    def total_duration_ms(self) -> int:
+        return sum(scene["duration_ms"] for scene in self.scenes)
+
+    def load_scene_segments(self, scene_index: int) -> List[Dict[str, Any]]:
+        """Carga y expande solo los segmentos de la escena indicada."""
+        scene = self.scenes[scene_index]
+        with open(self.manifest_path, "rb") as f:
+            f.seek(self._data_start + scene["block_offset"])
+            records = msgpack.unpackb(f.read(scene["block_length"]), raw=False)
+        return [_expand_record(self.project_id, self.segment_fields, self.segment_defaults, record, scene)
+                for record in records]
+
+    def iter_scenes(self) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Itera (metadatos_de_escena, segmentos) cargando una escena a la vez."""
+        for scene_index, scene in enumerate(self.scenes):
+            yield scene, self.load_scene_segments(scene_index)
+
+    def load_all_segments(self) -> List[Dict[str, Any]]:
+        segments = []
+        for _, scene_segments in self.iter_scenes():
+            segments.extend(scene_segments)
+        return segments
+
+
+def migrate_json_project(project_id: str) -> Optional[str]:
+    """
+    Convierte el script_data.json de un proyecto existente al manifiesto compacto.
+    El JSON original no se borra. Devuelve la clave del manifiesto o None.
+    """
+    storage = storage_service.get_storage()
+    json_path = storage.ensure_local(legacy_json_key(project_id))
+    if not json_path:
+        return None
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            script_data = json.load(f)
+    except Exception as e:
+        print(f"[Manifest - {project_id}] Error al leer el guion JSON para migrar: {e}")
+        return None
+    # Lista de segmentos, o un objeto con "segments" y otros campos de nivel superior (se conservan en extra)
+    top_level_extra = None
+    segments = script_data
+    if isinstance(script_data, dict):
+        segments = script_data.get("segments") or []
+        top_level_extra = {k: v for k, v in script_data.items() if k != "segments"} or None
+    if not segments:
+        print(f"[Manifest - {project_id}] El guion JSON está vacío, no se migra.")
+        return None
+    print(f"[Manifest - {project_id}] Migrando script_data.json al manifiesto v{MANIFEST_FORMAT_VERSION}...")
+    return write_manifest(project_id, segments, extra=top_level_extra)
+
+
+def open_project_manifest(project_id: str) -> Optional[ManifestReader]:
+    """
+    Abre el manifiesto del proyecto. Si el proyecto es anterior al manifiesto
+    (solo tiene script_data.json), lo migra al vuelo.
+    """
+    storage = storage_service.get_storage()
+    manifest_path = storage.ensure_local(manifest_key(project_id))
+    if not manifest_path and migrate_json_project(project_id):
+        manifest_path = storage.ensure_local(manifest_key(project_id))
+    if not manifest_path:
+        print(f"[Manifest - {project_id}] No se encontró manifiesto ni script_data.json para el proyecto.")
+        return None
+    try:
+        return ManifestReader(manifest_path)
+    except Exception as e:
+        print(f"[Manifest - {project_id}] Error al abrir el manifiesto '{manifest_path}': {e}")
+        return None
+
+
+# Migración en lote de proyectos existentes: python -m app.services.script_manifest_service
+if __name__ == "__main__":
+    scripts_dir = os.path.join(storage_service.APP_BASE_DIR, "outputs", "scripts")
+    migrated, skipped = 0, 0
+    for project_dir_name in sorted(os.listdir(scripts_dir)) if os.path.isdir(scripts_dir) else []:
+        project_dir = os.path.join(scripts_dir, project_dir_name)
+        if os.path.exists(os.path.join(project_dir, MANIFEST_FILENAME)):
+            skipped += 1
+            continue
+        if os.path.exists(os.path.join(project_dir, LEGACY_JSON_FILENAME)) and migrate_json_project(project_dir_name):
+            migrated += 1
+    print(f"Migración terminada. Proyectos migrados: {migrated}. Ya tenían manifiesto: {skipped}.")
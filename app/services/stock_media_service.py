@@ -1,30 +1,96 @@
 # app/services/stock_media_service.py
 import requests
 import os
-import random
 import uuid
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from app.core.config import PEXELS_API_KEY # Asume que está en tu config.py
+from app.services import storage_service, rate_limiter_service, media_library_service
 
 PEXELS_SEARCH_VIDEO_URL = "https://api.pexels.com/videos/search"
 # Podríamos añadir PEXELS_POPULAR_VIDEO_URL = "https://api.pexels.com/videos/popular"
 
+def _pexels_search(headers: Dict[str, str], params: Dict[str, Any]) -> requests.Response:
+    response = requests.get(PEXELS_SEARCH_VIDEO_URL, headers=headers, params=params, timeout=15)
+    response.raise_for_status() # Lanza una excepción para errores HTTP 4xx/5xx (el 429 lo reintenta el limiter)
+    return response
+
+def _rendition_matches_orientation(video_file: Dict[str, Any], orientation: str) -> bool:
+    width, height = video_file.get("width") or 0, video_file.get("height") or 0
+    if orientation == "portrait":
+        return height > width
+    if orientation == "square":
+        return width == height
+    return width >= height
+
+
+def select_video_rendition(
+    videos: List[Dict[str, Any]],
+    target_resolution: Tuple[int, int],
+    target_fps: float,
+    orientation: str,
+    min_duration_s: Optional[float] = None
+) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Elige de forma determinista (video, video_file) entre los resultados de Pexels: el MP4 más
+    pequeño que cubre la resolución y los fps objetivo con la orientación pedida, prefiriendo
+    videos cuya duración alcanza min_duration_s (así no hay que hacer loop). Si ninguna
+    rendición llega a la resolución objetivo, se toma la más grande disponible.
+    """
+    target_w, target_h = target_resolution
+    candidates = []
+    for video in videos:
+        for video_file in video.get("video_files", []):
+            if video_file.get("file_type") != "video/mp4" or not video_file.get("link"):
+                continue
+            if not _rendition_matches_orientation(video_file, orientation):
+                continue
+            width, height = video_file.get("width") or 0, video_file.get("height") or 0
+            fps = video_file.get("fps") or 0
+            # Pexels no siempre informa el tamaño en bytes: se ordena siempre por píxeles por segundo (misma
+            # unidad para todas las rendiciones); sin fps informados se asumen los del render
+            pixel_rate = width * height * (fps or target_fps)
+            candidates.append({
+                "video": video,
+                "video_file": video_file,
+                "meets_resolution": width >= target_w and height >= target_h,
+                "meets_fps": fps >= target_fps - 0.5 if fps else True, # 23.976 cuenta como 24
+                "long_enough": not min_duration_s or (video.get("duration") or 0) >= min_duration_s,
+                "pixel_rate": pixel_rate,
+                "area": width * height,
+            })
+    if not candidates:
+        return None
+
+    suitable = [c for c in candidates if c["meets_resolution"] and c["meets_fps"]]
+    if suitable:
+        best = min(suitable, key=lambda c: (not c["long_enough"], c["pixel_rate"], c["video"].get("id", 0), c["video_file"].get("id", 0)))
+    else:
+        best = max(candidates, key=lambda c: (c["long_enough"], c["area"], c["meets_fps"], -c["pixel_rate"], -c["video"].get("id", 0), -c["video_file"].get("id", 0)))
+    return best["video"], best["video_file"]
+
+
 def search_and_download_pexels_video(
     keywords: str, 
     project_id: str, # Para crear una carpeta de assets específica del proyecto
     video_filename: str = "stock_video.mp4", # Nombre base del archivo descargado
-    orientation: str = "landscape", # 'landscape', 'portrait', 'square'
+    orientation: Optional[str] = None, # 'landscape', 'portrait', 'square'; por defecto, según target_resolution
     size: str = "medium", # 'small', 'medium', 'large' (para calidad/resolución)
-    per_page: int = 5 # Cuántos videos buscar para elegir uno
+    per_page: int = 5, # Cuántos videos buscar para elegir uno
+    target_resolution: Tuple[int, int] = (1920, 1080), # Resolución del render donde se usará el clip
+    target_fps: float = 24,
+    min_duration_s: Optional[float] = None # Duración estimada de la escena (para evitar loops)
 ) -> Optional[str]:
     """
-    Busca un video en Pexels basado en keywords, descarga el primero relevante
-    y devuelve la ruta local al archivo descargado.
+    Busca un video en Pexels basado en keywords, descarga la rendición más pequeña que
+    sirve para el render y devuelve la clave del archivo descargado.
     """
     if not PEXELS_API_KEY or PEXELS_API_KEY == "TU_CLAVE_API_DE_PEXELS_AQUI":
         print("[Stock Media Service] PEXELS_API_KEY no configurada. No se puede buscar video.")
         return None
 
+    if orientation is None:
+        orientation = "portrait" if target_resolution[1] > target_resolution[0] else "landscape"
+
     headers = {"Authorization": PEXELS_API_KEY}
     params = {
         "query": keywords,
@@ -35,63 +101,55 @@ def search_and_download_pexels_video(
 
     try:
         print(f"[Stock Media Service - {project_id}] Buscando video en Pexels con keywords: '{keywords}'...")
-        response = requests.get(PEXELS_SEARCH_VIDEO_URL, headers=headers, params=params, timeout=15)
-        response.raise_for_status() # Lanza una excepción para errores HTTP 4xx/5xx
+        # La búsqueda cuenta contra la cuota por hora de Pexels; la descarga desde su CDN no
+        response = rate_limiter_service.call_with_rate_limit("pexels", _pexels_search, headers, params)
         data = response.json()
 
         if not data.get("videos"):
             print(f"[Stock Media Service - {project_id}] No se encontraron videos en Pexels para: '{keywords}'")
             return None
 
-        # Elegir un video (ej. el primero o uno al azar de los resultados)
-        # Podrías implementar lógica más sofisticada para elegir el mejor video.
-        selected_video_info = random.choice(data["videos"]) # Elegir uno al azar de los resultados
-
-        # Encontrar un link de descarga de buena calidad pero no excesivamente grande
-        # Pexels devuelve varios 'video_files' con diferentes calidades/resoluciones
-        video_link = None
-        target_quality = "hd" # Intentar obtener HD (usualmente ~1280 o ~1920 de ancho)
-                              # Las calidades comunes en Pexels son sd, hd, uhd
-
-        for vf in selected_video_info.get("video_files", []):
-            if vf.get("quality") == target_quality and vf.get("link"): # Buscar calidad HD
-                # Preferir archivos mp4
-                if vf.get('file_type') == 'video/mp4':
-                    video_link = vf["link"]
-                    break
-
-        # Si no se encontró HD, tomar el primer link disponible de mp4
-        if not video_link:
-            for vf in selected_video_info.get("video_files", []):
-                 if vf.get("link") and vf.get('file_type') == 'video/mp4':
-                    video_link = vf["link"]
-                    break
-
-        if not video_link: # Si aún no hay link (ej. no hay mp4)
+        # Selección determinista (mismas keywords -> mismo archivo), sin descargar 4K para un render 1080p
+        selection = select_video_rendition(data["videos"], target_resolution, target_fps, orientation, min_duration_s)
+        if not selection: # Si no hay link (ej. no hay mp4 con esa orientación)
             print(f"[Stock Media Service - {project_id}] No se encontró un link de video MP4 adecuado para: '{keywords}'")
             return None
+        selected_video_info, selected_file = selection
+        video_link = selected_file["link"]
+        print(f"[Stock Media Service - {project_id}] Rendición elegida: {selected_file.get('width')}x{selected_file.get('height')} "
+              f"@ {selected_file.get('fps')}fps ({selected_file.get('quality')}), duración {selected_video_info.get('duration')}s")
 
         print(f"[Stock Media Service - {project_id}] Video seleccionado de Pexels: {selected_video_info.get('url')}")
-        print(f"[Stock Media Service - {project_id}] Descargando desde: {video_link}...")
-
-        # Crear directorio para assets descargados de este proyecto si no existe
-        # WORKDIR es /usr/src/app. Guardaremos en outputs/temp_assets/<project_id>/videos/
-        project_assets_dir = os.path.join("/usr/src/app/outputs/temp_assets", project_id, "videos")
-        os.makedirs(project_assets_dir, exist_ok=True)
-
-        local_video_path = os.path.join(project_assets_dir, video_filename)
-
-        # Descargar el video
-        video_response = requests.get(video_link, stream=True, timeout=60) # Timeout más largo para descargas
-        video_response.raise_for_status()
-        with open(local_video_path, 'wb') as f:
-            for chunk in video_response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        print(f"[Stock Media Service - {project_id}] Video descargado exitosamente en: {local_video_path}")
+        storage = storage_service.get_storage()
+        if media_library_service.MEDIA_LIBRARY.get("enabled", True):
+            # Clave compartida en la biblioteca: el mismo archivo de Pexels se descarga una sola vez
+            video_key = media_library_service.library_clip_key(selected_video_info.get("id"), selected_file.get("id"))
+        else:
+            # Clave en el almacenamiento: outputs/temp_assets/<project_id>/videos/<video_filename>
+            video_key = storage_service.storage_key("outputs/temp_assets", project_id, "videos", video_filename)
+        local_video_path = storage.local_path(video_key)
 
-        # Devolver la ruta relativa al WORKDIR para que sea consistente con otras rutas de assets
-        return os.path.relpath(local_video_path, "/usr/src/app") # ej. outputs/temp_assets/...
+        if video_key.startswith(media_library_service.LIBRARY_VIDEOS_PREFIX) and storage.exists(video_key):
+            print(f"[Stock Media Service - {project_id}] El clip ya está en la biblioteca, no se descarga de nuevo: {video_key}")
+        else:
+            print(f"[Stock Media Service - {project_id}] Descargando desde: {video_link}...")
+            # Descargar el video (en streaming a la cache local; luego se sube al almacenamiento)
+            video_response = requests.get(video_link, stream=True, timeout=60) # Timeout más largo para descargas
+            video_response.raise_for_status()
+            # Archivo temporal + os.replace: otro worker puede estar bajando el mismo clip de la biblioteca
+            tmp_video_path = f"{local_video_path}.{os.getpid()}.part"
+            with open(tmp_video_path, 'wb') as f:
+                for chunk in video_response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+            os.replace(tmp_video_path, local_video_path)
+            storage.save_file(video_key)
+            print(f"[Stock Media Service - {project_id}] Video descargado exitosamente en: {local_video_path}")
+
+        if video_key.startswith(media_library_service.LIBRARY_VIDEOS_PREFIX):
+            media_library_service.register_clip(video_key, keywords, project_id, selected_video_info, selected_file)
+
+        # Devolver la clave (ruta relativa al WORKDIR) para que sea consistente con otras rutas de assets
+        return video_key # ej. outputs/media_library/videos/... u outputs/temp_assets/...
 
     except requests.exceptions.RequestException as e_req:
         print(f"[Stock Media Service - {project_id}] Error de red al contactar Pexels API o descargar video: {e_req}")
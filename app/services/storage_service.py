@@ -0,0 +1,279 @@
+# app/services/storage_service.py
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Configuración del almacenamiento de artefactos del proyecto (audios, guiones, assets, videos).
+# STORAGE_BACKEND: "local" (disco compartido, comportamiento original) o "s3" (S3 / MinIO).
+try:
+    from app.core.config import STORAGE_BACKEND
+except ImportError:
+    STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+
+try:
+    from app.core.config import S3_BUCKET, S3_ENDPOINT_URL, S3_REGION, S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY
+except ImportError:
+    S3_BUCKET = os.environ.get("S3_BUCKET", "video-generator")
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") # ej. http://minio:9000 para MinIO
+    S3_REGION = os.environ.get("S3_REGION", "us-east-1")
+    S3_ACCESS_KEY_ID = os.environ.get("S3_ACCESS_KEY_ID")
+    S3_SECRET_ACCESS_KEY = os.environ.get("S3_SECRET_ACCESS_KEY")
+
+try:
+    from app.core.config import S3_PRESIGNED_URL_EXPIRES_S
+except ImportError:
+    S3_PRESIGNED_URL_EXPIRES_S = 24 * 3600
+
+APP_BASE_DIR = "/usr/src/app"
+# Las claves de almacenamiento son rutas POSIX relativas al WORKDIR, ej. "outputs/audio/<project_id>/title/segment_001.mp3".
+# Son las mismas rutas relativas que ya guardábamos en script_data.json, así que los guiones existentes siguen siendo válidos.
+
+# Ruta de la API que entrega los archivos finales (app/api/v1/endpoints/video_delivery.py).
+# Solo se sirven claves bajo estos prefijos; en S3 la API redirige a una URL firmada.
+DELIVERY_BASE_PATH = "/api/v1/delivery/files"
+DELIVERABLE_PREFIXES = ("outputs/videos/", "outputs/subtitles/")
+
+# Tamaño de parte para las subidas multipart (streaming desde disco, sin cargar el archivo en memoria)
+MULTIPART_CHUNK_SIZE_BYTES = 8 * 1024 * 1024
+
+
+def storage_key(*parts: str) -> str:
+    """Construye una clave de almacenamiento a partir de sus partes (ej. 'outputs', 'videos', project_id, nombre)."""
+    return "/".join(p.strip("/") for p in parts if p)
+
+
+def key_from_local_path(local_path: str) -> str:
+    """Convierte una ruta local (absoluta o relativa al WORKDIR) en clave de almacenamiento."""
+    if os.path.isabs(local_path):
+        local_path = os.path.relpath(local_path, APP_BASE_DIR)
+    return local_path.replace(os.sep, "/")
+
+
+def is_deliverable_key(key: str) -> bool:
+    parts = key.split("/")
+    return key.startswith(DELIVERABLE_PREFIXES) and len(parts) >= 4 and not any(p in ("", ".", "..") for p in parts)
+
+
+def delivery_path(key: str) -> Optional[str]:
+    """Ruta de descarga/reproducción (con Range y ETag) de la clave en la API, o None si no se entrega."""
+    return f"{DELIVERY_BASE_PATH}/{key}" if is_deliverable_key(key) else None
+
+
+class LocalStorageBackend:
+    """
+    Backend en disco local / volumen compartido. Los archivos ya viven donde se escriben,
+    así que guardar es un no-op.
+    """
+    name = "local"
+
+    def __init__(self, base_dir: str = APP_BASE_DIR):
+        self.base_dir = base_dir
+
+    def local_path(self, key: str) -> str:
+        """Ruta local donde se debe escribir/leer el archivo de la clave (crea el directorio padre)."""
+        path = os.path.join(self.base_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def save_file(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.base_dir, key))
+
+    def ensure_local(self, key: str, refresh: bool = False) -> Optional[str]:
+        path = os.path.join(self.base_dir, key)
+        return path if os.path.exists(path) else None
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.base_dir, key))
+
+    def delete(self, key: str) -> bool:
+        path = os.path.join(self.base_dir, key)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def list_keys(self, prefix: str) -> List[str]:
+        root = os.path.join(self.base_dir, prefix)
+        keys = []
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                keys.append(key_from_local_path(os.path.join(dirpath, filename)))
+        return keys
+
+    def key_stats(self, prefix: str) -> Dict[str, Tuple[int, float]]:
+        """{clave: (bytes, última modificación epoch)} de los archivos bajo el prefijo."""
+        stats = {}
+        for key in self.list_keys(prefix):
+            try:
+                st = os.stat(os.path.join(self.base_dir, key))
+            except OSError: # Borrado entre el listado y el stat
+                continue
+            stats[key] = (st.st_size, st.st_mtime)
+        return stats
+
+    def presigned_url(self, key: str, expires_s: int = S3_PRESIGNED_URL_EXPIRES_S) -> Optional[str]:
+        # En disco local no hay URL firmada; el archivo se sirve desde el volumen compartido.
+        return None
+
+
+class S3StorageBackend:
+    """
+    Backend S3-compatible (AWS S3, MinIO...). Los workers escriben en una cache local
+    (read-through) y suben con multipart en streaming; las lecturas descargan solo si
+    el archivo no está ya en la cache local del nodo. Las claves mutables (calibración,
+    índice de la biblioteca, diario) se leen con refresh=True: la copia local se revalida
+    con el ETag del objeto.
+    La cache de cada nodo no se invalida desde los demás: un delete (o una sobrescritura) en
+    otro nodo solo se ve aquí al leer con refresh=True; sin refresh se sigue sirviendo la copia
+    local. Ver tests/test_storage_service.py.
+    """
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: Optional[str] = S3_REGION,
+        access_key_id: Optional[str] = S3_ACCESS_KEY_ID,
+        secret_access_key: Optional[str] = S3_SECRET_ACCESS_KEY,
+        cache_dir: str = APP_BASE_DIR
+    ):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.cache_dir = cache_dir
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._local_etags: Dict[str, str] = {} # ETag del objeto del que salió cada copia local descargada
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import boto3 # Import local: solo se necesita con este backend
+                    self._client = boto3.client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        region_name=self.region,
+                        aws_access_key_id=self.access_key_id,
+                        aws_secret_access_key=self.secret_access_key,
+                    )
+        return self._client
+
+    def _transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(
+            multipart_threshold=MULTIPART_CHUNK_SIZE_BYTES,
+            multipart_chunksize=MULTIPART_CHUNK_SIZE_BYTES,
+            use_threads=True,
+        )
+
+    def local_path(self, key: str) -> str:
+        path = os.path.join(self.cache_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def save_file(self, key: str) -> bool:
+        """Sube el archivo local de la clave al bucket (multipart en streaming para archivos grandes)."""
+        path = os.path.join(self.cache_dir, key)
+        if not os.path.exists(path):
+            print(f"[Storage S3] [WARN] No existe el archivo local para subir: {path}")
+            return False
+        try:
+            self.client.upload_file(path, self.bucket, key, Config=self._transfer_config())
+            self._local_etags.pop(key, None) # La copia local es la más nueva, pero su ETag no se conoce
+            return True
+        except Exception as e:
+            print(f"[Storage S3] Error al subir '{key}': {e}")
+            return False
+
+    def ensure_local(self, key: str, refresh: bool = False) -> Optional[str]:
+        """
+        Devuelve la ruta local de la clave, descargándola a la cache local si hace falta.
+        Con refresh=True la copia en cache se revalida (HEAD) y se vuelve a descargar si el objeto cambió.
+        """
+        path = os.path.join(self.cache_dir, key)
+        etag = None
+        if os.path.exists(path):
+            if not refresh:
+                return path
+            try:
+                etag = self.client.head_object(Bucket=self.bucket, Key=key)["ETag"]
+            except Exception as e:
+                if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    os.remove(path) # Se borró en el bucket: la copia local ya no vale
+                    return None
+                print(f"[Storage S3] [WARN] No se pudo revalidar '{key}', se usa la copia local: {e}")
+                return path
+            if etag == self._local_etags.get(key):
+                return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            if etag is None:
+                etag = self.client.head_object(Bucket=self.bucket, Key=key)["ETag"]
+            self.client.download_file(self.bucket, key, tmp_path, Config=self._transfer_config())
+            os.replace(tmp_path, path)
+            self._local_etags[key] = etag
+            return path
+        except Exception as e:
+            print(f"[Storage S3] No se pudo descargar '{key}': {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def delete(self, key: str) -> bool:
+        """Borra el objeto del bucket y la copia en la cache de ESTE nodo (las de otros nodos no)."""
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            print(f"[Storage S3] Error al eliminar '{key}': {e}")
+            return False
+        path = os.path.join(self.cache_dir, key)
+        if os.path.exists(path):
+            os.remove(path)
+        return True
+
+    def list_keys(self, prefix: str) -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []))
+        return keys
+
+    def key_stats(self, prefix: str) -> Dict[str, Tuple[int, float]]:
+        stats = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                stats[obj["Key"]] = (obj["Size"], obj["LastModified"].timestamp())
+        return stats
+
+    def presigned_url(self, key: str, expires_s: int = S3_PRESIGNED_URL_EXPIRES_S) -> Optional[str]:
+        try:
+            return self.client.generate_presigned_url(
+                "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires_s
+            )
+        except Exception as e:
+            print(f"[Storage S3] Error al generar URL firmada para '{key}': {e}")
+            return None
+
+
+@lru_cache(maxsize=1)
+def get_storage():
+    """Devuelve el backend de almacenamiento configurado (uno por proceso)."""
+    if STORAGE_BACKEND == "s3":
+        print(f"[Storage] Usando backend S3 (bucket='{S3_BUCKET}', endpoint='{S3_ENDPOINT_URL or 'AWS'}')")
+        return S3StorageBackend()
+    return LocalStorageBackend()
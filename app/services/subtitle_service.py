@@ -0,0 +1,153 @@
+# app/services/subtitle_service.py
+import os
+from typing import Dict, List, Optional, Tuple
+
+from app.services import storage_service
+
+# Estilo de los subtítulos ASS. Reproduce el del TextClip de video_assembly_service:
+# DejaVu Sans Bold 100, texto blanco con borde negro, centrado sobre un panel negro al 60%.
+#   panel_padding_px: margen del panel alrededor del texto (BorderStyle 3 de libass)
+try:
+    from app.core.config import CAPTION_STYLE
+except ImportError:
+    CAPTION_STYLE = {
+        "font_name": "DejaVu Sans",
+        "font_size": 100,
+        "outline_px": 4,
+        "panel_opacity": 0.6,
+        "panel_padding_px": 25,
+    }
+
+CAPTION_FONTS_DIR = "/usr/share/fonts/truetype/dejavu"
+SUBTITLES_PREFIX = "outputs/subtitles"
+
+CaptionEvent = Tuple[float, float, str] # (inicio_s, fin_s, texto) en la línea de tiempo del video
+
+
+def subtitle_keys(project_id: str) -> Dict[str, str]:
+    return {
+        "ass": storage_service.storage_key(SUBTITLES_PREFIX, project_id, "captions.ass"),
+        "srt": storage_service.storage_key(SUBTITLES_PREFIX, project_id, "captions.srt"),
+    }
+
+
+def build_caption_events(manifest, transition_duration_s: float = 1.0) -> List[CaptionEvent]:
+    """
+    Tiempos de cada subtítulo con las mismas reglas que el render: las frases de una escena van
+    seguidas según actual_tts_duration_ms y entre escenas hay un espaciador de transition_duration_s.
+    """
+    events: List[CaptionEvent] = []
+    timeline_s = 0.0
+    scenes_added = 0
+    for _, scene_segments in manifest.iter_scenes():
+        scene_duration_s = sum(s.get('actual_tts_duration_ms', 0) for s in scene_segments) / 1000.0
+        valid_segments = [s for s in scene_segments
+                          if s.get('text_chunk') and s.get('actual_tts_audio_url') and s.get('actual_tts_duration_ms', 0) > 0]
+        if scene_duration_s <= 0 or not valid_segments:
+            continue
+        scene_start_s = timeline_s + (transition_duration_s if scenes_added and transition_duration_s > 0 else 0.0)
+        current_s = scene_start_s
+        for segment_data in valid_segments:
+            duration_s = segment_data['actual_tts_duration_ms'] / 1000.0
+            events.append((current_s, current_s + duration_s, segment_data['text_chunk']))
+            current_s += duration_s
+        timeline_s = scene_start_s + scene_duration_s
+        scenes_added += 1
+    return events
+
+
+def _ass_time(seconds: float) -> str:
+    centiseconds = int(round(seconds * 100))
+    hours, rest = divmod(centiseconds, 360000)
+    minutes, rest = divmod(rest, 6000)
+    return f"{hours}:{minutes:02d}:{rest // 100:02d}.{rest % 100:02d}"
+
+
+def _srt_time(seconds: float) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, rest = divmod(milliseconds, 3600000)
+    minutes, rest = divmod(rest, 60000)
+    return f"{hours:02d}:{minutes:02d}:{rest // 1000:02d},{rest % 1000:03d}"
+
+
+def _ass_text(text: str) -> str:
+    # ASS no tiene escape para llaves ni barra invertida (abren bloques de override)
+    return " ".join(text.split()).replace("\\", "/").replace("{", "(").replace("}", ")")
+
+
+def render_ass(events: List[CaptionEvent], video_resolution: tuple, caption_width_px: int) -> str:
+    """
+    Documento ASS con dos capas por subtítulo: 'Panel' (texto invisible con caja opaca, BorderStyle 3)
+    y 'Caption' encima (texto blanco con borde). Los márgenes limitan el ancho al de caption_width_px.
+    """
+    width, height = video_resolution
+    side_margin = max(0, (width - caption_width_px) // 2)
+    panel_alpha = int(round((1.0 - CAPTION_STYLE["panel_opacity"]) * 255)) # En ASS 00 es opaco
+    style_fields = "Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding"
+    font, size = CAPTION_STYLE["font_name"], CAPTION_STYLE["font_size"]
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        f"Format: {style_fields}",
+        f"Style: Panel,{font},{size},&HFFFFFFFF,&HFFFFFFFF,&H{panel_alpha:02X}000000,&H{panel_alpha:02X}000000,-1,0,0,0,100,100,0,0,3,"
+        f"{CAPTION_STYLE['panel_padding_px']},0,5,{side_margin},{side_margin},0,1",
+        f"Style: Caption,{font},{size},&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,-1,0,0,0,100,100,0,0,1,"
+        f"{CAPTION_STYLE['outline_px']},0,5,{side_margin},{side_margin},0,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for start_s, end_s, text in events:
+        for layer, style in ((0, "Panel"), (1, "Caption")):
+            lines.append(f"Dialogue: {layer},{_ass_time(start_s)},{_ass_time(end_s)},{style},,0,0,0,,{_ass_text(text)}")
+    return "\n".join(lines) + "\n"
+
+
+def render_srt(events: List[CaptionEvent]) -> str:
+    blocks = [f"{index}\n{_srt_time(start_s)} --> {_srt_time(end_s)}\n{' '.join(text.split())}\n"
+              for index, (start_s, end_s, text) in enumerate(events, start=1)]
+    return "\n".join(blocks)
+
+
+def write_subtitle_files(
+    project_id: str,
+    events: List[CaptionEvent],
+    video_resolution: tuple,
+    caption_width_px: int
+) -> Optional[Dict[str, str]]:
+    """Escribe captions.ass y captions.srt del proyecto. Devuelve {formato: ruta local} o None."""
+    if not events:
+        print(f"[Subtitles - {project_id}] No hay subtítulos que escribir.")
+        return None
+    storage = storage_service.get_storage()
+    contents = {"ass": render_ass(events, video_resolution, caption_width_px), "srt": render_srt(events)}
+    local_paths = {}
+    for subtitle_format, key in subtitle_keys(project_id).items():
+        local_path = storage.local_path(key)
+        try:
+            with open(local_path, "w", encoding="utf-8") as f:
+                f.write(contents[subtitle_format])
+        except Exception as e:
+            print(f"[Subtitles - {project_id}] Error al escribir {key}: {e}")
+            return None
+        if not storage.save_file(key):
+            print(f"[Subtitles - {project_id}] [WARN] No se pudo guardar '{key}' en el almacenamiento ({storage.name}).")
+        local_paths[subtitle_format] = local_path
+    print(f"[Subtitles - {project_id}] {len(events)} subtítulos escritos (ASS y SRT).")
+    return local_paths
+
+
+def _escape_filter_value(value: str) -> str:
+    # Dentro de comillas simples de un filtergraph todo es literal salvo la propia comilla
+    return value.replace("'", "'\\''")
+
+
+def burn_in_filter(ass_path: str) -> str:
+    """Filtro de ffmpeg (libass) que dibuja los subtítulos ASS sobre el video."""
+    return f"subtitles=filename='{_escape_filter_value(os.path.abspath(ass_path))}':fontsdir='{CAPTION_FONTS_DIR}'"
@@ -1,10 +1,47 @@
 # app/services/tts_service.py
-from typing import Optional
-from google.cloud import texttospeech
+from typing import Optional, List, Tuple
+from xml.sax.saxutils import escape as xml_escape
+import json
 import os # Para manejar rutas de archivos
-from mutagen.mp3 import MP3
+import shutil
+import subprocess
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from app.services import storage_service, rate_limiter_service
+# google.cloud.texttospeech y mutagen se importan dentro de las funciones que los usan (arranque rápido).
 #from app.core.config import GOOGLE_APPLICATION_CREDENTIALS_PATH # Necesitaremos definir esta variable en config.py si no usamos la variable de entorno global
 
+# Motores TTS (se elige por proyecto con get_tts_backend):
+#   "google": Google Cloud TTS (red y costo por carácter; timepoints SSML para el modo por bloque)
+#   "local":  motor en CPU sin red (espeak-ng o piper) para borradores; sintetiza lotes de frases
+#             en LOCAL_TTS_WORKERS procesos en paralelo y escribe WAV
+#   LOCAL_TTS_ENGINE:      "espeak-ng" (viene en la imagen) o "piper" (mejor voz, requiere el binario y el modelo .onnx)
+#   LOCAL_TTS_WORKERS:     procesos de síntesis simultáneos por tarea (None = núcleos del worker)
+#   LOCAL_TTS_TIMEOUT_S:   plazo de cada proceso del motor local = base_s + per_sentence_s * frases
+# El motor se elige por proyecto y no por perfil de salida: la narración se sintetiza una vez en la
+# tarea del guion y todas las salidas (OUTPUT_PROFILES) del ensamblaje comparten esos audios. El motor
+# local usa los ejecutables de espeak-ng/piper en subprocesos (uno por lote) porque no tienen bindings
+# de Python en la imagen; así cada proceso aprovecha un núcleo sin el GIL.
+try:
+    from app.core.config import TTS_BACKEND_DEFAULT
+except ImportError:
+    TTS_BACKEND_DEFAULT = "google"
+try:
+    from app.core.config import LOCAL_TTS_ENGINE, LOCAL_TTS_ESPEAK_VOICE, LOCAL_TTS_ESPEAK_SPEED, LOCAL_TTS_PIPER_MODEL, LOCAL_TTS_WORKERS
+except ImportError:
+    LOCAL_TTS_ENGINE = "espeak-ng"
+    LOCAL_TTS_ESPEAK_VOICE = "es-419"
+    LOCAL_TTS_ESPEAK_SPEED = 165 # Palabras por minuto
+    LOCAL_TTS_PIPER_MODEL = "/usr/src/app/assets/tts/es_MX-ald-medium.onnx"
+    LOCAL_TTS_WORKERS = None
+try:
+    from app.core.config import LOCAL_TTS_TIMEOUT_S
+except ImportError:
+    LOCAL_TTS_TIMEOUT_S = {"base_s": 30, "per_sentence_s": 10}
+
+GOOGLE_TTS_VOICE_NAME = "es-US-Wavenet-A"
+
 # Es recomendable que la librería cliente de Google use la variable de entorno
 # GOOGLE_APPLICATION_CREDENTIALS automáticamente si está configurada.
 # Si no, puedes especificar explícitamente el archivo de credenciales al crear el cliente,
@@ -14,16 +51,30 @@ from mutagen.mp3 import MP3
 # Si configuraste GOOGLE_APPLICATION_CREDENTIALS en docker-compose.yml,
 # la librería debería encontrarlo automáticamente.
 
+@lru_cache(maxsize=None)
+def get_tts_client(api_version: str = "v1"):
+    """
+    Cliente de Google TTS del proceso ("v1" o "v1beta1"). Crearlo carga credenciales y abre el
+    canal gRPC, así que se reutiliza entre requests (el worker lo crea al arrancar).
+    """
+    if api_version == "v1beta1":
+        from google.cloud import texttospeech_v1beta1
+        return texttospeech_v1beta1.TextToSpeechClient()
+    from google.cloud import texttospeech
+    return texttospeech.TextToSpeechClient()
+
+
 def synthesize_text_to_audio_file(
     text_to_speak: str, 
     output_filename: str, # Solo el nombre del archivo, ej. segment_001.mp3
     base_output_dir: str = "outputs/audio", # Directorio base donde se creará la subcarpeta del proyecto
     project_id: str = "default_project", # Para crear una subcarpeta
     type_subfolder: Optional[str] = None,
-    voice_name: str = "es-US-Wavenet-A"
+    voice_name: str = GOOGLE_TTS_VOICE_NAME
 ) -> Optional[str]:
     try:
-        client = texttospeech.TextToSpeechClient()
+        from google.cloud import texttospeech
+        client = get_tts_client()
         input_text = texttospeech.SynthesisInput(text=text_to_speak)
         voice = texttospeech.VoiceSelectionParams(
             language_code=voice_name.split('-')[0] + "-" + voice_name.split('-')[1],
@@ -32,43 +83,318 @@ def synthesize_text_to_audio_file(
         audio_config = texttospeech.AudioConfig(
             audio_encoding=texttospeech.AudioEncoding.MP3
         )
-        response = client.synthesize_speech(
+        response = rate_limiter_service.call_with_rate_limit(
+            "google_tts",
+            client.synthesize_speech,
             request={"input": input_text, "voice": voice, "audio_config": audio_config}
         )
 
-        # Construir la ruta de salida
+        # Construir la clave de salida (ruta relativa al WORKDIR, ej. outputs/audio/<project_id>/title/segment_001.mp3)
         path_parts = [base_output_dir, project_id]
         if type_subfolder: # Si se proporciona una subcarpeta de tipo, la añadimos
             path_parts.append(type_subfolder)
+        path_parts.append(output_filename)
+        audio_key = storage_service.storage_key(*path_parts)
+
+        storage = storage_service.get_storage()
+        with open(storage.local_path(audio_key), "wb") as out_file:
+            out_file.write(response.audio_content)
+        storage.save_file(audio_key)
+        return audio_key
+    except Exception as e:
+        print(f"Error al sintetizar texto con Google Cloud TTS: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return None
+
+# Google TTS acepta hasta 5000 bytes de entrada por request; dejamos margen para las etiquetas SSML.
+SSML_MAX_INPUT_BYTES = 4500
 
-        current_output_dir = os.path.join(*path_parts) # Une todas las partes de la ruta
-        os.makedirs(current_output_dir, exist_ok=True) # Crea el directorio final si no existe
 
-        output_filepath = os.path.join(current_output_dir, output_filename)
+def _voice_language_code(voice_name: str) -> str:
+    return voice_name.split('-')[0] + "-" + voice_name.split('-')[1]
 
-        with open(output_filepath, "wb") as out_file:
+
+def build_ssml_with_marks(sentences: List[str]) -> str:
+    """Construye un documento SSML con un <mark name="sN"/> antes de cada frase."""
+    parts = [f'<mark name="s{i}"/>{xml_escape(sentence)}' for i, sentence in enumerate(sentences)]
+    return "<speak>" + " ".join(parts) + "</speak>"
+
+
+def split_sentences_for_ssml(sentences: List[str], max_bytes: int = SSML_MAX_INPUT_BYTES) -> List[List[str]]:
+    """
+    Agrupa frases consecutivas en partes cuyo SSML no exceda el límite de bytes del API.
+    Normalmente un bloque entero cabe en una sola parte.
+    """
+    parts, current_part = [], []
+    for sentence in sentences:
+        candidate = current_part + [sentence]
+        if current_part and len(build_ssml_with_marks(candidate).encode("utf-8")) > max_bytes:
+            parts.append(current_part)
+            candidate = [sentence]
+        current_part = candidate
+    if current_part:
+        parts.append(current_part)
+    return parts
+
+
+def synthesize_sentences_with_timepoints(
+    sentences: List[str],
+    output_filename: str, # ej. block_01.mp3
+    base_output_dir: str = "outputs/audio",
+    project_id: str = "default_project",
+    type_subfolder: Optional[str] = None,
+    voice_name: str = GOOGLE_TTS_VOICE_NAME
+) -> Optional[Tuple[str, List[int]]]:
+    """
+    Sintetiza varias frases en UN solo archivo de audio enviando SSML con <mark> entre frases
+    y pidiendo timepoints. Devuelve (clave_del_audio, offsets_ms_de_cada_frase) o None.
+    """
+    if not sentences:
+        return None
+    try:
+        # Los timepoints de SSML marks solo están en la API v1beta1
+        from google.cloud import texttospeech_v1beta1
+
+        client = get_tts_client("v1beta1")
+        request = texttospeech_v1beta1.SynthesizeSpeechRequest(
+            input=texttospeech_v1beta1.SynthesisInput(ssml=build_ssml_with_marks(sentences)),
+            voice=texttospeech_v1beta1.VoiceSelectionParams(
+                language_code=_voice_language_code(voice_name), name=voice_name
+            ),
+            audio_config=texttospeech_v1beta1.AudioConfig(
+                audio_encoding=texttospeech_v1beta1.AudioEncoding.MP3
+            ),
+            enable_time_pointing=[texttospeech_v1beta1.SynthesizeSpeechRequest.TimepointType.SSML_MARK],
+        )
+        response = rate_limiter_service.call_with_rate_limit("google_tts", client.synthesize_speech, request=request)
+
+        mark_times_ms = {tp.mark_name: int(tp.time_seconds * 1000) for tp in response.timepoints}
+        sentence_offsets_ms = []
+        for i in range(len(sentences)):
+            if f"s{i}" not in mark_times_ms:
+                print(f"[TTS SSML] [WARN] Falta el timepoint del mark 's{i}' ({len(mark_times_ms)}/{len(sentences)} recibidos).")
+                return None
+            sentence_offsets_ms.append(mark_times_ms[f"s{i}"])
+        sentence_offsets_ms[0] = 0 # La primera frase incluye el posible silencio inicial
+
+        path_parts = [base_output_dir, project_id]
+        if type_subfolder:
+            path_parts.append(type_subfolder)
+        path_parts.append(output_filename)
+        audio_key = storage_service.storage_key(*path_parts)
+
+        storage = storage_service.get_storage()
+        with open(storage.local_path(audio_key), "wb") as out_file:
             out_file.write(response.audio_content)
-        return output_filepath
+        storage.save_file(audio_key)
+        return audio_key, sentence_offsets_ms
     except Exception as e:
-        print(f"Error al sintetizar texto con Google Cloud TTS: {e}")
+        print(f"Error al sintetizar SSML con timepoints en Google Cloud TTS: {e}")
         import traceback
         print(traceback.format_exc())
         return None
 
 def get_audio_duration_ms(audio_filepath: str) -> Optional[int]:
     """
-    Obtiene la duración de un archivo de audio MP3 en milisegundos.
-    Retorna None si hay un error o el archivo no es MP3 válido.
+    Obtiene la duración de un archivo de audio MP3 (Google) o WAV (motor local) en milisegundos.
+    Retorna None si hay un error o el archivo no es válido.
     """
     try:
-        audio = MP3(audio_filepath)
+        local_audio_path = storage_service.get_storage().ensure_local(audio_filepath) or audio_filepath
+        if local_audio_path.lower().endswith(".wav"):
+            with wave.open(local_audio_path, "rb") as wav_file: # Solo lee el header
+                return int(wav_file.getnframes() * 1000 / wav_file.getframerate())
+        from mutagen.mp3 import MP3
+        audio = MP3(local_audio_path)
         duration_seconds = audio.info.length
         duration_milliseconds = int(duration_seconds * 1000)
         return duration_milliseconds
     except Exception as e:
         print(f"Error al obtener la duración del audio de '{audio_filepath}': {e}")
         return None
-    
+
+
+def _audio_key(base_output_dir: str, project_id: str, type_subfolder: Optional[str], output_filename: str) -> str:
+    path_parts = [base_output_dir, project_id]
+    if type_subfolder:
+        path_parts.append(type_subfolder)
+    path_parts.append(output_filename)
+    return storage_service.storage_key(*path_parts)
+
+
+class GoogleTTSBackend:
+    """Google Cloud TTS: una llamada por frase, o un request SSML con marks por bloque."""
+
+    name = "google"
+    audio_extension = "mp3"
+
+    def __init__(self, voice_name: str = GOOGLE_TTS_VOICE_NAME):
+        self.voice_name = voice_name
+
+    @property
+    def voice_id(self) -> str:
+        return self.voice_name # Nombre de la entrada de calibración de velocidad de habla
+
+    def warm(self) -> str:
+        get_tts_client()
+        get_tts_client("v1beta1")
+        return "google tts v1, v1beta1"
+
+    def synthesize_batch(self, sentences: List[str], output_filenames: List[str], project_id: str,
+                         type_subfolder: Optional[str] = None) -> List[Optional[str]]:
+        # El ritmo lo marca el rate limiter compartido de google_tts, no el paralelismo local
+        return [
+            synthesize_text_to_audio_file(text_to_speak=sentence, output_filename=filename, project_id=project_id,
+                                          type_subfolder=type_subfolder, voice_name=self.voice_name)
+            for sentence, filename in zip(sentences, output_filenames)
+        ]
+
+    def split_block(self, sentences: List[str]) -> List[List[str]]:
+        return split_sentences_for_ssml(sentences)
+
+    def synthesize_block(self, sentences: List[str], output_filename: str, project_id: str,
+                         type_subfolder: Optional[str] = None) -> Optional[Tuple[str, List[int]]]:
+        return synthesize_sentences_with_timepoints(sentences=sentences, output_filename=output_filename, project_id=project_id,
+                                                    type_subfolder=type_subfolder, voice_name=self.voice_name)
+
+
+class LocalTTSBackend:
+    """
+    Motor TTS local en CPU (espeak-ng o piper), sin red ni costo por carácter. Los lotes se reparten
+    entre LOCAL_TTS_WORKERS procesos; piper carga el modelo una vez por proceso y lee las frases
+    como JSON por stdin. El modo por bloque concatena los WAV de las frases y los offsets son exactos.
+    """
+
+    name = "local"
+    audio_extension = "wav"
+
+    def __init__(self, engine: str = LOCAL_TTS_ENGINE):
+        if engine not in ("espeak-ng", "piper"):
+            raise ValueError(f"Motor TTS local desconocido: '{engine}'")
+        self.engine = engine
+        self.workers = max(1, LOCAL_TTS_WORKERS or os.cpu_count() or 1)
+
+    @property
+    def voice_id(self) -> str:
+        if self.engine == "piper":
+            return f"piper:{os.path.splitext(os.path.basename(LOCAL_TTS_PIPER_MODEL))[0]}"
+        return f"espeak-ng:{LOCAL_TTS_ESPEAK_VOICE}:{LOCAL_TTS_ESPEAK_SPEED}"
+
+    def _binary(self) -> str:
+        binary = shutil.which(self.engine)
+        if binary is None:
+            raise RuntimeError(f"No se encontró el binario '{self.engine}' en el PATH")
+        return binary
+
+    def warm(self) -> str:
+        binary = self._binary()
+        if self.engine == "piper" and not os.path.exists(LOCAL_TTS_PIPER_MODEL):
+            raise RuntimeError(f"No existe el modelo de piper '{LOCAL_TTS_PIPER_MODEL}'")
+        return f"{binary} ({self.voice_id}, {self.workers} procesos)"
+
+    def _run_espeak(self, sentence: str, output_path: str):
+        subprocess.run(
+            [self._binary(), "-v", LOCAL_TTS_ESPEAK_VOICE, "-s", str(LOCAL_TTS_ESPEAK_SPEED), "-w", output_path, "--stdin"],
+            input=sentence.encode("utf-8"), capture_output=True, check=True,
+            timeout=LOCAL_TTS_TIMEOUT_S["base_s"] + LOCAL_TTS_TIMEOUT_S["per_sentence_s"]
+        )
+
+    def _run_piper(self, jobs: List[Tuple[str, str]]):
+        lines = "".join(json.dumps({"text": sentence, "output_file": path}, ensure_ascii=False) + "\n" for sentence, path in jobs)
+        subprocess.run(
+            [self._binary(), "--model", LOCAL_TTS_PIPER_MODEL, "--json-input", "--quiet"],
+            input=lines.encode("utf-8"), capture_output=True, check=True,
+            timeout=LOCAL_TTS_TIMEOUT_S["base_s"] + LOCAL_TTS_TIMEOUT_S["per_sentence_s"] * len(jobs)
+        )
+
+    def _synthesize_to_paths(self, jobs: List[Tuple[str, str]]):
+        """Sintetiza cada (frase, ruta_wav) en paralelo. Las frases que fallan quedan sin archivo."""
+        for _, path in jobs:
+            if os.path.exists(path):
+                os.remove(path) # Un WAV viejo no debe pasar por uno recién generado
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs))) as executor:
+            if self.engine == "piper":
+                # Un proceso por porción contigua del lote: el modelo se carga una vez por proceso
+                chunk_size = -(-len(jobs) // min(self.workers, len(jobs)))
+                chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+                futures = [executor.submit(self._run_piper, chunk) for chunk in chunks]
+            else:
+                futures = [executor.submit(self._run_espeak, sentence, path) for sentence, path in jobs]
+            for future in futures:
+                try:
+                    future.result()
+                except subprocess.CalledProcessError as e:
+                    print(f"[TTS Local] Error de {self.engine} (código {e.returncode}): {e.stderr.decode('utf-8', 'replace')[-500:]}")
+                except Exception as e:
+                    print(f"[TTS Local] Error al sintetizar con {self.engine}: {e}")
+
+    def synthesize_batch(self, sentences: List[str], output_filenames: List[str], project_id: str,
+                         type_subfolder: Optional[str] = None) -> List[Optional[str]]:
+        if not sentences:
+            return []
+        storage = storage_service.get_storage()
+        keys = [_audio_key("outputs/audio", project_id, type_subfolder, filename) for filename in output_filenames]
+        self._synthesize_to_paths([(sentence, storage.local_path(key)) for sentence, key in zip(sentences, keys)])
+        results = []
+        for key in keys:
+            path = storage.local_path(key)
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                storage.save_file(key)
+                results.append(key)
+            else:
+                results.append(None)
+        return results
+
+    def split_block(self, sentences: List[str]) -> List[List[str]]:
+        return [sentences] if sentences else [] # Sin límite de bytes por request
+
+    def synthesize_block(self, sentences: List[str], output_filename: str, project_id: str,
+                         type_subfolder: Optional[str] = None) -> Optional[Tuple[str, List[int]]]:
+        if not sentences:
+            return None
+        storage = storage_service.get_storage()
+        block_key = _audio_key("outputs/audio", project_id, type_subfolder, output_filename)
+        block_path = storage.local_path(block_key)
+        part_paths = [f"{block_path}.part{i:03d}.wav" for i in range(len(sentences))]
+        try:
+            self._synthesize_to_paths(list(zip(sentences, part_paths)))
+            missing = [i for i, path in enumerate(part_paths) if not os.path.exists(path)]
+            if missing:
+                print(f"[TTS Local] [WARN] Fallaron {len(missing)}/{len(sentences)} frases del bloque '{output_filename}'.")
+                return None
+            sentence_offsets_ms, frames_written = [], 0
+            with wave.open(block_path, "wb") as block_wav:
+                for i, part_path in enumerate(part_paths):
+                    with wave.open(part_path, "rb") as part_wav:
+                        if i == 0:
+                            block_wav.setparams(part_wav.getparams())
+                        sentence_offsets_ms.append(int(frames_written * 1000 / part_wav.getframerate()))
+                        block_wav.writeframes(part_wav.readframes(part_wav.getnframes()))
+                        frames_written += part_wav.getnframes()
+            storage.save_file(block_key)
+            return block_key, sentence_offsets_ms
+        except Exception as e:
+            print(f"[TTS Local] Error al armar el bloque '{output_filename}': {e}")
+            return None
+        finally:
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+
+TTS_BACKENDS = {"google": GoogleTTSBackend, "local": LocalTTSBackend}
+
+
+@lru_cache(maxsize=None)
+def get_tts_backend(name: Optional[str] = None):
+    """Devuelve el motor TTS pedido (o TTS_BACKEND_DEFAULT), uno por proceso."""
+    name = name or TTS_BACKEND_DEFAULT
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"Motor TTS desconocido: '{name}'. Opciones: {sorted(TTS_BACKENDS)}")
+    return TTS_BACKENDS[name]()
+
+
 if __name__ == "__main__":
     print("Probando síntesis de voz y obtención de duración...")
     
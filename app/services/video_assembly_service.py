@@ -1,74 +1,191 @@
 # app/services/video_assembly_service.py
-from moviepy import (AudioFileClip, ColorClip, TextClip, ImageClip, VideoFileClip,
-                     CompositeVideoClip, CompositeAudioClip, vfx,concatenate_videoclips) # concatenate_videoclips ya no se usa para la composición principal de segmentos
+# MoviePy se importa dentro de las funciones que lo usan: este módulo lo importan también
+# workers que no renderizan (y cargar MoviePy/numpy/imageio cuesta segundos al arrancar).
 # Asegúrate que fx.all.loop y tools.cuts.subclip estén disponibles si los usas
 # from moviepy.video.fx.all import loop # Si fx.all.loop es la forma de loopear
 # from moviepy.video.tools.cuts import subclip # Si subclip es una función importada
 
 import os
+import math
+import bisect
 import uuid
-import json
-from typing import List, Dict, Optional
-from collections import OrderedDict
+import shutil
+import tempfile
+import traceback
+from typing import List, Dict, Optional, Any
 
-transition_video_relative_path = "assets/videos/transi-5.mp4" 
-transition_video_full_path_in_container = os.path.join("/usr/src/app/", transition_video_relative_path)
+from app.services import asset_cache_service, ffmpeg_utils, storage_service, script_manifest_service, profiling_service, subtitle_service
 
 
+# Perfiles de salida para el modo multi-salida: resolución destino y escalera de bitrate.
+# Se pueden sobreescribir desde app/core/config.py con OUTPUT_PROFILES.
+try:
+    from app.core.config import OUTPUT_PROFILES
+except ImportError:
+    OUTPUT_PROFILES = {
+        "landscape_1080p": {"resolution": (1920, 1080), "video_bitrate": "8M", "maxrate": "10M", "bufsize": "16M", "audio_bitrate": "192k"},
+        "shorts_1080x1920": {"resolution": (1080, 1920), "video_bitrate": "6M", "maxrate": "8M", "bufsize": "12M", "audio_bitrate": "160k"},
+        "landscape_720p": {"resolution": (1280, 720), "video_bitrate": "4M", "maxrate": "5M", "bufsize": "8M", "audio_bitrate": "128k"},
+    }
+
+# Compositor de frames: "flat" (línea de tiempo plana con buffers NumPy preasignados) o
+# "moviepy" (grafo anidado de CompositeVideoClip/concatenate_videoclips).
+try:
+    from app.core.config import VIDEO_COMPOSITOR
+except ImportError:
+    VIDEO_COMPOSITOR = "flat"
+
+# Subtítulos: "textclip" (TextClip de MoviePy dibujado por el compositor), "burn_in" (ASS dibujado
+# por libass dentro de la misma codificación) o "soft" (pista mov_text seleccionable en el MP4).
+# En todos los modos se generan captions.ass/.srt descargables en outputs/subtitles/<project_id>/.
+try:
+    from app.core.config import CAPTION_MODE
+except ImportError:
+    CAPTION_MODE = "burn_in"
+CAPTION_MODES = ("textclip", "burn_in", "soft")
+
+# Escritor de frames del render: "pipe" (RawFramePipeWriter: memoryview + doble buffer, sin copias)
+# o "moviepy" (write_videofile, que copia cada frame con tobytes() antes de escribirlo al pipe).
+try:
+    from app.core.config import FRAME_WRITER
+except ImportError:
+    FRAME_WRITER = "pipe"
+
+# Cache por proceso worker de los clips espaciadores (negros) entre escenas: (ancho, alto, duración) -> ColorClip
+_transition_spacer_clips: Dict[tuple, Any] = {}
+
+def get_transition_spacer_clip(video_resolution: tuple, duration_s: float):
+    """Devuelve el ColorClip negro usado entre escenas, reutilizándolo entre renders."""
+    from moviepy import ColorClip
+    cache_key = (int(video_resolution[0]), int(video_resolution[1]), round(duration_s, 3))
+    spacer_clip = _transition_spacer_clips.get(cache_key)
+    if spacer_clip is None:
+        spacer_clip = ColorClip(size=video_resolution, color=(0,0,0), duration=duration_s)
+        _transition_spacer_clips[cache_key] = spacer_clip
+    return spacer_clip
+
     
     
+CAPTION_FONT_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf' # O tu fuente
+
+
+def _build_caption_clip(text_content: str, duration_s: float, caption_width_px: int, video_resolution: tuple):
+    """Subtítulo (texto con borde sobre un panel negro semitransparente) del tamaño del panel."""
+    from moviepy import ColorClip, TextClip, CompositeVideoClip
+    txt_clip_raw = TextClip(
+        font=CAPTION_FONT_PATH, text=text_content, font_size=100, color='white',
+        size=(caption_width_px, None), method='caption', text_align='center',
+        interline=-5, stroke_color='black', stroke_width=4,
+        duration=duration_s
+    )
+
+    text_actual_width, text_actual_height = txt_clip_raw.size
+
+    # --- 2. Crear el Panel de Fondo Semi-Transparente para el Texto ---
+    # Hacemos el panel un poco más grande que el texto para tener padding.
+    padding_x = 60 # Padding horizontal para el panel (30px a cada lado)
+    padding_y = 40 # Padding vertical para el panel (20px arriba/abajo)
+
+    panel_width = text_actual_width + padding_x
+    panel_height = text_actual_height + padding_y
+
+    # Asegurarse que el panel no exceda el ancho del video
+    panel_width = min(panel_width, video_resolution[0])
+    # (Podríamos añadir lógica similar para la altura si fuera necesario)
+
+    panel_clip = ColorClip(
+        size=(panel_width, panel_height), 
+        color=(0, 0, 0), # Color negro para el panel
+        is_mask=False, 
+        duration=duration_s
+    ).with_opacity(0.6) # <--- Opacidad del panel (0.0 transparente, 1.0 opaco). 0.5-0.7 suele funcionar bien.
+
+     # --- 3. Componer el Texto sobre el Panel ---
+    # Primero, posicionar el texto raw en el centro del panel_clip
+    txt_clip_on_panel = txt_clip_raw
+    txt_clip_on_panel.pos = lambda t: ('center','center')
+     # Componer el panel y el texto. El texto va encima.
+    txt_clip = CompositeVideoClip(
+        [panel_clip, txt_clip_on_panel], 
+        size=(panel_width, panel_height) # El tamaño del clip compuesto es el del panel
+    )
+    return txt_clip
+
+
+def warm_caption_rendering(video_resolution: tuple = (1920, 1080)):
+    """
+    Dibuja un subtítulo de prueba para que el primer render no pague la carga de FreeType,
+    la lectura de la fuente ni la primera composición de TextClip con NumPy.
+    """
+    caption_clip = _build_caption_clip("Calentando subtítulos", 1.0, int(video_resolution[0] * 0.80), video_resolution)
+    caption_clip.get_frame(0)
+    caption_clip.close()
+
+
+def _cover_size(source_size: tuple, video_resolution: tuple) -> tuple:
+    """Tamaño escalado que cubre la resolución destino; se redondea hacia arriba para no quedar un píxel corto."""
+    (current_w, current_h), (target_w, target_h) = source_size, video_resolution
+    ratio = max(target_w / current_w, target_h / current_h)
+    return (max(target_w, math.ceil(current_w * ratio - 1e-6)), max(target_h, math.ceil(current_h * ratio - 1e-6)))
+
+
+def _build_image_background(image_path: str, video_resolution: tuple, duration_s: float):
+    """ImageClip escalado para cubrir la resolución destino y recortado al centro."""
+    from moviepy import ImageClip
+    target_w, target_h = video_resolution
+    img_clip_orig = ImageClip(image_path)
+    img_clip_resized = img_clip_orig.resized(_cover_size(img_clip_orig.size, video_resolution))
+    w, h = img_clip_resized.size; x_offset = (w - target_w) // 2; y_offset = (h - target_h) // 2
+    img_clip_cropped = img_clip_resized.cropped(x1=x_offset, y1=y_offset, x2=x_offset + target_w, y2=y_offset + target_h)
+    return img_clip_cropped.with_duration(duration_s)
+
+
+def _open_video_background(video_path: str, video_resolution: tuple):
+    """VideoFileClip (sin audio) escalado para cubrir la resolución destino y recortado al centro."""
+    from moviepy import VideoFileClip
+    target_w, target_h = video_resolution
+    video_clip_orig = VideoFileClip(video_path, audio=False)
+    video_clip_resized = video_clip_orig.resized(_cover_size(video_clip_orig.size, video_resolution))
+    w, h = video_clip_resized.size; x_offset = (w - target_w) // 2; y_offset = (h - target_h) // 2
+    return video_clip_resized.cropped(x1=x_offset, y1=y_offset, x2=x_offset + target_w, y2=y_offset + target_h)
+
+
 # Para la función loop, si fx.all.loop no existe, y .loop() tampoco,
 # podríamos necesitar una función helper para loopear manualmente con concatenate_videoclips,
 # o confiar en que el video de fondo sea suficientemente largo o que .with_duration() congele el último frame.
 # Por ahora, intentaremos usar un .loop() si existe o .with_duration() como fallback para extender.
 
-def assemble_video_from_script(
+def _compose_final_video(
     project_id: str,
-    output_filename: str = "final_video.mp4",
     video_resolution: tuple = (1920, 1080),
-    fps: int = 24,
-    transition_duration_s: float = 1.0
-) -> Optional[str]:
-    transition_clip = get_transition_clip() # Obtener el video de transición
+    transition_duration_s: float = 1.0,
+    caption_max_width_px: Optional[int] = None # Ancho máximo de los subtítulos (por defecto 80% del ancho)
+):
+    """
+    Construye el clip final (escenas + transiciones) sin escribirlo a disco.
+    Devuelve None si no se pudo componer.
+    """
+    from moviepy import AudioFileClip, ColorClip, CompositeVideoClip, concatenate_videoclips
     print(f"\n[Video Assembly] Iniciando ensamblaje con FONDO CONTINUO para el proyecto: {project_id}")
-    # 1. Cargar script_segments desde el archivo JSON
-    script_file_path_container = os.path.join("/usr/src/app/outputs/scripts", project_id, "script_data.json")
-    if not os.path.exists(script_file_path_container):
-        print(f"[ERROR] No se encontró el archivo de guion: {script_file_path_container}")
+    storage = storage_service.get_storage()
+    # 1. Abrir el manifiesto del guion (los proyectos con script_data.json se migran al vuelo).
+    # Solo se lee el header; los segmentos de cada escena se cargan al procesarla.
+    manifest = script_manifest_service.open_project_manifest(project_id)
+    if manifest is None:
+        print(f"[ERROR] No se encontró el guion del proyecto: {project_id} (almacenamiento: {storage.name})")
         return None
-    try:
-        with open(script_file_path_container, 'r', encoding='utf-8') as f:
-            script_segments = json.load(f)
-        if not script_segments:
-            print("[ERROR] El guion JSON está vacío.")
-            return None
-        print(f"[INFO] Guion cargado: {len(script_segments)} segmentos.")
-    except Exception as e_load:
-        print(f"[ERROR] Error al cargar o parsear el archivo de guion JSON: {e_load}")
-        return None
-    # --- Agrupar segmentos por 'source_type' para crear "escenas" ---
-    # Usamos OrderedDict para intentar mantener un orden de aparición lógico
-    scenes_dict = OrderedDict()
-    for seg in script_segments:
-        source_type = seg.get("source_type", f"unknown_scene_{seg.get('segment_order', 0)}")
-        if source_type not in scenes_dict:
-            scenes_dict[source_type] = {
-                "segments": [],
-                "visual_type": seg.get("visual_type"), # Tomar del primer segmento de la escena
-                "visual_asset_url": seg.get("visual_asset_url"),
-                "is_loopable": seg.get("visual_asset_url_is_loopable", False)
-            }
-        scenes_dict[source_type]["segments"].append(seg)
-    if not scenes_dict:
-        print("[ERROR] No se pudieron agrupar segmentos en escenas.")
+    if not manifest.scenes:
+        print("[ERROR] El guion no tiene escenas.")
         return None
+    print(f"[INFO] Guion cargado: {len(manifest.scenes)} escenas, {manifest.total_segments} segmentos.")
 
     all_final_scene_clips_with_audio = [] # Aquí guardaremos los clips de cada escena completa
-    font_to_use = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf' # O tu fuente
+    source_audio_clips = {} # ruta local -> AudioFileClip abierto (compartido entre frases del mismo archivo)
     target_w, target_h = video_resolution
+    caption_width_px = caption_max_width_px or int(target_w * 0.80)
     # --- Iterar sobre cada ESCENA ---
-    for scene_name, scene_data in scenes_dict.items():
-        current_scene_individual_segments = scene_data["segments"]
+    for scene_data, current_scene_individual_segments in manifest.iter_scenes():
+        scene_name = scene_data["name"]
         print(f"\n  Procesando Escena: '{scene_name}' con {len(current_scene_individual_segments)} segmentos de texto.")
 
         scene_narration_duration_s = sum(s.get('actual_tts_duration_ms', 0) for s in current_scene_individual_segments) / 1000.0
@@ -85,11 +202,22 @@ def assemble_video_from_script(
             actual_audio_duration_s = segment_data.get('actual_tts_duration_ms', 0) / 1000.0
 
             if not audio_relative_path or not text_content or actual_audio_duration_s <= 0: continue
-            full_audio_path = os.path.join("/usr/src/app", audio_relative_path)
-            if not os.path.exists(full_audio_path): continue
+            full_audio_path = storage.ensure_local(audio_relative_path)
+            if not full_audio_path: continue
             
             try:
-                audio_clip = AudioFileClip(full_audio_path)
+                # En modo SSML por bloque varias frases comparten el mismo archivo: se abre una sola vez
+                source_audio_clip = source_audio_clips.get(full_audio_path)
+                if source_audio_clip is None:
+                    source_audio_clip = AudioFileClip(full_audio_path)
+                    source_audio_clips[full_audio_path] = source_audio_clip
+                audio_offset_s = segment_data.get('audio_offset_ms', 0) / 1000.0
+                if audio_offset_s > 0 or source_audio_clip.duration > actual_audio_duration_s + 0.05:
+                    audio_clip = source_audio_clip.subclipped(
+                        audio_offset_s, min(source_audio_clip.duration, audio_offset_s + actual_audio_duration_s)
+                    )
+                else:
+                    audio_clip = source_audio_clip
                 # Asegurar que la duración del audio_clip sea la correcta (actual_audio_duration_s)
                 # Esto es importante si el archivo es ligeramente diferente o para consistencia
                 if hasattr(audio_clip, 'with_duration'):
@@ -115,43 +243,7 @@ def assemble_video_from_script(
                 audio_segment_for_textclip = audio_clip.subclipped(0, effective_segment_duration_s)
 
                 
-                txt_clip_raw = TextClip(
-                    font=font_to_use, text=text_content, font_size=100, color='white',
-                    size=(int(target_w * 0.80), None), method='caption', text_align='center',
-                    interline=-5, stroke_color='black', stroke_width=4,
-                    duration=actual_audio_duration_s
-                )
-                
-                text_actual_width, text_actual_height = txt_clip_raw.size
-                
-                # --- 2. Crear el Panel de Fondo Semi-Transparente para el Texto ---
-                # Hacemos el panel un poco más grande que el texto para tener padding.
-                padding_x = 60 # Padding horizontal para el panel (30px a cada lado)
-                padding_y = 40 # Padding vertical para el panel (20px arriba/abajo)
-                
-                panel_width = text_actual_width + padding_x
-                panel_height = text_actual_height + padding_y
-
-                # Asegurarse que el panel no exceda el ancho del video
-                panel_width = min(panel_width, video_resolution[0])
-                # (Podríamos añadir lógica similar para la altura si fuera necesario)
-
-                panel_clip = ColorClip(
-                    size=(panel_width, panel_height), 
-                    color=(0, 0, 0), # Color negro para el panel
-                    is_mask=False, 
-                    duration=actual_audio_duration_s
-                ).with_opacity(0.6) # <--- Opacidad del panel (0.0 transparente, 1.0 opaco). 0.5-0.7 suele funcionar bien.
-                
-                 # --- 3. Componer el Texto sobre el Panel ---
-                # Primero, posicionar el texto raw en el centro del panel_clip
-                txt_clip_on_panel = txt_clip_raw
-                txt_clip_on_panel.pos = lambda t: ('center','center')
-                 # Componer el panel y el texto. El texto va encima.
-                txt_clip = CompositeVideoClip(
-                    [panel_clip, txt_clip_on_panel], 
-                    size=(panel_width, panel_height) # El tamaño del clip compuesto es el del panel
-                )
+                txt_clip = _build_caption_clip(text_content, actual_audio_duration_s, caption_width_px, video_resolution)
                 
                 txt_clip.pos = lambda t: ('center','center')
                 txt_clip = txt_clip.with_start(current_time_in_scene_s) # Inicio RELATIVO a esta escena
@@ -181,28 +273,19 @@ def assemble_video_from_script(
         if scene_bg_type == "static_image" and scene_bg_asset_url:
             # ... (Tu lógica para cargar, redimensionar y recortar ImageClip) ...
             # ... Al final: scene_background_final = img_clip_processed.set_duration(scene_narration_duration_s)
-            full_image_path = os.path.join("/usr/src/app", scene_bg_asset_url)
-            if os.path.exists(full_image_path):
+            full_image_path = storage.ensure_local(scene_bg_asset_url)
+            if full_image_path:
                 try:
-                    img_clip_orig = ImageClip(full_image_path)
-                    current_w, current_h = img_clip_orig.size; ratio = max(target_w / current_w, target_h / current_h)
-                    img_clip_resized = img_clip_orig.resized((int(current_w * ratio), int(current_h * ratio)))
-                    w, h = img_clip_resized.size; x_offset = (w - target_w) // 2; y_offset = (h - target_h) // 2
-                    img_clip_cropped = img_clip_resized.cropped(x1=x_offset, y1=y_offset, x2=x_offset + target_w, y2=y_offset + target_h)
-                    scene_background_final = img_clip_cropped.set_duration(scene_narration_duration_s)
+                    scene_background_final = _build_image_background(full_image_path, video_resolution, scene_narration_duration_s)
                 except Exception as e: print(f"    [WARN] Error procesando imagen para escena '{scene_name}': {e}")
 
         elif scene_bg_type == "static_video" and scene_bg_asset_url:
             # ... (Tu lógica para cargar, redimensionar, recortar y LOOPEAR/SUBCLIPEAR VideoFileClip) ...
             # ... Al final: scene_background_final = video_clip_processed (con duración = scene_narration_duration_s)
-            full_video_path = os.path.join("/usr/src/app", scene_bg_asset_url)
-            if os.path.exists(full_video_path):
+            full_video_path = storage.ensure_local(scene_bg_asset_url)
+            if full_video_path:
                 try:
-                    video_clip_orig = VideoFileClip(full_video_path, audio=False)
-                    current_w, current_h = video_clip_orig.size; ratio = max(target_w / current_w, target_h / current_h)
-                    video_clip_resized = video_clip_orig.resized((int(current_w * ratio), int(current_h * ratio)))
-                    w, h = video_clip_resized.size; x_offset = (w - target_w) // 2; y_offset = (h - target_h) // 2
-                    video_clip_cropped = video_clip_resized.cropped(x1=x_offset, y1=y_offset, x2=x_offset + target_w, y2=y_offset + target_h)
+                    video_clip_cropped = _open_video_background(full_video_path, video_resolution)
 
                     if video_clip_cropped.duration < scene_narration_duration_s and scene_bg_is_loopable:
                         if video_clip_cropped.duration > 0:
@@ -256,7 +339,7 @@ def assemble_video_from_script(
     # --- Añadir Transiciones (clips espaciadores negros) y Concatenar Escenas ---
     video_parts_with_transitions = []
     if transition_duration_s > 0 and len(all_final_scene_clips_with_audio) > 1:
-        transition_spacer_clip = ColorClip(size=video_resolution, color=(0,0,0), duration=transition_duration_s)
+        transition_spacer_clip = get_transition_spacer_clip(video_resolution, transition_duration_s)
         for i, scene_clip_item in enumerate(all_final_scene_clips_with_audio):
             video_parts_with_transitions.append(scene_clip_item)
             if i < len(all_final_scene_clips_with_audio) - 1:
@@ -282,69 +365,876 @@ def assemble_video_from_script(
         print(f"    Tiempo de Inicio (relativo al clip mismo): {start_time}")
     
     final_video = concatenate_videoclips(video_parts_with_transitions,method="compose")  
+    return final_video
+
+
+class _CaptionOverlay:
+    """Subtítulo rasterizado una sola vez, con alpha premultiplicado y recortado a su región visible."""
+    __slots__ = ("start_s", "end_s", "x", "y", "premultiplied", "inverse_alpha")
+
+    def __init__(self, start_s: float, end_s: float, x: int, y: int, premultiplied, inverse_alpha):
+        self.start_s, self.end_s = start_s, end_s
+        self.x, self.y = x, y
+        self.premultiplied = premultiplied # uint16 (h, w, 3): rgb * alpha + 127 (redondeo de la división por 255, máx. 65152)
+        self.inverse_alpha = inverse_alpha # uint16 (h, w, 1): 255 - alpha
+
+
+def _rasterize_caption_overlay(caption_clip, video_resolution: tuple, start_s: float, end_s: float) -> Optional[_CaptionOverlay]:
+    """Convierte el clip de subtítulo (estático) en un overlay premultiplicado centrado en el cuadro."""
+    import numpy as np
+    rgb = caption_clip.get_frame(0)
+    alpha = (np.clip(caption_clip.mask.get_frame(0), 0.0, 1.0) * 255 + 0.5).astype(np.uint16) if caption_clip.mask is not None \
+        else np.full(rgb.shape[:2], 255, dtype=np.uint16)
+    overlay_h, overlay_w = alpha.shape
+    x, y = (video_resolution[0] - overlay_w) // 2, (video_resolution[1] - overlay_h) // 2
+    # Recortar lo que cae fuera del cuadro y las filas/columnas totalmente transparentes
+    x0, y0 = max(0, -x), max(0, -y)
+    x1, y1 = min(overlay_w, video_resolution[0] - x), min(overlay_h, video_resolution[1] - y)
+    alpha, rgb = alpha[y0:y1, x0:x1], rgb[y0:y1, x0:x1]
+    visible_rows, visible_cols = np.flatnonzero(alpha.any(axis=1)), np.flatnonzero(alpha.any(axis=0))
+    if not len(visible_rows):
+        return None
+    rows = slice(visible_rows[0], visible_rows[-1] + 1)
+    cols = slice(visible_cols[0], visible_cols[-1] + 1)
+    alpha, rgb = alpha[rows, cols, np.newaxis], rgb[rows, cols]
+    premultiplied = rgb.astype(np.uint16) * alpha + 127
+    return _CaptionOverlay(start_s, end_s, x + x0 + cols.start, y + y0 + rows.start,
+                           np.ascontiguousarray(premultiplied), np.ascontiguousarray(255 - alpha))
+
+
+class FlatTimelineCompositor:
+    """
+    Compositor de la línea de tiempo plana: por cada frame copia el fondo de la escena activa en un
+    buffer preasignado y mezcla en su lugar SOLO la región del subtítulo activo (alpha premultiplicado).
+    Reemplaza la cadena CompositeVideoClip/concatenate_videoclips anidada, que asigna arrays nuevos y
+    recalcula máscaras en cada nivel y en cada frame. Los espacios entre escenas quedan en negro.
+
+    Cada escena es un dict con start_s, end_s, overlays (lista de _CaptionOverlay ordenada) y
+    'static_frame' (array fijo) o 'frame_source' (callable t_local -> frame) + 'source_duration_s'/'loop'.
+    """
+
+    def __init__(self, video_resolution: tuple, scenes: List[Dict[str, Any]], num_buffers: int = 2):
+        import numpy as np
+        width, height = video_resolution
+        self.scenes = scenes
+        self._scene_starts = [scene["start_s"] for scene in scenes]
+        # Varios buffers en anillo: el consumidor puede seguir usando el frame N mientras se compone el N+1
+        self._buffers = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(max(1, num_buffers))]
+        self._next_buffer = 0
+        max_h = max((o.inverse_alpha.shape[0] for scene in scenes for o in scene["overlays"]), default=0)
+        max_w = max((o.inverse_alpha.shape[1] for scene in scenes for o in scene["overlays"]), default=0)
+        # region * (255 - a) + rgb * a + 127 <= 255 * 255 + 127: cabe en uint16
+        self._scratch = np.empty((max_h, max_w, 3), dtype=np.uint16)
+        for scene in scenes:
+            scene["_overlay_starts"] = [o.start_s for o in scene["overlays"]]
+
+    def frame_at(self, t: float):
+        import numpy as np
+        buffer = self._buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+
+        scene_index = bisect.bisect_right(self._scene_starts, t) - 1
+        scene = self.scenes[scene_index] if scene_index >= 0 else None
+        if scene is None or t >= scene["end_s"]:
+            buffer.fill(0) # Espaciador negro entre escenas
+            return buffer
+
+        t_local = t - scene["start_s"]
+        if "static_frame" in scene:
+            np.copyto(buffer, scene["static_frame"])
+        else:
+            source_duration_s = scene["source_duration_s"]
+            if t_local >= source_duration_s:
+                # Loop por tiempo modular en vez de concatenar N copias; sin loop se congela el último frame
+                t_local = t_local % source_duration_s if scene["loop"] else max(0.0, source_duration_s - 1e-3)
+            np.copyto(buffer, scene["frame_source"](t_local), casting="unsafe")
+
+        overlay_index = bisect.bisect_right(scene["_overlay_starts"], t - scene["start_s"]) - 1
+        if overlay_index >= 0:
+            overlay = scene["overlays"][overlay_index]
+            if t - scene["start_s"] < overlay.end_s:
+                overlay_h, overlay_w = overlay.inverse_alpha.shape[:2]
+                region = buffer[overlay.y:overlay.y + overlay_h, overlay.x:overlay.x + overlay_w]
+                scratch = self._scratch[:overlay_h, :overlay_w]
+                # region = (region * (255 - a) + rgb * a + 127) // 255, sin arrays temporales
+                np.multiply(region, overlay.inverse_alpha, out=scratch)
+                np.add(scratch, overlay.premultiplied, out=scratch)
+                np.floor_divide(scratch, 255, out=scratch)
+                np.copyto(region, scratch, casting="unsafe")
+        return buffer
+
+
+def _build_flat_timeline(
+    project_id: str,
+    video_resolution: tuple = (1920, 1080),
+    transition_duration_s: float = 1.0,
+    caption_max_width_px: Optional[int] = None,
+    draw_captions: bool = True, # False: los subtítulos los agrega ffmpeg (libass o pista aparte)
+    scene_indices: Optional[set] = None # Solo estas escenas (por índice en el manifiesto); None = todas
+):
+    """
+    Recorre el manifiesto y arma la línea de tiempo plana (mismas reglas de tiempos que
+    _compose_final_video). Devuelve (escenas, clips_de_audio, duración_total) o None.
+    """
+    from moviepy import AudioFileClip, ColorClip
+    storage = storage_service.get_storage()
+    manifest = script_manifest_service.open_project_manifest(project_id)
+    if manifest is None or not manifest.scenes:
+        print(f"[ERROR] No se encontró el guion del proyecto (o no tiene escenas): {project_id} (almacenamiento: {storage.name})")
+        return None
+
+    caption_width_px = caption_max_width_px or int(video_resolution[0] * 0.80)
+    scenes, audio_clips, source_audio_clips = [], [], {}
+    timeline_s = 0.0
+    for scene_index, scene_data in enumerate(manifest.scenes):
+        if scene_indices is not None and scene_index not in scene_indices:
+            continue
+        scene_segments = manifest.load_scene_segments(scene_index)
+        scene_name = scene_data["name"]
+        scene_duration_s = sum(s.get('actual_tts_duration_ms', 0) for s in scene_segments) / 1000.0
+        if scene_duration_s <= 0:
+            continue
+        scene_start_s = timeline_s + (transition_duration_s if scenes and transition_duration_s > 0 else 0.0)
+
+        overlays, scene_audio_clips = [], []
+        current_time_in_scene_s = 0.0
+        for segment_data in scene_segments:
+            text_content = segment_data.get('text_chunk', '')
+            audio_relative_path = segment_data.get('actual_tts_audio_url')
+            duration_s = segment_data.get('actual_tts_duration_ms', 0) / 1000.0
+            if not audio_relative_path or not text_content or duration_s <= 0: continue
+            full_audio_path = storage.ensure_local(audio_relative_path)
+            if not full_audio_path: continue
+            try:
+                source_audio_clip = source_audio_clips.get(full_audio_path)
+                if source_audio_clip is None:
+                    source_audio_clip = AudioFileClip(full_audio_path)
+                    source_audio_clips[full_audio_path] = source_audio_clip
+                audio_offset_s = segment_data.get('audio_offset_ms', 0) / 1000.0
+                audio_end_s = min(source_audio_clip.duration, audio_offset_s + max(0.001, duration_s - 0.01))
+                scene_audio_clips.append(
+                    source_audio_clip.subclipped(audio_offset_s, audio_end_s).with_start(scene_start_s + current_time_in_scene_s)
+                )
+                if draw_captions:
+                    overlay = _rasterize_caption_overlay(
+                        _build_caption_clip(text_content, duration_s, caption_width_px, video_resolution),
+                        video_resolution, current_time_in_scene_s, current_time_in_scene_s + duration_s
+                    )
+                    if overlay is not None:
+                        overlays.append(overlay)
+                current_time_in_scene_s += duration_s
+            except Exception as e_seg: print(f"    [ERROR] Procesando overlay para escena '{scene_name}': {e_seg}"); traceback.print_exc()
+
+        if not scene_audio_clips:
+            print(f"    [WARN] No se generaron overlays de texto/audio para la escena '{scene_name}'.")
+            continue
+
+        scene = {"name": scene_name, "start_s": scene_start_s, "end_s": scene_start_s + scene_duration_s, "overlays": overlays}
+        asset_path = storage.ensure_local(scene_data["visual_asset_url"]) if scene_data["visual_asset_url"] else None
+        try:
+            if asset_path and scene_data["visual_type"] == "static_image":
+                scene["static_frame"] = _build_image_background(asset_path, video_resolution, 1.0).get_frame(0)
+            elif asset_path and scene_data["visual_type"] == "static_video":
+                background_clip = _open_video_background(asset_path, video_resolution)
+                if background_clip.duration and background_clip.duration > 0:
+                    scene.update(frame_source=background_clip.get_frame, source_duration_s=background_clip.duration,
+                                 loop=bool(scene_data["is_loopable"]))
+        except Exception as e: print(f"    [WARN] Error procesando el fondo de la escena '{scene_name}': {e}")
+        if "static_frame" not in scene and "frame_source" not in scene: # Mismo fallback que el render anidado
+            scene["static_frame"] = ColorClip(size=video_resolution, color=(30,30,30), duration=1.0).get_frame(0)
+        # frame_at copia los fondos sin revisarlos: un tamaño distinto se detecta aquí (y se usa el render
+        # de MoviePy) en vez de abortar a mitad de la escritura
+        background_shape = (scene["static_frame"] if "static_frame" in scene else scene["frame_source"](0)).shape
+        if tuple(background_shape) != (video_resolution[1], video_resolution[0], 3):
+            raise ValueError(f"El fondo de la escena '{scene_name}' mide {background_shape}, "
+                             f"se esperaba {video_resolution[1]}x{video_resolution[0]}x3")
+
+        scenes.append(scene)
+        audio_clips.extend(scene_audio_clips)
+        timeline_s = scene["end_s"]
+        print(f"    Escena '{scene_name}': {len(overlays)} subtítulos, {scene_start_s:.2f}s - {scene['end_s']:.2f}s.")
+
+    if not scenes:
+        print("[ERROR] No se generaron escenas para la línea de tiempo.")
+        return None
+    return scenes, audio_clips, timeline_s
+
+
+def _compose_final_video_flat(
+    project_id: str,
+    video_resolution: tuple = (1920, 1080),
+    transition_duration_s: float = 1.0,
+    caption_max_width_px: Optional[int] = None,
+    draw_captions: bool = True,
+    scene_indices: Optional[set] = None
+):
+    """Igual que _compose_final_video pero con el compositor plano. Devuelve un VideoClip o None."""
+    from moviepy import VideoClip, CompositeAudioClip
+    print(f"\n[Video Assembly] Construyendo línea de tiempo plana para el proyecto: {project_id}")
+    timeline = _build_flat_timeline(
+        project_id, video_resolution, transition_duration_s, caption_max_width_px, draw_captions, scene_indices
+    )
+    if timeline is None:
+        return None
+    scenes, audio_clips, total_duration_s = timeline
+    compositor = FlatTimelineCompositor(video_resolution, scenes)
+    final_video = VideoClip(frame_function=compositor.frame_at, duration=total_duration_s)
+    return final_video.with_audio(CompositeAudioClip(audio_clips).with_duration(total_duration_s))
+
+
+def _compose_video(
+    project_id: str,
+    video_resolution: tuple = (1920, 1080),
+    transition_duration_s: float = 1.0,
+    caption_max_width_px: Optional[int] = None,
+    draw_captions: bool = True
+):
+    """
+    Compone con el compositor configurado (VIDEO_COMPOSITOR); si el plano falla, usa el grafo de MoviePy.
+    Devuelve (clip, subtítulos_dibujados): el grafo de MoviePy siempre dibuja los TextClips.
+    """
+    if VIDEO_COMPOSITOR == "flat":
+        try:
+            final_video = _compose_final_video_flat(
+                project_id, video_resolution, transition_duration_s, caption_max_width_px, draw_captions
+            )
+            if final_video is not None:
+                return final_video, draw_captions
+        except Exception as e:
+            print(f"[Video Assembly] [WARN] Falló el compositor plano ({e}); se usa la composición de MoviePy.")
+            traceback.print_exc()
+    return _compose_final_video(project_id, video_resolution, transition_duration_s, caption_max_width_px), True
+
+
+def _write_caption_files(project_id: str, manifest, video_resolution: tuple,
+                         transition_duration_s: float, caption_width_px: int) -> Optional[Dict[str, str]]:
+    """Genera captions.ass/.srt del proyecto (mismos tiempos que el render). Devuelve {formato: ruta local}."""
+    if manifest is None:
+        return None
+    try:
+        events = subtitle_service.build_caption_events(manifest, transition_duration_s)
+        return subtitle_service.write_subtitle_files(project_id, events, video_resolution, caption_width_px)
+    except Exception as e:
+        print(f"[Video Assembly] [WARN] No se pudieron generar los subtítulos ASS/SRT: {e}")
+        return None
+
+
+def _mux_soft_subtitles(video_path: str, srt_path: str, offset_s: float = 0.0) -> bool:
+    """Agrega el SRT como pista mov_text (seleccionable) por stream copy. offset_s: duración de la intro."""
+    tmp_output_path = f"{video_path}.{os.getpid()}.subs.mp4"
+    offset_args = ["-itsoffset", f"{offset_s:.3f}"] if offset_s > 0 else []
+    ok = ffmpeg_utils.run_ffmpeg(
+        ["-i", video_path] + offset_args + ["-i", srt_path,
+         "-map", "0", "-map", "1:0", "-c", "copy", "-c:s", "mov_text", "-metadata:s:s:0", "language=spa"]
+        + ffmpeg_utils.FASTSTART_ARGS + [tmp_output_path],
+        description=f"pista de subtítulos para {os.path.basename(video_path)}",
+    )
+    if ok:
+        os.replace(tmp_output_path, video_path)
+    elif os.path.exists(tmp_output_path):
+        os.remove(tmp_output_path)
+    return ok
+
+
+def _intro_duration_s(intro_asset: Optional[str], video_resolution: tuple, fps: int) -> float:
+    if not intro_asset:
+        return 0.0
+    intro_path = asset_cache_service.get_normalized_asset_path(intro_asset, video_resolution, fps)
+    info = ffmpeg_utils.probe_video_info(intro_path) if intro_path else None
+    return info["duration"] if info else 0.0
+
+
+def _stitch_standard_assets(
+    body_video_path: str,
+    output_video_path: str,
+    video_resolution: tuple,
+    fps: int,
+    intro_asset: Optional[str],
+    outro_asset: Optional[str]
+) -> Optional[str]:
+    """
+    Pega intro/outro normalizados alrededor del video renderizado por stream copy.
+    Si no hay assets que pegar, solo mueve el body a la ruta final.
+    """
+    segments_before = [asset_cache_service.get_normalized_asset_path(intro_asset, video_resolution, fps)] if intro_asset else []
+    segments_after = [asset_cache_service.get_normalized_asset_path(outro_asset, video_resolution, fps)] if outro_asset else []
+    segments_before = [p for p in segments_before if p]
+    segments_after = [p for p in segments_after if p]
+    if not segments_before and not segments_after:
+        if body_video_path != output_video_path:
+            os.replace(body_video_path, output_video_path)
+        return output_video_path
+
+    print(f"[Video Assembly] Pegando intro/outro por stream copy en: {output_video_path}")
+    stitched_path = ffmpeg_utils.concat_segments_stream_copy(
+        segments_before + [body_video_path] + segments_after, output_video_path
+    )
+    if os.path.exists(body_video_path) and body_video_path != output_video_path:
+        try: os.remove(body_video_path)
+        except Exception as e_remove: print(f"[WARN] No se pudo eliminar el video intermedio: {e_remove}")
+    return stitched_path
+
+
+def use_still_frame_path(manifest) -> bool:
+    """
+    True si conviene el camino por escena: hay escenas con imagen fija (no hace falta componerlas
+    frame a frame) y las demás, si las hay, se pueden renderizar con el compositor plano.
+    """
+    still_scenes = sum(1 for scene in manifest.scenes if scene.get("visual_type") == "static_image")
+    return still_scenes > 0 and (still_scenes == len(manifest.scenes) or VIDEO_COMPOSITOR == "flat")
+
+
+def _timeline_frame(t_s: float, fps: int) -> int:
+    return int(round(t_s * fps))
+
+
+def _encode_still_video(still_path: str, frame_count: int, output_path: str, fps: int) -> bool:
+    """Codifica una imagen fija durante exactamente frame_count frames (solo video, parámetros estándar)."""
+    return ffmpeg_utils.run_ffmpeg(
+        ["-loop", "1", "-framerate", str(fps), "-i", still_path,
+         "-frames:v", str(frame_count), "-r", str(fps), "-an"]
+        + ffmpeg_utils.STANDARD_VIDEO_CODEC_ARGS + [output_path],
+        description=f"segmento fijo {os.path.basename(output_path)}",
+    )
+
+
+def _render_scene_segment(project_id: str, scene_index: int, output_path: str, video_resolution: tuple,
+                          fps: int, frame_count: int, draw_captions: bool) -> bool:
+    """
+    Renderiza UNA escena (video de fondo) con el compositor plano y codifica exactamente frame_count
+    frames con los mismos parámetros que los segmentos fijos (solo video), para unirla por stream copy.
+    """
+    try:
+        final_video = _compose_final_video_flat(project_id, video_resolution, 0.0, draw_captions=draw_captions,
+                                                scene_indices={scene_index})
+    except Exception as e: # Ej. un fondo con otro tamaño: el proyecto completo se renderiza con MoviePy
+        print(f"[Video Assembly] [WARN] Falló el compositor plano en la escena {scene_index}: {e}")
+        return False
+    if final_video is None:
+        return False
+    width, height = final_video.size
+    ffmpeg_cmd = [
+        ffmpeg_utils.get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+        "-frames:v", str(frame_count), "-an",
+    ] + ffmpeg_utils.STANDARD_VIDEO_CODEC_ARGS + [output_path]
+    returncode, stderr_output = _pipe_frames_to_ffmpeg(final_video, ffmpeg_cmd, fps, frame_count)
+    if returncode != 0:
+        print(f"[ERROR] ffmpeg falló al codificar la escena {scene_index}: {stderr_output.strip()[-1000:]}")
+        return False
+    return True
+
+
+def _plan_still_frame_body(manifest, transition_duration_s: float) -> List[Dict[str, Any]]:
+    """
+    Tiempos de cada escena en el cuerpo con las mismas reglas que el render y los subtítulos
+    (subtitle_service.build_caption_events): [{index, data, start_s, end_s, segments: [(inicio_s, segmento)]}].
+    """
+    planned_scenes = []
+    timeline_s = 0.0
+    for scene_index, (scene_data, scene_segments) in enumerate(manifest.iter_scenes()):
+        scene_duration_s = sum(s.get('actual_tts_duration_ms', 0) for s in scene_segments) / 1000.0
+        valid_segments = [s for s in scene_segments
+                          if s.get('text_chunk') and s.get('actual_tts_audio_url') and s.get('actual_tts_duration_ms', 0) > 0]
+        if scene_duration_s <= 0 or not valid_segments:
+            print(f"    [WARN] La escena '{scene_data['name']}' no tiene segmentos con audio, omitiendo.")
+            continue
+        scene_start_s = timeline_s + (transition_duration_s if planned_scenes and transition_duration_s > 0 else 0.0)
+        current_s, timed_segments = scene_start_s, []
+        for segment_data in valid_segments:
+            timed_segments.append((current_s, segment_data))
+            current_s += segment_data['actual_tts_duration_ms'] / 1000.0
+        planned_scenes.append({"index": scene_index, "data": scene_data, "start_s": scene_start_s,
+                               "end_s": scene_start_s + scene_duration_s, "segments": timed_segments})
+        timeline_s = scene_start_s + scene_duration_s
+    return planned_scenes
+
+
+def _write_body_audio(planned_scenes: List[Dict[str, Any]], total_duration_s: float, audio_path: str) -> bool:
+    """Una sola pista de audio continua para todo el cuerpo, armada una vez con los offsets del manifiesto."""
+    from moviepy import AudioFileClip, CompositeAudioClip
+    storage = storage_service.get_storage()
+    source_audio_clips, audio_clips = {}, []
+    for planned_scene in planned_scenes:
+        for start_s, segment_data in planned_scene["segments"]:
+            full_audio_path = storage.ensure_local(segment_data['actual_tts_audio_url'])
+            if not full_audio_path:
+                print(f"    [WARN] Falta el audio '{segment_data['actual_tts_audio_url']}'; queda en silencio.")
+                continue
+            source_audio_clip = source_audio_clips.get(full_audio_path)
+            if source_audio_clip is None:
+                source_audio_clip = AudioFileClip(full_audio_path)
+                source_audio_clips[full_audio_path] = source_audio_clip
+            audio_offset_s = segment_data.get('audio_offset_ms', 0) / 1000.0
+            duration_s = segment_data['actual_tts_duration_ms'] / 1000.0
+            audio_end_s = min(source_audio_clip.duration, audio_offset_s + max(0.001, duration_s - 0.01))
+            audio_clips.append(source_audio_clip.subclipped(audio_offset_s, audio_end_s).with_start(start_s))
+    if not audio_clips:
+        return False
+    CompositeAudioClip(audio_clips).with_duration(total_duration_s).write_audiofile(
+        audio_path, fps=44100, codec="pcm_s16le", logger=None
+    )
+    return True
+
+
+def _durations_match_manifest(planned_scenes: List[Dict[str, Any]], scene_piece_paths: Dict[int, List[str]],
+                              body_path: str, total_duration_s: float, fps: int) -> bool:
+    """Compara con ffprobe la duración de cada escena y del cuerpo contra la del manifiesto."""
+    tolerance_s = 1.5 / fps
+    for planned_scene in planned_scenes:
+        infos = [ffmpeg_utils.probe_video_info(path) for path in scene_piece_paths[planned_scene["index"]]]
+        if any(info is None for info in infos):
+            print(f"[ERROR] No se pudo inspeccionar la escena '{planned_scene['data']['name']}'.")
+            return False
+        scene_duration_s = sum(info["duration"] for info in infos)
+        expected_s = planned_scene["end_s"] - planned_scene["start_s"]
+        if abs(scene_duration_s - expected_s) > tolerance_s:
+            print(f"[ERROR] La escena '{planned_scene['data']['name']}' dura {scene_duration_s:.3f}s "
+                  f"y el manifiesto indica {expected_s:.3f}s.")
+            return False
+    body_info = ffmpeg_utils.probe_video_info(body_path)
+    if body_info is None or abs(body_info["duration"] - total_duration_s) > tolerance_s:
+        print(f"[ERROR] El cuerpo dura {body_info['duration'] if body_info else '?'}s "
+              f"y el manifiesto indica {total_duration_s:.3f}s.")
+        return False
+    return True
+
+
+def _render_still_frame_body(
+    project_id: str,
+    manifest,
+    body_video_path: str,
+    video_resolution: tuple,
+    fps: int,
+    transition_duration_s: float,
+    draw_captions: bool = True
+) -> Optional[str]:
+    """
+    Camino rápido para proyectos con imágenes fijas: en esas escenas, por cada segmento se compone
+    UNA vez el fondo + subtítulo en un PNG y se codifica como imagen fija. Las escenas con video de
+    fondo se renderizan una por una con el compositor plano. Todos los trozos son solo video, con
+    los mismos parámetros de x264 y un número de frames tomado de la línea de tiempo del manifiesto
+    (sin deriva acumulada), y se unen por stream copy; el audio va en una sola pista continua.
+    """
+    from moviepy import ColorClip, CompositeVideoClip
+    storage = storage_service.get_storage()
+    caption_width_px = int(video_resolution[0] * 0.80)
+    planned_scenes = _plan_still_frame_body(manifest, transition_duration_s)
+    if not planned_scenes:
+        print("[ERROR] No se generaron segmentos de imagen fija.")
+        return None
+    total_duration_s = planned_scenes[-1]["end_s"]
+
+    work_dir = tempfile.mkdtemp(prefix=f"stills_{project_id}_")
+    piece_paths, scene_piece_paths = [], {}
+    try:
+        previous_end_s = 0.0
+        for planned_scene in planned_scenes:
+            scene_data, scene_name = planned_scene["data"], planned_scene["data"]["name"]
+            scene_start_s, scene_end_s = planned_scene["start_s"], planned_scene["end_s"]
+            spacer_frames = _timeline_frame(scene_start_s, fps) - _timeline_frame(previous_end_s, fps)
+            if spacer_frames > 0:
+                spacer_path = asset_cache_service.get_spacer_segment_path(video_resolution, fps, spacer_frames)
+                if not spacer_path:
+                    return None
+                piece_paths.append(spacer_path)
+            previous_end_s = scene_end_s
+
+            if scene_data.get("visual_type") != "static_image":
+                scene_path = os.path.join(work_dir, f"scene_{planned_scene['index']:04d}.mp4")
+                frame_count = _timeline_frame(scene_end_s, fps) - _timeline_frame(scene_start_s, fps)
+                if not _render_scene_segment(project_id, planned_scene["index"], scene_path, video_resolution,
+                                             fps, frame_count, draw_captions):
+                    return None
+                scene_piece_paths[planned_scene["index"]] = [scene_path]
+                piece_paths.append(scene_path)
+                print(f"    Escena '{scene_name}': renderizada con el compositor plano ({frame_count} frames).")
+                continue
+
+            background = None
+            image_path = storage.ensure_local(scene_data["visual_asset_url"]) if scene_data["visual_asset_url"] else None
+            if image_path:
+                try:
+                    background = _build_image_background(image_path, video_resolution, 1.0)
+                except Exception as e: print(f"    [WARN] Error procesando imagen para escena '{scene_name}': {e}")
+            if background is None: # Mismo fallback que el render con MoviePy
+                background = ColorClip(size=video_resolution, color=(30,30,30), duration=1.0)
+
+            scene_paths = []
+            timed_segments = planned_scene["segments"]
+            for position, (start_s, segment_data) in enumerate(timed_segments):
+                # Cada frase dura hasta la siguiente; la última cubre el resto de la escena
+                end_s = timed_segments[position + 1][0] if position + 1 < len(timed_segments) else scene_end_s
+                frame_count = _timeline_frame(end_s, fps) - _timeline_frame(start_s, fps)
+                if frame_count <= 0:
+                    continue
+                segment_stem = os.path.join(work_dir, f"seg_{segment_data['segment_order']:04d}")
+                layers = [background]
+                if draw_captions:
+                    caption_clip = _build_caption_clip(segment_data['text_chunk'], 1.0, caption_width_px, video_resolution)
+                    layers.append(caption_clip.with_position(("center", "center")))
+                CompositeVideoClip(layers, size=video_resolution).save_frame(f"{segment_stem}.png", t=0)
+                if not _encode_still_video(f"{segment_stem}.png", frame_count, f"{segment_stem}.mp4", fps):
+                    return None
+                scene_paths.append(f"{segment_stem}.mp4")
+            scene_piece_paths[planned_scene["index"]] = scene_paths
+            piece_paths.extend(scene_paths)
+            print(f"    Escena '{scene_name}': {len(scene_paths)} segmentos de imagen fija codificados.")
+
+        video_only_path = os.path.join(work_dir, "video_only.mp4")
+        audio_path = os.path.join(work_dir, "body_audio.wav")
+        if not ffmpeg_utils.concat_segments_stream_copy(piece_paths, video_only_path):
+            return None
+        if not _write_body_audio(planned_scenes, total_duration_s, audio_path):
+            print("[ERROR] No se pudo armar la pista de audio del cuerpo.")
+            return None
+        if not ffmpeg_utils.run_ffmpeg(
+                ["-i", video_only_path, "-i", audio_path, "-map", "0:v:0", "-map", "1:a:0",
+                 "-c:v", "copy"] + ffmpeg_utils.STANDARD_AUDIO_CODEC_ARGS
+                + ["-t", f"{total_duration_s:.3f}"] + ffmpeg_utils.FASTSTART_ARGS + [body_video_path],
+                description="pista de audio del cuerpo de frames fijos"):
+            return None
+        if not _durations_match_manifest(planned_scenes, scene_piece_paths, body_video_path, total_duration_s, fps):
+            return None
+        return body_video_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _pipe_frames_to_ffmpeg(final_video, ffmpeg_cmd: List[str], fps: int, frame_count: Optional[int] = None):
+    """
+    Recorre los frames del clip (mismos tiempos que iter_frames de MoviePy) y los escribe sin
+    copias en el stdin de ffmpeg. frame_count fija el número de frames (por defecto duración * fps).
+    Devuelve (código de salida, stderr).
+    """
+    writer = ffmpeg_utils.RawFramePipeWriter(ffmpeg_cmd)
+    try:
+        last_t = max(0.0, final_video.duration - 1e-3) # Con frame_count el último frame puede caer en el borde
+        for frame_index in range(int(final_video.duration * fps) if frame_count is None else frame_count):
+            writer.write(final_video.get_frame(min(frame_index / fps, last_t)))
+    except BrokenPipeError:
+        pass # ffmpeg terminó antes de tiempo: el error real está en su stderr
+    finally:
+        returncode, stderr_output = writer.close()
+    stats = writer.stats
+    print(f"[Video Assembly] Escritor de frames: {stats['frames']} frames a {stats['fps']} fps, "
+          f"{stats['bytes'] / 1e6:.0f} MB, {stats['copies']} copias, escritura al pipe {stats['pipe_write_s']}s, "
+          f"espera del compositor {stats['producer_wait_s']}s")
+    profiling_service.record_stats("frame_writer", stats)
+    return returncode, stderr_output
+
+
+def _write_video_raw_pipe(final_video, output_path: str, fps: int, temp_audiofile: str,
+                          threads: int = 8, preset: str = "medium", video_filter: Optional[str] = None) -> bool:
+    """
+    Equivalente a write_videofile(codec="libx264", audio_codec="aac") con el mismo comando de
+    ffmpeg que arma MoviePy (audio AAC escrito antes y copiado), pero escribiendo los frames
+    con RawFramePipeWriter en vez de frame.tobytes().
+    """
+    width, height = final_video.size
+    audio_args = []
+    if final_video.audio is not None:
+        final_video.audio.write_audiofile(temp_audiofile, fps=44100, codec="aac", logger=None)
+        audio_args = ["-i", temp_audiofile, "-acodec", "copy"]
+    ffmpeg_cmd = [
+        ffmpeg_utils.get_ffmpeg_binary(), "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-vcodec", "rawvideo", "-s", f"{width}x{height}", "-pix_fmt", "rgb24",
+        "-r", f"{fps:.02f}", "-an", "-i", "-",
+    ] + audio_args + (["-vf", video_filter] if video_filter else []) + ["-vcodec", "libx264", "-preset", preset, "-threads", str(threads)]
+    if width % 2 == 0 and height % 2 == 0:
+        ffmpeg_cmd += ["-pix_fmt", "yuv420p"]
+    ffmpeg_cmd += ffmpeg_utils.FASTSTART_ARGS + [output_path]
+
+    returncode, stderr_output = _pipe_frames_to_ffmpeg(final_video, ffmpeg_cmd, fps)
+    if returncode != 0:
+        print(f"[ERROR] ffmpeg falló al codificar el video: {stderr_output.strip()[-1000:]}")
+        return False
+    return True
+
+
+def assemble_video_from_script(
+    project_id: str,
+    output_filename: str = "final_video.mp4",
+    video_resolution: tuple = (1920, 1080),
+    fps: int = 24,
+    transition_duration_s: float = 1.0,
+    intro_asset: Optional[str] = None, # Nombre de un asset estándar (ver asset_cache_service), ej. "intro"
+    outro_asset: Optional[str] = None,
+    caption_mode: Optional[str] = None # "textclip", "burn_in" o "soft" (por defecto CAPTION_MODE)
+) -> Optional[str]:
+    # Los assets estándar (intro/outro) se normalizan una sola vez por worker y se pegan
+    # al final por stream copy, así que no cuestan nada por render.
+    storage = storage_service.get_storage()
+    output_video_key = storage_service.storage_key("outputs/videos", project_id, output_filename)
+    output_video_path_container = storage.local_path(output_video_key)
+    output_video_dir_container = os.path.dirname(output_video_path_container)
+    # El render de MoviePy va a un archivo intermedio; luego se pegan intro/outro si los hay
+    body_video_path = os.path.join(output_video_dir_container, f"body_{uuid.uuid4().hex[:8]}_{output_filename}")
 
-   # Escribir el video final
-    # ... (tu código para output_video_dir_container, write_videofile, y finally block) ...
-    # ... (asegúrate de usar final_video.write_videofile(...)) ...
-    output_video_dir_container = os.path.join("/usr/src/app", "outputs", "videos", project_id)
-    os.makedirs(output_video_dir_container, exist_ok=True)
-    output_video_path_container = os.path.join(output_video_dir_container, output_filename)
     temp_audio_filename_only = f"temp_audio_{project_id}_{uuid.uuid4().hex[:8]}.m4a"
     temp_audio_filepath_in_tmp = os.path.join("/tmp", temp_audio_filename_only)
     final_generated_path = None
     try:
-        print(f"[Video Assembly] Escribiendo video final en: {output_video_path_container} ...")
-        final_video.write_videofile(
-            output_video_path_container, codec="libx264", audio_codec="aac",
-            fps=fps, threads=8, preset="medium",
-            temp_audiofile=temp_audio_filepath_in_tmp
+        manifest = script_manifest_service.open_project_manifest(project_id)
+        caption_mode = caption_mode or CAPTION_MODE
+        subtitle_paths = _write_caption_files(project_id, manifest, video_resolution, transition_duration_s,
+                                              int(video_resolution[0] * 0.80))
+        if caption_mode != "textclip" and not subtitle_paths:
+            print(f"[Video Assembly] [WARN] Sin archivo de subtítulos para '{caption_mode}'; se dibujan con TextClip.")
+            caption_mode = "textclip"
+
+        rendered_body_path = None
+        if manifest is not None and use_still_frame_path(manifest):
+            print(f"[Video Assembly] Proyecto con imágenes fijas: usando el camino rápido de frames fijos.")
+            # Cada frame fijo se compone una sola vez: el subtítulo va en el PNG salvo en modo "soft"
+            rendered_body_path = _render_still_frame_body(
+                project_id, manifest, body_video_path, video_resolution, fps, transition_duration_s,
+                draw_captions=caption_mode != "soft"
+            )
+            if not rendered_body_path:
+                print(f"[Video Assembly] [WARN] Falló el camino rápido; se renderiza con MoviePy.")
+
+        if not rendered_body_path:
+            final_video, captions_drawn = _compose_video(
+                project_id, video_resolution, transition_duration_s, draw_captions=caption_mode == "textclip"
+            )
+            if final_video is None:
+                return None
+            if captions_drawn and caption_mode != "textclip":
+                print(f"[Video Assembly] [WARN] El compositor ya dibujó los subtítulos; se ignora el modo '{caption_mode}'.")
+                caption_mode = "textclip"
+            burn_in_filter = subtitle_service.burn_in_filter(subtitle_paths["ass"]) if caption_mode == "burn_in" else None
+            final_video = profiling_service.instrument_frames(final_video) # Solo si la tarea pidió 'profile'
+            print(f"[Video Assembly] Escribiendo video final en: {body_video_path} ...")
+            if FRAME_WRITER == "pipe":
+                if not _write_video_raw_pipe(final_video, body_video_path, fps, temp_audio_filepath_in_tmp,
+                                             threads=8, preset="medium", video_filter=burn_in_filter):
+                    return None
+            else:
+                final_video.write_videofile(
+                    body_video_path, codec="libx264", audio_codec="aac",
+                    fps=fps, threads=8, preset="medium",
+                    temp_audiofile=temp_audio_filepath_in_tmp,
+                    ffmpeg_params=(["-vf", burn_in_filter] if burn_in_filter else []) + ffmpeg_utils.FASTSTART_ARGS
+                )
+        final_generated_path = _stitch_standard_assets(
+            body_video_path, output_video_path_container, video_resolution, fps, intro_asset, outro_asset
         )
-        print(f"[Video Assembly] ¡Video final generado exitosamente!")
-        final_generated_path = output_video_path_container
+        if final_generated_path and caption_mode == "soft":
+            # La pista se agrega al video ya unido (intro/outro no tienen pista de subtítulos)
+            if not _mux_soft_subtitles(final_generated_path, subtitle_paths["srt"],
+                                       _intro_duration_s(intro_asset, video_resolution, fps)):
+                print(f"[Video Assembly] [WARN] No se pudo agregar la pista de subtítulos; el video queda sin ella.")
+        if final_generated_path and not storage.save_file(output_video_key):
+            print(f"[ERROR] No se pudo guardar el video final en el almacenamiento ({storage.name}).")
+            final_generated_path = None
+        if final_generated_path:
+            print(f"[Video Assembly] ¡Video final generado exitosamente!")
     except Exception as e:
         print(f"[ERROR] Error al escribir el archivo de video final: {e}")
-        import traceback; traceback.print_exc()
+        traceback.print_exc()
     finally:
         if os.path.exists(temp_audio_filepath_in_tmp):
             try: os.remove(temp_audio_filepath_in_tmp)
             except Exception as e_remove: print(f"[WARN] No se pudo eliminar temp audio: {e_remove}")
+        if os.path.exists(body_video_path):
+            try: os.remove(body_video_path)
+            except Exception as e_remove: print(f"[WARN] No se pudo eliminar el video intermedio: {e_remove}")
     return final_generated_path
 
-# funcion para obtener transition_clip
-def get_transition_clip():
-    ######################transition#################
-    transition_clip = None
-    if os.path.exists(transition_video_full_path_in_container):
-        try:
-            print(f"Cargando video de transition desde: {transition_video_full_path_in_container}")
-            transition_clip = VideoFileClip(transition_video_full_path_in_container)
-            end_time = min(transition_clip.duration, 5.0)
-            transition_clip = transition_clip.subclipped(3, end_time)
-            
-            video_resolution: tuple = (1920, 1080)
-            target_w, target_h = video_resolution
-            
-            current_w, current_h = transition_clip.size
-            ratio = max(target_w / current_w, target_h / current_h)
-            new_size = (int(current_w * ratio), int(current_h * ratio))
-            transition_clip = transition_clip.resized(new_size)
-            
-            w_resized, h_resized = transition_clip.size
-            x_offset = (w_resized - target_w) // 2
-            y_offset = (h_resized - target_h) // 2
-            
-            transition_clip = transition_clip.cropped(
-                x1=x_offset, y1=y_offset, 
-                x2=x_offset + target_w, y2=y_offset + target_h
+
+def _aspect_groups(output_profiles: List[str]) -> List[tuple]:
+    """
+    Agrupa los perfiles por relación de aspecto. Devuelve [(resolución de composición, [perfiles])]
+    en el orden pedido; cada grupo se compone a la mayor resolución de sus perfiles.
+    """
+    groups: Dict[tuple, List[str]] = {}
+    for profile_name in output_profiles:
+        width, height = OUTPUT_PROFILES[profile_name]["resolution"]
+        divisor = math.gcd(width, height)
+        groups.setdefault((width // divisor, height // divisor), []).append(profile_name)
+    return [(tuple(max((OUTPUT_PROFILES[name]["resolution"] for name in names), key=lambda r: r[0] * r[1])), names)
+            for names in groups.values()]
+
+
+def _write_variant_ass(manifest, video_resolution: tuple, transition_duration_s: float, ass_path: str) -> Optional[str]:
+    """ASS para el burn-in de un grupo con otro aspecto (los descargables son los del primer perfil)."""
+    try:
+        events = subtitle_service.build_caption_events(manifest, transition_duration_s)
+        with open(ass_path, "w", encoding="utf-8") as f:
+            f.write(subtitle_service.render_ass(events, video_resolution, int(video_resolution[0] * 0.80)))
+        return ass_path
+    except Exception as e:
+        print(f"[Video Assembly] [WARN] No se pudo generar el ASS a {video_resolution[0]}x{video_resolution[1]}: {e}")
+        return None
+
+
+def _render_aspect_group(
+    project_id: str,
+    composition_resolution: tuple,
+    profile_names: List[str],
+    output_video_dir_container: str,
+    output_basename: str,
+    render_id: str,
+    fps: int,
+    transition_duration_s: float,
+    caption_mode: str,
+    ass_path: Optional[str]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Compone el video a la resolución nativa de un grupo de perfiles con el mismo aspecto (los
+    subtítulos se maquetan a ese ancho) y codifica todos sus perfiles en una sola pasada
+    (ffmpeg split + scale y bitrate por perfil). Devuelve las variantes o None si falló.
+    """
+    final_video, captions_drawn = _compose_video(
+        project_id, composition_resolution, transition_duration_s, draw_captions=caption_mode == "textclip"
+    )
+    if final_video is None:
+        return None
+    if captions_drawn and caption_mode != "textclip":
+        print(f"[Video Assembly] [WARN] El compositor ya dibujó los subtítulos; se ignora el modo '{caption_mode}'.")
+        caption_mode = "textclip"
+    final_video = profiling_service.instrument_frames(final_video) # Solo si la tarea pidió 'profile'
+
+    composition_w, composition_h = composition_resolution
+    temp_audio_filepath_in_tmp = os.path.join("/tmp", f"temp_audio_{project_id}_{render_id}_{composition_w}x{composition_h}.m4a")
+    # Con "burn_in" libass dibuja los subtítulos sobre la composición del grupo, antes del split/escalado
+    burn_in = f"{subtitle_service.burn_in_filter(ass_path)}," if caption_mode == "burn_in" else ""
+    filter_parts = [f"[0:v]{burn_in}split={len(profile_names)}" + "".join(f"[v{i}]" for i in range(len(profile_names)))]
+    output_args = []
+    variants = []
+    for i, profile_name in enumerate(profile_names):
+        profile = OUTPUT_PROFILES[profile_name]
+        target_w, target_h = profile["resolution"]
+        filter_parts.append(f"[v{i}]scale={target_w}:{target_h}:flags=lanczos,setsar=1[out{i}]")
+        body_path = os.path.join(output_video_dir_container, f"body_{render_id}_{output_basename}_{profile_name}.mp4")
+        output_args += ["-map", f"[out{i}]", "-map", "1:a:0",
+                        "-r", str(fps)] + ffmpeg_utils.STANDARD_VIDEO_CODEC_ARGS + [
+                        "-b:v", profile["video_bitrate"], "-maxrate", profile["maxrate"], "-bufsize", profile["bufsize"]
+                        ] + ffmpeg_utils.STANDARD_AUDIO_CODEC_ARGS + ["-b:a", profile["audio_bitrate"]] + ffmpeg_utils.FASTSTART_ARGS + [body_path]
+        variants.append({
+            "profile": profile_name,
+            "resolution": list(profile["resolution"]),
+            "body_path": body_path,
+            "video_path": os.path.join(output_video_dir_container, f"{output_basename}_{profile_name}.mp4"),
+            "soft_subtitles": caption_mode == "soft",
+        })
+
+    ffmpeg_cmd = [
+        ffmpeg_utils.get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{composition_w}x{composition_h}", "-r", str(fps), "-i", "-",
+        "-i", temp_audio_filepath_in_tmp,
+        "-filter_complex", ";".join(filter_parts),
+    ] + output_args
+
+    try:
+        print(f"[Video Assembly] Escribiendo pista de audio temporal: {temp_audio_filepath_in_tmp}")
+        final_video.audio.write_audiofile(temp_audio_filepath_in_tmp, fps=44100, codec="aac", logger=None)
+
+        print(f"[Video Assembly] Renderizando a {composition_w}x{composition_h} los perfiles {profile_names} en una sola pasada")
+        returncode, stderr_output = _pipe_frames_to_ffmpeg(final_video, ffmpeg_cmd, fps)
+        if returncode != 0:
+            print(f"[ERROR] ffmpeg falló al codificar los perfiles {profile_names}: {stderr_output.strip()[-1000:]}")
+            for variant in variants:
+                if os.path.exists(variant["body_path"]):
+                    os.remove(variant["body_path"])
+            return None
+        return variants
+    finally:
+        if os.path.exists(temp_audio_filepath_in_tmp):
+            try: os.remove(temp_audio_filepath_in_tmp)
+            except Exception as e_remove: print(f"[WARN] No se pudo eliminar temp audio: {e_remove}")
+
+
+def assemble_video_variants_from_script(
+    project_id: str,
+    output_profiles: List[str],
+    output_basename: str = "final_video",
+    fps: int = 24,
+    transition_duration_s: float = 1.0,
+    intro_asset: Optional[str] = None,
+    outro_asset: Optional[str] = None,
+    caption_mode: Optional[str] = None # "textclip", "burn_in" o "soft" (por defecto CAPTION_MODE)
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Produce varias codificaciones del video. Los perfiles con el mismo aspecto comparten UNA
+    composición a su resolución nativa (ej. 1080p y 720p salen de la misma pasada); cada aspecto
+    distinto (ej. shorts 9:16) se compone aparte, con los subtítulos maquetados a su ancho.
+    Devuelve la lista de variantes renderizadas o None si falló.
+    """
+    unknown_profiles = [name for name in output_profiles if name not in OUTPUT_PROFILES]
+    if unknown_profiles:
+        print(f"[ERROR] Perfiles de salida desconocidos: {unknown_profiles}. Disponibles: {list(OUTPUT_PROFILES)}")
+        return None
+    if not output_profiles:
+        print("[ERROR] No se indicó ningún perfil de salida.")
+        return None
+
+    groups = _aspect_groups(output_profiles)
+    manifest = script_manifest_service.open_project_manifest(project_id)
+    caption_mode = caption_mode or CAPTION_MODE
+    # Los subtítulos descargables (captions.ass/.srt) se maquetan para el aspecto del primer perfil
+    primary_resolution = groups[0][0]
+    subtitle_paths = _write_caption_files(project_id, manifest, primary_resolution, transition_duration_s,
+                                          int(primary_resolution[0] * 0.80))
+    if caption_mode != "textclip" and not subtitle_paths:
+        print(f"[Video Assembly] [WARN] Sin archivo de subtítulos para '{caption_mode}'; se dibujan con TextClip.")
+        caption_mode = "textclip"
+
+    storage = storage_service.get_storage()
+    output_video_dir_container = os.path.dirname(
+        storage.local_path(storage_service.storage_key("outputs/videos", project_id, output_basename))
+    )
+    render_id = uuid.uuid4().hex[:8]
+    work_dir = tempfile.mkdtemp(prefix=f"variants_{project_id}_")
+
+    variants = []
+    rendered_variants = None
+    try:
+        for group_index, (composition_resolution, profile_names) in enumerate(groups):
+            group_caption_mode = caption_mode
+            ass_path = subtitle_paths["ass"] if subtitle_paths else None
+            if caption_mode == "burn_in" and group_index > 0:
+                ass_path = _write_variant_ass(manifest, composition_resolution, transition_duration_s, os.path.join(
+                    work_dir, f"captions_{composition_resolution[0]}x{composition_resolution[1]}.ass"))
+                if not ass_path:
+                    group_caption_mode = "textclip"
+            group_variants = _render_aspect_group(
+                project_id, composition_resolution, profile_names, output_video_dir_container, output_basename,
+                render_id, fps, transition_duration_s, group_caption_mode, ass_path
             )
-            
-            print(f"Intro cargada: duración={transition_clip.duration}s, tamaño={transition_clip.size}")
-        except Exception as e:
-            print(f"Error al cargar el video de transition '{transition_video_full_path_in_container}': {e}")
-    else:
-        print(f"[WARN] Video de transition no encontrado en: {transition_video_full_path_in_container}")
-    ####################fin transition###############
-    return transition_clip
+            if group_variants is None:
+                print(f"[WARN] Fallaron los perfiles {profile_names}.")
+                continue
+            variants.extend(group_variants)
+
+        rendered_variants = []
+        for variant in variants:
+            final_path = _stitch_standard_assets(
+                variant["body_path"], variant["video_path"], tuple(variant["resolution"]), fps, intro_asset, outro_asset
+            )
+            if final_path and variant["soft_subtitles"] and not _mux_soft_subtitles(
+                    final_path, subtitle_paths["srt"], _intro_duration_s(intro_asset, tuple(variant["resolution"]), fps)):
+                print(f"[WARN] La variante '{variant['profile']}' queda sin pista de subtítulos.")
+            if final_path and not storage.save_file(storage_service.key_from_local_path(final_path)):
+                print(f"[ERROR] No se pudo guardar la variante '{variant['profile']}' en el almacenamiento ({storage.name}).")
+                final_path = None
+            if final_path:
+                rendered_variants.append({"profile": variant["profile"], "resolution": variant["resolution"], "video_path": final_path})
+            else:
+                print(f"[WARN] Falló la variante '{variant['profile']}'.")
+        print(f"[Video Assembly] Variantes generadas: {[v['profile'] for v in rendered_variants]}")
+    except Exception as e:
+        print(f"[ERROR] Error al renderizar las variantes de video: {e}")
+        traceback.print_exc()
+        rendered_variants = None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        for variant in variants:
+            if os.path.exists(variant["body_path"]):
+                try: os.remove(variant["body_path"])
+                except Exception as e_remove: print(f"[WARN] No se pudo eliminar el video intermedio: {e_remove}")
+    return rendered_variants or None
 
 
 # El bloque if __name__ == "__main__":
@@ -355,9 +1245,10 @@ if __name__ == "__main__":
     test_project_id_for_continuous_bg = "PRUEBA_FONDO_VIDEO" 
     # ... (resto de tu bloque de prueba como lo tenías, llamando a assemble_video_from_script) ...
     print(f"Iniciando prueba de ensamblaje de video CON FONDO CONTINUO para el proyecto: {test_project_id_for_continuous_bg}")
-    expected_script_path = os.path.join("/usr/src/app/outputs/scripts", test_project_id_for_continuous_bg, "script_data.json")
-    if not os.path.exists(expected_script_path):
-        print(f"[ALERTA DE PRUEBA] No se encontró el archivo de guion JSON en: {expected_script_path}")
+    expected_script_dir = os.path.join("/usr/src/app/outputs/scripts", test_project_id_for_continuous_bg)
+    if not any(os.path.exists(os.path.join(expected_script_dir, name))
+               for name in (script_manifest_service.MANIFEST_FILENAME, script_manifest_service.LEGACY_JSON_FILENAME)):
+        print(f"[ALERTA DE PRUEBA] No se encontró el manifiesto ni el guion JSON en: {expected_script_dir}")
         print("                 Asegúrate de que el 'test_project_id_for_continuous_bg' sea correcto,")
         print("                 que hayas generado el guion para él, y que ese guion especifique")
         print("                 visual_type='static_video' y un visual_asset_url válido en 'assets/videos/'.")
@@ -0,0 +1,199 @@
+# app/workers/assembly_scheduler.py
+import json
+import time
+from typing import Any, Dict, Optional
+
+from celery import states
+from celery.signals import task_postrun
+
+from app.core.redis_client import get_redis_client
+
+# Planificación de ensamblajes por costo estimado (render_cost_service) en vez de FIFO.
+# Cada cola tiene su propio worker; los trabajos esperan en Redis y se publican en Celery solo
+# cuando hay un slot libre, eligiendo el de menor puntaje = costo_s + AGING_WEIGHT * encolado_en.
+# Con AGING_WEIGHT = 1 un trabajo largo no espera más que su diferencia de costo con los cortos.
+#   ASSEMBLY_QUEUE_SLOTS:    renders simultáneos por cola (= concurrencia de los workers que la consumen)
+#   HEAVY_JOB_THRESHOLD_S:   a partir de este costo estimado el trabajo va a la cola pesada
+#   AGING_WEIGHT:            segundos de prioridad que gana un trabajo por cada segundo de espera
+try:
+    from app.core.config import ASSEMBLY_QUEUE_SLOTS, HEAVY_JOB_THRESHOLD_S, AGING_WEIGHT
+except ImportError:
+    ASSEMBLY_QUEUE_SLOTS = {"assembly_light": 1, "assembly_heavy": 1}
+    HEAVY_JOB_THRESHOLD_S = 600
+    AGING_WEIGHT = 1.0
+
+LIGHT_QUEUE = "assembly_light"
+HEAVY_QUEUE = "assembly_heavy"
+
+_KEY_PREFIX = "assembly"
+_JOB_TTL_S = 24 * 3600
+_STALE_GRACE_S = 600 # Margen antes de dar por muerto un render que excede 3x su estimación
+
+
+def job_key(task_id: str) -> str:
+    return f"{_KEY_PREFIX}:job:{task_id}"
+
+
+def _pending_key(queue: str) -> str:
+    return f"{_KEY_PREFIX}:pending:{queue}"
+
+
+def _running_key(queue: str) -> str:
+    return f"{_KEY_PREFIX}:running:{queue}"
+
+
+def compact_job_info(job_value: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Planificación resumida a partir del JSON guardado del trabajo (para consultas masivas de estado)."""
+    if not job_value:
+        return None
+    job = json.loads(job_value)
+    return {"queue": job["queue"], "state": "running" if job.get("started_at") else "pending",
+            "estimated_cost_s": job["estimated_cost_s"], "enqueued_at": job["enqueued_at"], "started_at": job.get("started_at")}
+
+
+def _load_job(client, task_id: str) -> Optional[Dict[str, Any]]:
+    value = client.get(job_key(task_id))
+    return json.loads(value) if value else None
+
+
+def _save_job(client, job: Dict[str, Any]):
+    client.set(job_key(job["task_id"]), json.dumps(job), ex=_JOB_TTL_S)
+
+
+def queue_for_cost(cost_s: float) -> str:
+    return HEAVY_QUEUE if cost_s >= HEAVY_JOB_THRESHOLD_S else LIGHT_QUEUE
+
+
+def submit_assembly(task_id: str, task_kwargs: Dict[str, Any], estimate: Dict[str, Any]):
+    """Registra el ensamblaje como pendiente en la cola que le toca por costo y despacha lo que quepa."""
+    client = get_redis_client()
+    cost_s = float(estimate["estimated_cost_s"])
+    now = time.time()
+    job = {
+        "task_id": task_id,
+        "queue": queue_for_cost(cost_s),
+        "estimated_cost_s": cost_s,
+        "raw_estimate_s": float(estimate.get("raw_estimate_s", cost_s)),
+        "enqueued_at": now,
+        "kwargs": task_kwargs,
+    }
+    _save_job(client, job)
+    client.zadd(_pending_key(job["queue"]), {task_id: cost_s + AGING_WEIGHT * now})
+    print(f"[Assembly Scheduler] Tarea {task_id} pendiente en '{job['queue']}' (costo estimado {cost_s:.0f}s).")
+    dispatch_pending()
+
+
+def _purge_stale_running(client, queue: str):
+    # Los puntajes de 'running' son el instante en que el render se da por perdido (worker muerto)
+    stale = client.zrangebyscore(_running_key(queue), "-inf", time.time())
+    for task_id in stale:
+        print(f"[Assembly Scheduler] [WARN] La tarea {task_id} excedió su plazo en '{queue}'; se libera su slot.")
+        client.zrem(_running_key(queue), task_id)
+
+
+def dispatch_pending():
+    """Publica en Celery los pendientes de menor puntaje mientras haya slots libres en cada cola."""
+    from app.workers.celery_app import celery_app, ASSEMBLE_VIDEO_TASK_NAME
+    client = get_redis_client()
+    lock = client.lock(f"{_KEY_PREFIX}:dispatch_lock", timeout=30, blocking_timeout=10)
+    if not lock.acquire():
+        return # Otro proceso está despachando; verá los mismos pendientes
+    try:
+        for queue, slots in ASSEMBLY_QUEUE_SLOTS.items():
+            _purge_stale_running(client, queue)
+            while client.zcard(_running_key(queue)) < slots:
+                popped = client.zpopmin(_pending_key(queue))
+                if not popped:
+                    break
+                task_id, score = popped[0]
+                job = _load_job(client, task_id)
+                if job is None:
+                    continue # Expiró o se canceló
+                now = time.time()
+                try:
+                    celery_app.send_task(ASSEMBLE_VIDEO_TASK_NAME, kwargs=job["kwargs"], task_id=task_id, queue=queue)
+                except Exception as e:
+                    print(f"[Assembly Scheduler] Error al publicar la tarea {task_id}: {e}")
+                    client.zadd(_pending_key(queue), {task_id: score})
+                    break
+                job["started_at"] = now
+                _save_job(client, job)
+                client.zadd(_running_key(queue), {task_id: now + 3 * job["estimated_cost_s"] + _STALE_GRACE_S})
+                print(f"[Assembly Scheduler] Tarea {task_id} publicada en '{queue}' tras {now - job['enqueued_at']:.0f}s de espera.")
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            pass
+
+
+def queued_project_ids() -> set:
+    """Proyectos con ensamblajes pendientes o en curso según el planificador."""
+    client = get_redis_client()
+    project_ids = set()
+    for queue in ASSEMBLY_QUEUE_SLOTS:
+        for task_id in client.zrange(_pending_key(queue), 0, -1) + client.zrange(_running_key(queue), 0, -1):
+            job = _load_job(client, task_id)
+            if job:
+                project_ids.add(job["kwargs"].get("project_id"))
+    return project_ids
+
+
+def get_schedule_info(task_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Posición e inicio/fin estimados (epoch) del ensamblaje. Simula los slots de su cola con el
+    tiempo restante de los renders en curso y el costo de los pendientes que van antes.
+    """
+    client = get_redis_client()
+    job = _load_job(client, task_id)
+    if job is None:
+        return None
+    queue, now = job["queue"], time.time()
+    running_free_at = []
+    running = client.zrange(_running_key(queue), 0, -1)
+    for running_id in running:
+        running_job = _load_job(client, running_id)
+        if running_job and running_job.get("started_at"):
+            running_free_at.append(max(now, running_job["started_at"] + running_job["estimated_cost_s"]))
+    slots = ASSEMBLY_QUEUE_SLOTS.get(queue, 1)
+    slot_free_at = sorted(running_free_at + [now] * max(0, slots - len(running_free_at)))[:slots] or [now]
+
+    info = {"queue": queue, "estimated_cost_s": job["estimated_cost_s"]}
+    if job.get("started_at"):
+        info.update(state="running", position=0, estimated_start_at=job["started_at"],
+                    estimated_finish_at=max(now, job["started_at"] + job["estimated_cost_s"]))
+        return info
+
+    ahead = client.zrange(_pending_key(queue), 0, -1)
+    if task_id not in ahead:
+        return {**info, "state": "finished"}
+    position = ahead.index(task_id)
+    for pending_id in ahead[:position]:
+        pending_job = _load_job(client, pending_id)
+        if pending_job:
+            slot_free_at[0] += pending_job["estimated_cost_s"]
+            slot_free_at.sort()
+    info.update(state="pending", position=position + 1, estimated_start_at=slot_free_at[0],
+                estimated_finish_at=slot_free_at[0] + job["estimated_cost_s"])
+    return info
+
+
+@task_postrun.connect
+def release_assembly_slot(task_id=None, state=None, retval=None, **kwargs):
+    """Al terminar un ensamblaje (no en un reintento), libera su slot, calibra el modelo de costo y despacha."""
+    if not task_id or state not in states.READY_STATES:
+        return
+    try:
+        client = get_redis_client()
+        job = _load_job(client, task_id)
+        if job is None:
+            return
+        client.zrem(_running_key(job["queue"]), task_id)
+        client.delete(job_key(task_id))
+        # Solo renders completos calibran el modelo (las tareas devuelven {"status": "FAILURE"} al fallar)
+        if state == states.SUCCESS and job.get("started_at") and not (isinstance(retval, dict) and retval.get("status") == "FAILURE"):
+            from app.services import render_cost_service
+            render_cost_service.record_actual_cost(job["raw_estimate_s"], time.time() - job["started_at"])
+        dispatch_pending()
+    except Exception as e:
+        print(f"[Assembly Scheduler] [WARN] No se pudo liberar el slot de la tarea {task_id}: {e}")
@@ -1,4 +1,7 @@
 from celery import Celery
+from celery.signals import celeryd_init, worker_process_init
+from app.core.redis_client import REDIS_URL
+from app.workers.task_results import RESULT_EXPIRES_S
 
 # Definimos el nombre de nuestra aplicación Celery.
 # El primer argumento para Celery es usualmente el nombre del módulo actual.
@@ -10,11 +13,35 @@ from celery import Celery
 # Usaremos Redis también para esto por simplicidad en esta etapa.
 celery_app = Celery(
     "worker", # Puedes darle un nombre más descriptivo si quieres, ej. "video_tasks_worker"
-    broker="redis://redis:6379/0",
-    result_backend="redis://redis:6379/0",
-    include=["app.workers.tasks.video_processing_tasks"] # Lista de módulos donde Celery buscará tareas.
+    broker=REDIS_URL,
+    result_backend=REDIS_URL,
+    include=["app.workers.tasks.video_processing_tasks", "app.workers.tasks.maintenance_tasks"] # Lista de módulos donde Celery buscará tareas.
 )
 
+# Nombres de las tareas. La API encola por nombre (send_task) para no importar los módulos
+# de tareas, que arrastran MoviePy, NLTK, Google TTS, etc. al arranque de Uvicorn.
+GENERATE_SCRIPT_TASK_NAME = "tasks.generate_script_and_audio_for_post"
+ASSEMBLE_VIDEO_TASK_NAME = "tasks.assemble_video_from_project_id"
+RETENTION_GC_TASK_NAME = "tasks.run_retention_gc"
+DISPATCH_ASSEMBLIES_TASK_NAME = "tasks.dispatch_pending_assemblies"
+
+# Tareas periódicas (servicio celery_beat en docker-compose.yml)
+#   RETENTION_GC_INTERVAL_S:       cada cuánto se recolectan las salidas de proyectos (retention_service)
+#   ASSEMBLY_DISPATCH_INTERVAL_S:  cada cuánto se revisan ensamblajes pendientes con slots libres
+try:
+    from app.core.config import RETENTION_GC_INTERVAL_S, ASSEMBLY_DISPATCH_INTERVAL_S
+except ImportError:
+    RETENTION_GC_INTERVAL_S = 3600
+    ASSEMBLY_DISPATCH_INTERVAL_S = 60
+
+# Las tareas con acks_late (generación del guion) confirman el mensaje al terminar. Con Redis como
+# broker, un mensaje sin confirmar se reentrega pasado este tiempo (worker caído sin aviso), así que
+# debe superar la duración de la tarea más larga o se ejecutaría dos veces.
+try:
+    from app.core.config import BROKER_VISIBILITY_TIMEOUT_S
+except ImportError:
+    BROKER_VISIBILITY_TIMEOUT_S = 4 * 3600
+
 # Configuraciones opcionales de Celery (puedes añadir más según necesites)
 celery_app.conf.update(
     task_serializer="json",         # Formato de serialización para las tareas
@@ -22,10 +49,43 @@ celery_app.conf.update(
     accept_content=["json"],        # Tipos de contenido aceptados
     timezone="America/Mexico_City", # Ajusta a tu zona horaria
     enable_utc=True,                # Recomendado si usas zonas horarias
-    # result_expires=3600,          # Tiempo en segundos antes de que los resultados de las tareas se borren (1 hora)
+    result_expires=RESULT_EXPIRES_S, # Los resultados (y tracebacks) expiran en Redis: memoria acotada
     task_track_started=True,      # Para que se registre el estado 'STARTED' de la tarea
+    broker_transport_options={"visibility_timeout": BROKER_VISIBILITY_TIMEOUT_S},
+    worker_proc_alive_timeout=180,  # El arranque en caliente (worker_process_init) supera los 4s por defecto
+    # Las tareas periódicas van a su propia cola: no comparten slot con guiones ni ensamblajes
+    task_routes={
+        RETENTION_GC_TASK_NAME: {"queue": "maintenance"},
+        DISPATCH_ASSEMBLIES_TASK_NAME: {"queue": "maintenance"},
+    },
+    beat_schedule={
+        "retention-gc": {"task": RETENTION_GC_TASK_NAME, "schedule": RETENTION_GC_INTERVAL_S},
+        "dispatch-pending-assemblies": {"task": DISPATCH_ASSEMBLIES_TASK_NAME, "schedule": ASSEMBLY_DISPATCH_INTERVAL_S,
+                                        "options": {"expires": ASSEMBLY_DISPATCH_INTERVAL_S}},
+    },
 )
 
+@celeryd_init.connect
+def remember_worker_queues(options=None, **kwargs):
+    """En el proceso principal del worker: anota sus colas (-Q) antes de crear los procesos hijos."""
+    from app.workers import worker_bootstrap
+    worker_bootstrap.remember_worker_queues((options or {}).get("queues"))
+
+
+@worker_process_init.connect
+def warm_worker_process(**kwargs):
+    """
+    Se ejecuta una vez por proceso worker al arrancar. Precarga lo que usan las tareas de sus
+    colas (tokenizador, fuentes, rutas de ffmpeg/ffprobe, MoviePy, el cliente de TTS, los assets
+    estándar normalizados) para que la primera tarea de un worker nuevo no pague esos costos.
+    """
+    # Import local: la API también importa celery_app y no necesita el stack de medios.
+    from app.workers import worker_bootstrap
+    try:
+        worker_bootstrap.bootstrap_worker_process()
+    except Exception as e:
+        print(f"[WORKER INIT] [WARN] No se pudo completar el arranque en caliente: {e}")
+
 # Si quieres que Celery cargue la configuración desde un archivo de settings de Django, por ejemplo:
 # celery_app.config_from_object('django.conf:settings', namespace='CELERY')
 
@@ -0,0 +1,149 @@
+# app/workers/singleflight.py
+import hashlib
+import json
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from celery import states
+from celery.signals import task_postrun
+
+from app.core.redis_client import get_redis_client
+
+# Deduplicación de trabajo idéntico y locks por proyecto.
+#   IDEMPOTENCY_KEY_TTL_S: cuánto se recuerda una idempotency_key explícita del cliente (mismo resultado al repetir)
+#   IN_FLIGHT_TTL_S:       tope de vida de una clave derivada mientras la tarea corre (por si el worker muere)
+#   ASSEMBLY_LOCK_TTL_S:   expiración del lock de ensamblaje de un proyecto (debe cubrir el render más largo)
+#   ASSEMBLY_LOCK_RETRY_COUNTDOWN_S: cada cuánto reintenta un ensamblaje que encontró el proyecto ocupado
+try:
+    from app.core.config import IDEMPOTENCY_KEY_TTL_S, IN_FLIGHT_TTL_S, ASSEMBLY_LOCK_TTL_S, ASSEMBLY_LOCK_RETRY_COUNTDOWN_S
+except ImportError:
+    IDEMPOTENCY_KEY_TTL_S = 24 * 3600
+    IN_FLIGHT_TTL_S = 3 * 3600
+    ASSEMBLY_LOCK_TTL_S = 3 * 3600
+    ASSEMBLY_LOCK_RETRY_COUNTDOWN_S = 30
+
+_KEY_PREFIX = "singleflight"
+
+# Borra la clave solo si sigue apuntando a la tarea indicada (no pisa una entrada más nueva)
+_RELEASE_LUA = """
+local value = redis.call('GET', KEYS[1])
+if value and cjson.decode(value)['task_id'] == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Reemplaza la entrada solo si no cambió desde que se leyó (tarea anterior fallida)
+_REPLACE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+  return 1
+end
+return 0
+"""
+
+
+def work_key(kind: str, *parts: Any) -> str:
+    """Clave derivada de los parámetros que definen el trabajo (ej. la URL de Reddit y sus opciones)."""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+    return f"{_KEY_PREFIX}:{kind}:{digest}"
+
+
+def idempotency_key(kind: str, client_key: str) -> str:
+    """Clave para una idempotency_key enviada por el cliente."""
+    return f"{_KEY_PREFIX}:{kind}:client:{client_key}"
+
+
+def _previous_attempt_failed(task_id: str) -> bool:
+    from celery.result import AsyncResult
+    from app.workers.celery_app import celery_app
+    result = AsyncResult(task_id, app=celery_app)
+    if result.state in (states.FAILURE, states.REVOKED):
+        return True
+    # Nuestras tareas devuelven {"status": "FAILURE"} en vez de lanzar la excepción
+    return result.state == states.SUCCESS and isinstance(result.result, dict) and result.result.get("status") == "FAILURE"
+
+
+def enqueue_once(
+    key: str,
+    send: Callable[[str], Any],
+    metadata: Optional[Dict[str, Any]] = None,
+    release_on_finish: bool = True,
+    ttl_s: Optional[int] = None
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Encola el trabajo identificado por 'key' solo si no hay otro igual en curso.
+    'send(task_id)' debe publicar la tarea con ese task_id. Devuelve (entrada, creada): si ya
+    había una tarea, 'entrada' trae su task_id (y su metadata) y 'creada' es False.
+    Con release_on_finish la clave se libera al terminar la tarea (solo deduplica trabajo en curso);
+    sin él, se recuerda durante ttl_s (idempotency_key explícita del cliente).
+    """
+    client = get_redis_client()
+    ttl_s = ttl_s or (IN_FLIGHT_TTL_S if release_on_finish else IDEMPOTENCY_KEY_TTL_S)
+    entry = {"task_id": str(uuid.uuid4()), **(metadata or {})}
+    value = json.dumps(entry)
+
+    if not client.set(key, value, nx=True, ex=ttl_s):
+        existing_value = client.get(key)
+        if existing_value is not None:
+            existing = json.loads(existing_value)
+            if not _previous_attempt_failed(existing["task_id"]):
+                print(f"[SingleFlight] Trabajo duplicado ({key}); se adjunta a la tarea {existing['task_id']}.")
+                return existing, False
+            replaced = client.register_script(_REPLACE_LUA)(keys=[key], args=[existing_value, value, ttl_s])
+            if not replaced:
+                # Otro request ganó la carrera de reemplazo: adjuntarse a lo que haya ahora
+                return json.loads(client.get(key) or value), False
+            print(f"[SingleFlight] La tarea anterior {existing['task_id']} falló; se encola de nuevo ({key}).")
+        elif not client.set(key, value, nx=True, ex=ttl_s):
+            return json.loads(client.get(key) or value), False
+
+    if release_on_finish:
+        client.set(f"{_KEY_PREFIX}:task:{entry['task_id']}", key, ex=ttl_s)
+    try:
+        send(entry["task_id"])
+    except Exception:
+        # Si no se pudo publicar, no dejar una clave que apunte a una tarea que nunca va a correr
+        client.register_script(_RELEASE_LUA)(keys=[key], args=[entry["task_id"]])
+        client.delete(f"{_KEY_PREFIX}:task:{entry['task_id']}")
+        raise
+    return entry, True
+
+
+@task_postrun.connect
+def release_finished_task(task_id=None, state=None, **kwargs):
+    """Al terminar una tarea (no en un reintento), libera su clave de deduplicación si la tiene."""
+    if not task_id or state not in states.READY_STATES:
+        return
+    try:
+        client = get_redis_client()
+        reverse_key = f"{_KEY_PREFIX}:task:{task_id}"
+        key = client.get(reverse_key)
+        if key:
+            client.register_script(_RELEASE_LUA)(keys=[key], args=[task_id])
+            client.delete(reverse_key)
+    except Exception as e:
+        print(f"[SingleFlight] [WARN] No se pudo liberar la clave de la tarea {task_id}: {e}")
+
+
+def acquire_project_lock(project_id: str, ttl_s: int = ASSEMBLY_LOCK_TTL_S):
+    """
+    Intenta tomar (sin bloquear) el lock de ensamblaje del proyecto. Devuelve el lock o None
+    si otro worker está renderizando el mismo proyecto.
+    """
+    lock = get_redis_client().lock(f"{_KEY_PREFIX}:lock:assembly:{project_id}", timeout=ttl_s, blocking=False)
+    return lock if lock.acquire() else None
+
+
+def is_project_locked(project_id: str) -> bool:
+    """True si algún worker tiene tomado el lock de ensamblaje del proyecto."""
+    return bool(get_redis_client().exists(f"{_KEY_PREFIX}:lock:assembly:{project_id}"))
+
+
+def release_project_lock(lock):
+    if lock is None:
+        return
+    try:
+        lock.release()
+    except Exception as e: # Ej. el lock expiró durante un render muy largo
+        print(f"[SingleFlight] [WARN] No se pudo liberar el lock '{lock.name}': {e}")
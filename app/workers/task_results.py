@@ -0,0 +1,40 @@
+# app/workers/task_results.py
+from typing import Optional
+
+from app.core.redis_client import get_redis_client
+
+# Resultados de tareas livianos: los tracebacks no van dentro del resultado (que se lee en cada
+# consulta de estado) sino en una clave aparte que se pide solo al investigar un fallo.
+#   RESULT_EXPIRES_S: vida de los resultados de Celery y de los tracebacks en Redis
+try:
+    from app.core.config import RESULT_EXPIRES_S
+except ImportError:
+    RESULT_EXPIRES_S = 3 * 24 * 3600
+
+_TRACEBACK_KEY_PREFIX = "task_traceback"
+
+
+def _traceback_key(task_id: str) -> str:
+    return f"{_TRACEBACK_KEY_PREFIX}:{task_id}"
+
+
+def store_traceback(traceback_text: str, task_id: Optional[str] = None) -> bool:
+    """
+    Guarda el traceback de la tarea en curso (o de task_id) para GET /tasks/{task_id}/traceback.
+    Devuelve True si quedó guardado (el resultado lo indica con 'has_traceback').
+    """
+    if task_id is None:
+        from celery import current_task
+        task_id = current_task.request.id if current_task else None
+    if not task_id:
+        return False
+    try:
+        get_redis_client().set(_traceback_key(task_id), traceback_text, ex=RESULT_EXPIRES_S)
+        return True
+    except Exception as e:
+        print(f"[Task Results] [WARN] No se pudo guardar el traceback de la tarea {task_id}: {e}")
+        return False
+
+
+def get_traceback(task_id: str) -> Optional[str]:
+    return get_redis_client().get(_traceback_key(task_id))
@@ -0,0 +1,25 @@
+# app/workers/tasks/maintenance_tasks.py
+from typing import Any, Dict, Optional
+
+from app.workers.celery_app import celery_app, RETENTION_GC_TASK_NAME, DISPATCH_ASSEMBLIES_TASK_NAME
+from app.workers import singleflight, assembly_scheduler
+from app.services import retention_service
+
+
+@celery_app.task(name=RETENTION_GC_TASK_NAME)
+def run_retention_gc_task(dry_run: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Tarea periódica (Celery beat): borra intermedios de proyectos terminados y aplica la cuota
+    global en orden LRU. Devuelve el reporte (con dry_run, lo que se borraría).
+    """
+    def is_busy(project_id: str) -> bool:
+        # Se consulta justo antes de cada borrado: un ensamblaje pudo encolarse durante la pasada
+        return singleflight.is_project_locked(project_id) or project_id in assembly_scheduler.queued_project_ids()
+
+    return retention_service.run_gc(dry_run=dry_run, is_busy=is_busy)
+
+
+@celery_app.task(name=DISPATCH_ASSEMBLIES_TASK_NAME)
+def dispatch_pending_assemblies_task():
+    """Red de seguridad del planificador: despacha pendientes si un worker murió sin liberar su slot."""
+    assembly_scheduler.dispatch_pending()
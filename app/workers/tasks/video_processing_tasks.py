@@ -1,22 +1,44 @@
 # video_generator_reddit/app/workers/tasks/video_processing_tasks.py
 import os
 import uuid
-import json # <--- AÑADIR IMPORTACIÓN DE JSON
-from typing import Dict, Any # List, Optional (asegúrate que estén si los usas)
+from typing import Dict, Any, Optional, List
 
-from app.workers.celery_app import celery_app
-from app.services import script_generation_service, video_assembly_service, scraping_service
+from app.workers.celery_app import celery_app, GENERATE_SCRIPT_TASK_NAME, ASSEMBLE_VIDEO_TASK_NAME
+from app.workers import singleflight, assembly_scheduler, task_results # assembly_scheduler: registra la liberación de slots al terminar
+from app.services import script_generation_service, video_assembly_service, scraping_service, storage_service, script_manifest_service
+from app.services import profiling_service, subtitle_service, retention_service, script_journal_service, tts_service
 
-@celery_app.task(name="tasks.generate_script_and_audio_for_post", bind=True) # bind=True para poder reintentar
+# acks_late + reject_on_worker_lost: si el worker muere a mitad de la tarea, el mensaje vuelve a la cola
+# y el reintento retoma desde el diario de progreso del proyecto (script_journal_service)
+@celery_app.task(name=GENERATE_SCRIPT_TASK_NAME, bind=True, acks_late=True, reject_on_worker_lost=True) # bind=True para poder reintentar
 def generate_script_and_audio_for_post_task(
     self, # self es el contexto de la tarea cuando bind=True
     reddit_url: str, 
     num_comments: int, 
     project_id: str,
-    target_narration_language: str = "español"
+    target_narration_language: str = "español",
+    tts_mode: str = "sentence", # "sentence" o "block_ssml" (un request SSML con timepoints por bloque)
+    target_duration_s: Optional[float] = None, # Duración objetivo de la narración; el contenido se recorta antes del TTS
+    profile: bool = False, # Guarda un perfil (pstats + pilas collapsed) en outputs/profiles/<project_id>/
+    tts_backend: Optional[str] = None # "google" o "local"; None = TTS_BACKEND_DEFAULT
 ) -> Dict[str, Any]:
     print(f"[CELERY TASK - {project_id} - ID: {self.request.id}] Iniciando para URL: {reddit_url}")
+    return profiling_service.call_profiled(
+        profile, project_id, "generate_script", self.request.id,
+        _generate_script_and_audio_for_post,
+        reddit_url, num_comments, project_id, target_narration_language, tts_mode, target_duration_s, tts_backend
+    )
 
+
+def _generate_script_and_audio_for_post(
+    reddit_url: str,
+    num_comments: int,
+    project_id: str,
+    target_narration_language: str,
+    tts_mode: str,
+    target_duration_s: Optional[float],
+    tts_backend: Optional[str] = None
+) -> Dict[str, Any]:
     try:
         print(f"[CELERY TASK - {project_id}] Obteniendo datos de Reddit...")
         reddit_content = scraping_service.get_post_data_from_url(
@@ -36,7 +58,10 @@ def generate_script_and_audio_for_post_task(
         script_segments_data = script_generation_service.create_script_segments(
             reddit_data=reddit_content,
             project_id=project_id,
-            target_narration_language=target_narration_language
+            target_narration_language=target_narration_language,
+            tts_mode=tts_mode,
+            tts_backend=tts_backend,
+            target_duration_s=target_duration_s
         )
 
         if not script_segments_data:
@@ -44,26 +69,26 @@ def generate_script_and_audio_for_post_task(
             print(f"[CELERY TASK - {project_id}] {message}")
             return {"project_id": project_id, "status": "COMPLETED_EMPTY", "message": message}
 
-        # --- LÓGICA PARA GUARDAR EL SCRIPT JSON ---
-        script_output_base_dir = "/usr/src/app/outputs/scripts"
-        project_script_dir = os.path.join(script_output_base_dir, project_id)
-        os.makedirs(project_script_dir, exist_ok=True)
-        
-        script_filepath = os.path.join(project_script_dir, "script_data.json")
-        try:
-            with open(script_filepath, 'w', encoding='utf-8') as f:
-                json.dump(script_segments_data, f, ensure_ascii=False, indent=4)
+        # --- LÓGICA PARA GUARDAR EL MANIFIESTO DEL GUION ---
+        tts_backend_used = tts_service.get_tts_backend(tts_backend)
+        script_key = script_manifest_service.write_manifest(project_id, script_segments_data, tts_info={
+            "mode": tts_mode, "backend": tts_backend_used.name, "voice_id": tts_backend_used.voice_id,
+        })
+        if script_key:
+            script_filepath = storage_service.get_storage().local_path(script_key)
             print(f"[CELERY TASK - {project_id}] Guion guardado exitosamente en: {script_filepath}")
-            save_message = f"Guion y audios generados. Guion JSON guardado en {script_filepath}."
-        except Exception as e_save:
-            save_message = f"Guion y audios generados, pero falló al guardar el guion JSON: {e_save}"
-            print(f"[CELERY TASK - {project_id}] ERROR al guardar JSON: {save_message}")
+            script_journal_service.discard_journal(project_id)
+            save_message = f"Guion y audios generados. Manifiesto del guion guardado en {script_filepath}."
+        else:
+            save_message = "Guion y audios generados, pero falló al guardar el manifiesto del guion."
+            print(f"[CELERY TASK - {project_id}] ERROR al guardar el manifiesto: {save_message}")
             # Considerar si esto debe hacer que la tarea falle
-            # raise self.retry(exc=e_save, countdown=60) o devolver FAILURE
-            return {"project_id": project_id, "status": "PARTIAL_SUCCESS", "message": save_message, "error_saving_script": str(e_save)}
+            # raise self.retry(countdown=60) o devolver FAILURE
+            return {"project_id": project_id, "status": "PARTIAL_SUCCESS", "message": save_message, "error_saving_script": save_message}
         # --- FIN LÓGICA PARA GUARDAR ---
         
-        audio_base_path = os.path.join("/usr/src/app/outputs/audio", project_id)
+        retention_service.track_project(project_id)
+        audio_base_path = storage_service.storage_key("outputs/audio", project_id)
         success_message = f"Proceso completado para project_id: {project_id}. {len(script_segments_data)} segmentos creados. {save_message}"
         print(f"[CELERY TASK - {project_id}] ÉXITO: {success_message}")
         
@@ -72,6 +97,7 @@ def generate_script_and_audio_for_post_task(
             "status": "SUCCESS", 
             "message": success_message,
             "script_path": script_filepath,
+            "script_key": script_key,
             "audio_paths_base": audio_base_path
         }
 
@@ -83,32 +109,99 @@ def generate_script_and_audio_for_post_task(
         # Para que Celery maneje el reintento o el fallo:
         # self.update_state(state='FAILURE', meta={'exc_type': type(e).__name__, 'exc_message': traceback.format_exc()})
         # raise Ignore() # Para evitar que se reintente si no quieres, o simplemente no relanzar y devolver un estado de fallo
-        return {"project_id": project_id, "status": "FAILURE", "message": error_message, "error_details": traceback.format_exc()}
+        return {"project_id": project_id, "status": "FAILURE", "message": error_message, "has_traceback": task_results.store_traceback(traceback.format_exc())}
 
-@celery_app.task(name="tasks.assemble_video_from_project_id", bind=True)
+@celery_app.task(name=ASSEMBLE_VIDEO_TASK_NAME, bind=True)
 def assemble_video_from_project_id_task(
     self, # Contexto de la tarea Celery
     project_id: str, 
     output_filename: str = "final_video.mp4", # Podrías hacerlo configurable si quieres
+    intro_asset: Optional[str] = None, # Nombre de asset estándar (ver asset_cache_service)
+    outro_asset: Optional[str] = None,
+    output_profiles: Optional[List[str]] = None, # Si se indica, se renderizan todas las variantes en una pasada
+    profile: bool = False, # Guarda un perfil (pstats, pilas collapsed y tiempos por frame) en outputs/profiles/<project_id>/
+    caption_mode: Optional[str] = None, # "textclip", "burn_in" (libass) o "soft" (pista mov_text); None = config
     # Otros parámetros de video_assembly_service podrían pasarse aquí si es necesario
 ) -> Dict[str, Any]:
     """
     Tarea Celery para ensamblar el video final a partir de un project_id
-    para el cual ya existe un script_data.json y los archivos de audio.
+    para el cual ya existe el manifiesto del guion (o un script_data.json antiguo) y los archivos de audio.
     """
     print(f"[CELERY TASK - {project_id} - ID: {self.request.id}] Iniciando: assemble_video_from_project_id_task")
 
+    # Dos ensamblajes del mismo proyecto escribirían el mismo archivo: se serializan con un lock en Redis.
+    # Si otro worker lo tiene, la tarea se reintenta más tarde en vez de ocupar este worker esperando.
+    project_lock = singleflight.acquire_project_lock(project_id)
+    if project_lock is None:
+        print(f"[CELERY TASK - {project_id}] Otro ensamblaje del proyecto está en curso; reintentando en {singleflight.ASSEMBLY_LOCK_RETRY_COUNTDOWN_S}s.")
+        raise self.retry(
+            countdown=singleflight.ASSEMBLY_LOCK_RETRY_COUNTDOWN_S,
+            max_retries=singleflight.ASSEMBLY_LOCK_TTL_S // singleflight.ASSEMBLY_LOCK_RETRY_COUNTDOWN_S
+        )
+
+    try:
+        return profiling_service.call_profiled(
+            profile, project_id, "assemble_video", self.request.id,
+            _assemble_video_from_project_id, project_id, output_filename, intro_asset, outro_asset, output_profiles, caption_mode
+        )
+    finally:
+        singleflight.release_project_lock(project_lock)
+
+
+def _assemble_video_from_project_id(
+    project_id: str,
+    output_filename: str,
+    intro_asset: Optional[str],
+    outro_asset: Optional[str],
+    output_profiles: Optional[List[str]],
+    caption_mode: Optional[str]
+) -> Dict[str, Any]:
     try:
+        if output_profiles:
+            output_basename = os.path.splitext(output_filename)[0]
+            rendered_variants = video_assembly_service.assemble_video_variants_from_script(
+                project_id=project_id,
+                output_profiles=output_profiles,
+                output_basename=output_basename,
+                intro_asset=intro_asset,
+                outro_asset=outro_asset,
+                caption_mode=caption_mode
+            )
+            if rendered_variants:
+                message = f"{len(rendered_variants)} variantes de video ensambladas para project_id: {project_id}"
+                print(f"[CELERY TASK - {project_id}] ÉXITO: {message}")
+                storage = storage_service.get_storage()
+                for variant in rendered_variants:
+                    variant["video_key"] = storage_service.key_from_local_path(variant["video_path"])
+                    variant["video_url"] = storage.presigned_url(variant["video_key"])
+                    variant["delivery_url"] = storage_service.delivery_path(variant["video_key"])
+                retention_service.confirm_final_video(project_id, [variant["video_key"] for variant in rendered_variants])
+                return {"project_id": project_id, "status": "SUCCESS", "message": message,
+                        "video_path": rendered_variants[0]["video_path"], "video_url": rendered_variants[0]["video_url"],
+                        "delivery_url": rendered_variants[0]["delivery_url"],
+                        "variants": rendered_variants, "subtitles": _subtitle_links(project_id)}
+            message = f"Falló el ensamblaje de las variantes de video para project_id: {project_id}"
+            print(f"[CELERY TASK - {project_id}] ERROR: {message}")
+            return {"project_id": project_id, "status": "FAILURE", "message": message}
+
         video_file_path = video_assembly_service.assemble_video_from_script(
             project_id=project_id,
-            output_filename=output_filename
+            output_filename=output_filename,
+            intro_asset=intro_asset,
+            outro_asset=outro_asset,
+            caption_mode=caption_mode
             # Pasar otros args como video_resolution, fps si se hicieron parámetros de la tarea
         )
 
         if video_file_path:
             message = f"Video ensamblado exitosamente para project_id: {project_id}"
             print(f"[CELERY TASK - {project_id}] ÉXITO: {message}. Video en: {video_file_path}")
-            return {"project_id": project_id, "status": "SUCCESS", "message": message, "video_path": video_file_path}
+            video_key = storage_service.key_from_local_path(video_file_path)
+            video_url = storage_service.get_storage().presigned_url(video_key)
+            retention_service.confirm_final_video(project_id, [video_key])
+            return {"project_id": project_id, "status": "SUCCESS", "message": message, "video_path": video_file_path,
+                    "video_key": video_key, "video_url": video_url, "delivery_url": storage_service.delivery_path(video_key),
+                    "subtitles": _subtitle_links(project_id)}
         else:
             message = f"Falló el ensamblaje del video para project_id: {project_id} (el servicio no devolvió ruta)."
             print(f"[CELERY TASK - {project_id}] ERROR: {message}")
@@ -119,4 +212,16 @@ def assemble_video_from_project_id_task(
         print(f"[CELERY TASK - {project_id}] ERROR CRÍTICO: {error_message}")
         import traceback
         traceback.print_exc()
-        return {"project_id": project_id, "status": "FAILURE", "message": error_message, "error_details": traceback.format_exc()}
\ No newline at end of file
+        return {"project_id": project_id, "status": "FAILURE", "message": error_message, "has_traceback": task_results.store_traceback(traceback.format_exc())}
+
+
+def _subtitle_links(project_id: str) -> Optional[Dict[str, Any]]:
+    """Claves (y URLs firmadas en S3) de los subtítulos ASS/SRT descargables del proyecto."""
+    storage = storage_service.get_storage()
+    links = {}
+    for subtitle_format, key in subtitle_service.subtitle_keys(project_id).items():
+        if storage.exists(key):
+            links[f"{subtitle_format}_key"] = key
+            links[f"{subtitle_format}_url"] = storage.presigned_url(key)
+            links[f"{subtitle_format}_delivery_url"] = storage_service.delivery_path(key)
+    return links or None
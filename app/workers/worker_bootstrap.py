@@ -0,0 +1,139 @@
+# app/workers/worker_bootstrap.py
+import json
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List
+
+# Arranque en caliente del proceso worker (worker_process_init). Todo lo que una tarea pagaría
+# la primera vez (imports pesados, tokenizador, rutas de ffmpeg, fuentes, clientes, assets
+# normalizados) se carga aquí una sola vez por proceso.
+#   WORKER_WARMUP_STEPS: pasos del arranque por cola que consume el worker (-Q); con varias colas se
+#   ejecuta la unión y con una cola sin entrada, todos los pasos. La variable de entorno
+#   WORKER_WARMUP_STEPS (ej. "ffmpeg,moviepy") fija los pasos de un servicio concreto.
+try:
+    from app.core.config import WORKER_WARMUP_STEPS
+except ImportError:
+    WORKER_WARMUP_STEPS = {
+        "celery": ["ffmpeg", "tokenizer", "tts_client"], # Guiones: TTS, frases y ffprobe de la biblioteca de clips
+        "assembly_light": ["ffmpeg", "moviepy", "fonts", "standard_assets"],
+        "assembly_heavy": ["ffmpeg", "moviepy", "fonts", "standard_assets"],
+        "maintenance": ["ffmpeg"], # GC y despacho: sin MoviePy, TTS ni assets
+    }
+ALL_WARMUP_STEPS = ["ffmpeg", "moviepy", "tokenizer", "fonts", "tts_client", "standard_assets"]
+
+# Colas del worker: las anota el proceso principal (señal celeryd_init) y las heredan los procesos hijos
+WORKER_QUEUES_ENV = "CELERY_WORKER_QUEUES"
+
+_WARMUP_REPORT_TTL_S = 7 * 24 * 3600
+
+# Resultado del arranque de este proceso: {"total_s": ..., "steps": {paso: {"s": ..., "ok": ...}}}
+warmup_report: Dict[str, Any] = {}
+
+
+def _warm_ffmpeg() -> str:
+    from app.services import ffmpeg_utils
+    ffmpeg_binary, ffprobe_binary = ffmpeg_utils.get_ffmpeg_binary(), ffmpeg_utils.get_ffprobe_binary()
+    # MoviePy resuelve su binario al importar moviepy.config: que use el mismo y no lo busque con imageio
+    os.environ.setdefault("FFMPEG_BINARY", ffmpeg_binary)
+    return f"{ffmpeg_binary}, {ffprobe_binary}"
+
+
+def _warm_moviepy() -> str:
+    import numpy # noqa: F401
+    import moviepy
+    from moviepy.config import FFMPEG_BINARY
+    return f"moviepy {getattr(moviepy, '__version__', '?')} con {FFMPEG_BINARY}"
+
+
+def _warm_tokenizer() -> str:
+    import nltk
+    # sent_tokenize carga (y cachea) el modelo punkt del idioma en la primera llamada
+    nltk.sent_tokenize("Primera frase. Segunda frase.", language="spanish")
+    return "punkt (spanish)"
+
+
+def _warm_fonts() -> str:
+    from app.services import video_assembly_service, asset_cache_service
+    for video_resolution, _ in asset_cache_service.ASSET_CACHE_WARM_PROFILES:
+        video_assembly_service.warm_caption_rendering(tuple(video_resolution))
+        video_assembly_service.get_transition_spacer_clip(tuple(video_resolution), 1.0)
+    return video_assembly_service.CAPTION_FONT_PATH
+
+
+def _warm_tts_client() -> str:
+    from app.services import tts_service
+    # Motor por defecto del worker: clientes gRPC de Google, o binario/modelo del motor local
+    return tts_service.get_tts_backend().warm()
+
+
+def _warm_standard_assets() -> str:
+    from app.services import asset_cache_service
+    return f"{len(asset_cache_service.warm_standard_assets())} assets"
+
+
+_WARMUP_FUNCTIONS: Dict[str, Callable[[], str]] = {
+    "ffmpeg": _warm_ffmpeg,
+    "moviepy": _warm_moviepy,
+    "tokenizer": _warm_tokenizer,
+    "fonts": _warm_fonts,
+    "tts_client": _warm_tts_client,
+    "standard_assets": _warm_standard_assets,
+}
+
+
+def remember_worker_queues(queues):
+    """Anota las colas del worker (-Q) para que cada proceso hijo elija sus pasos de arranque."""
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    os.environ[WORKER_QUEUES_ENV] = ",".join(q.strip() for q in (queues or []) if q.strip())
+
+
+def warmup_steps_for_worker() -> List[str]:
+    """Pasos de arranque de este worker según WORKER_WARMUP_STEPS (env o config) y sus colas."""
+    env_steps = os.environ.get("WORKER_WARMUP_STEPS")
+    if env_steps is not None:
+        return [step.strip() for step in env_steps.split(",") if step.strip()]
+    if isinstance(WORKER_WARMUP_STEPS, list): # Formato anterior: una sola lista para todos los workers
+        return WORKER_WARMUP_STEPS
+    queues = [q for q in os.environ.get(WORKER_QUEUES_ENV, "").split(",") if q] or ["celery"] # Sin -Q: cola por defecto
+    if any(queue not in WORKER_WARMUP_STEPS for queue in queues):
+        return ALL_WARMUP_STEPS
+    selected = {step for queue in queues for step in WORKER_WARMUP_STEPS[queue]}
+    return [step for step in ALL_WARMUP_STEPS if step in selected] + sorted(selected - set(ALL_WARMUP_STEPS))
+
+
+def _publish_report(report: Dict[str, Any]):
+    """Deja el reporte en Redis (worker_warmup:<host>:<pid>) para compararlo entre workers."""
+    try:
+        from app.core.redis_client import get_redis_client
+        key = f"worker_warmup:{socket.gethostname()}:{os.getpid()}"
+        get_redis_client().set(key, json.dumps(report), ex=_WARMUP_REPORT_TTL_S)
+    except Exception as e:
+        print(f"[WORKER INIT] [WARN] No se pudo publicar el reporte de arranque: {e}")
+
+
+def bootstrap_worker_process() -> Dict[str, Any]:
+    """Ejecuta en orden los pasos de este worker. Un paso que falla no detiene a los demás."""
+    steps: Dict[str, Dict[str, Any]] = {}
+    total_start = time.perf_counter()
+    for step_name in warmup_steps_for_worker():
+        warm = _WARMUP_FUNCTIONS.get(step_name)
+        if warm is None:
+            print(f"[WORKER INIT] [WARN] Paso de arranque desconocido: '{step_name}'")
+            continue
+        step_start = time.perf_counter()
+        try:
+            detail, ok = warm(), True
+        except Exception as e:
+            detail, ok = f"{type(e).__name__}: {e}", False
+        elapsed_s = time.perf_counter() - step_start
+        steps[step_name] = {"s": round(elapsed_s, 3), "ok": ok, "detail": detail}
+        print(f"[WORKER INIT] {step_name}: {elapsed_s:.2f}s {'' if ok else '[WARN] '}({detail})")
+
+    warmup_report.clear()
+    warmup_report.update({"pid": os.getpid(), "finished_at": time.time(),
+                          "total_s": round(time.perf_counter() - total_start, 3), "steps": steps})
+    print(f"[WORKER INIT] Proceso {os.getpid()} listo en {warmup_report['total_s']:.2f}s.")
+    _publish_report(warmup_report)
+    return warmup_report
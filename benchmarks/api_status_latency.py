@@ -0,0 +1,114 @@
+# benchmarks/api_status_latency.py
+"""
+Prueba de carga local: mide la latencia (p50/p95/p99) de GET /api/v1/tasks/status/{id}
+primero sin carga y luego mientras hay vistas previas de Reddit en curso
+(POST /api/v1/reddit/fetch-reddit-post/). Con la API no bloqueante, el p99 del estado
+debe mantenerse plano aunque las vistas previas tarden varios segundos.
+
+Uso (con docker compose levantado):
+    python benchmarks/api_status_latency.py --base-url http://localhost:8000 --preview-workers 8
+"""
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_REDDIT_URL = "https://www.reddit.com/r/AskReddit/comments/1koz7pi/whats_a_dead_feature_of_the_internet_you_still/"
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure_status_latency(base_url: str, num_requests: int, concurrency: int):
+    """Lanza num_requests consultas de estado y devuelve (latencias_ms, errores)."""
+    status_url = f"{base_url}/api/v1/tasks/status/{{task_id}}"
+    latencies_ms, errors = [], 0
+    lock = threading.Lock()
+
+    def one_request(_):
+        nonlocal errors
+        session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.get(status_url.format(task_id=uuid.uuid4()), timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            if ok:
+                latencies_ms.append(elapsed_ms)
+            else:
+                errors += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(num_requests)))
+    return latencies_ms, errors
+
+
+def preview_load(base_url: str, reddit_url: str, stop_event: threading.Event, counters: dict):
+    """Mantiene una vista previa de Reddit en curso hasta que se pida parar."""
+    session = requests.Session()
+    while not stop_event.is_set():
+        try:
+            response = session.post(
+                f"{base_url}/api/v1/reddit/fetch-reddit-post/",
+                params={"reddit_url": reddit_url, "num_comments": 5},
+                timeout=60,
+            )
+            counters[response.status_code] = counters.get(response.status_code, 0) + 1
+        except requests.RequestException:
+            counters["error"] = counters.get("error", 0) + 1
+
+
+def report(label: str, latencies_ms, errors):
+    print(f"{label:<28} n={len(latencies_ms):<5} errores={errors:<4} "
+          f"p50={percentile(latencies_ms, 50):8.1f}ms  p95={percentile(latencies_ms, 95):8.1f}ms  "
+          f"p99={percentile(latencies_ms, 99):8.1f}ms  media={statistics.mean(latencies_ms) if latencies_ms else float('nan'):8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--reddit-url", default=DEFAULT_REDDIT_URL)
+    parser.add_argument("--status-requests", type=int, default=500)
+    parser.add_argument("--status-concurrency", type=int, default=10)
+    parser.add_argument("--preview-workers", type=int, default=8)
+    parser.add_argument("--warmup-s", type=float, default=2.0, help="Espera para que las vistas previas estén en curso")
+    args = parser.parse_args()
+
+    baseline_latencies, baseline_errors = measure_status_latency(args.base_url, args.status_requests, args.status_concurrency)
+    report("Estado sin carga", baseline_latencies, baseline_errors)
+
+    stop_event = threading.Event()
+    preview_counters = {}
+    preview_threads = [
+        threading.Thread(target=preview_load, args=(args.base_url, args.reddit_url, stop_event, preview_counters), daemon=True)
+        for _ in range(args.preview_workers)
+    ]
+    for thread in preview_threads:
+        thread.start()
+    time.sleep(args.warmup_s)
+    try:
+        loaded_latencies, loaded_errors = measure_status_latency(args.base_url, args.status_requests, args.status_concurrency)
+    finally:
+        stop_event.set()
+    report(f"Estado con {args.preview_workers} previews", loaded_latencies, loaded_errors)
+    print(f"Respuestas de las vistas previas durante la prueba: {preview_counters}")
+
+    if baseline_latencies and loaded_latencies:
+        ratio = percentile(loaded_latencies, 99) / max(percentile(baseline_latencies, 99), 0.001)
+        print(f"p99 con carga / p99 sin carga: {ratio:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/compositor_fps.py
+"""
+Compara frames/segundo del compositor plano (FlatTimelineCompositor) contra el grafo anidado
+de MoviePy (CompositeVideoClip + concatenate_videoclips) para un proyecto existente.
+Solo mide la composición (sin codificar) y verifica que ambos produzcan los mismos frames.
+
+Uso (dentro del contenedor del worker, desde /usr/src/app):
+    python benchmarks/compositor_fps.py <project_id>
+    python benchmarks/compositor_fps.py <project_id> --seconds 20 --fps 24 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import video_assembly_service # noqa: E402
+
+COMPOSITORS = {
+    "moviepy": video_assembly_service._compose_final_video,
+    "flat": video_assembly_service._compose_final_video_flat,
+}
+
+
+def measure(compose, project_id: str, resolution: tuple, fps: int, seconds: float):
+    """Compone el proyecto y recorre sus frames. Devuelve (métricas, frames de muestra por tiempo)."""
+    build_start = time.perf_counter()
+    clip = compose(project_id, resolution, 1.0)
+    build_s = time.perf_counter() - build_start
+    if clip is None:
+        return None, {}
+    duration_s = min(clip.duration, seconds) if seconds else clip.duration
+    frame_count = int(duration_s * fps)
+    samples = {}
+    frames_start = time.perf_counter()
+    for index in range(frame_count):
+        frame = clip.get_frame(index / fps)
+        if index % fps == 0: # Un frame por segundo para comparar
+            samples[index] = frame.copy()
+    frames_s = time.perf_counter() - frames_start
+    return {
+        "build_s": round(build_s, 3),
+        "frames": frame_count,
+        "frames_s": round(frames_s, 3),
+        "fps": round(frame_count / frames_s, 2) if frames_s else None,
+    }, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project_id")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=int, default=24)
+    parser.add_argument("--seconds", type=float, default=30.0, help="Segundos del video a recorrer (0 = todo)")
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado como JSON")
+    args = parser.parse_args()
+
+    import numpy as np
+    resolution = (args.width, args.height)
+    results, samples = {}, {}
+    for name, compose in COMPOSITORS.items():
+        results[name], samples[name] = measure(compose, args.project_id, resolution, args.fps, args.seconds)
+        if results[name] is None:
+            print(f"[ERROR] El compositor '{name}' no pudo componer el proyecto {args.project_id}.")
+            sys.exit(1)
+
+    # Diferencia máxima por canal entre ambos compositores (redondeo del blend: se espera <= 1-2)
+    common = sorted(set(samples["moviepy"]) & set(samples["flat"]))
+    max_diff = max((int(np.abs(samples["moviepy"][i].astype(np.int16) - samples["flat"][i].astype(np.int16)).max())
+                    for i in common), default=None)
+    results["speedup"] = round(results["flat"]["fps"] / results["moviepy"]["fps"], 2) \
+        if results["flat"]["fps"] and results["moviepy"]["fps"] else None
+    results["max_pixel_diff"] = max_diff
+    results["compared_frames"] = len(common)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name in COMPOSITORS:
+        r = results[name]
+        print(f"{name:>8}: {r['fps']:8.2f} fps  ({r['frames']} frames en {r['frames_s']:.2f}s, armado {r['build_s']:.2f}s)")
+    print(f" speedup: x{results['speedup']}")
+    print(f"diferencia máxima de píxel: {max_diff} ({len(common)} frames comparados)")
+
+
+if __name__ == "__main__":
+    main()
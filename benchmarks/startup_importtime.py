@@ -0,0 +1,91 @@
+# benchmarks/startup_importtime.py
+"""
+Mide el costo de importación en frío de la API y del worker con `python -X importtime`.
+Reporta el tiempo total, los módulos de primer nivel más pesados y avisa si la API
+carga alguno de los paquetes pesados del stack de medios (deben cargarse solo en el worker).
+
+Uso (dentro del contenedor, desde /usr/src/app):
+    python benchmarks/startup_importtime.py
+    python benchmarks/startup_importtime.py --top 15 --json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+TARGETS = {
+    "api": "import app.main",
+    "worker": "from app.workers.celery_app import celery_app; celery_app.loader.import_default_modules()",
+}
+
+# Paquetes que la API no debería importar al arrancar
+HEAVY_MODULES = ["moviepy", "nltk", "google.cloud.texttospeech", "openai", "praw", "numpy", "mutagen"]
+
+# "import time:      self [us] | cumulative | imported package"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def measure_import(statement: str, cwd: str):
+    """Ejecuta el import en un intérprete nuevo y devuelve la lista de (módulo, nivel, self_us, cumulative_us)."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        print(f"[WARN] El import terminó con código {completed.returncode}:\n{completed.stderr[-2000:]}")
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        # Cada nivel de anidamiento agrega dos espacios después de la barra
+        entries.append((module, (len(indent) - 1) // 2, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def summarize(entries, top: int):
+    top_level = [e for e in entries if e[1] == 0]
+    loaded = {e[0] for e in entries}
+    return {
+        "total_ms": round(sum(e[3] for e in top_level) / 1000.0, 1),
+        "modules_loaded": len(loaded),
+        "heaviest": [
+            {"module": module, "cumulative_ms": round(cumulative_us / 1000.0, 1)}
+            for module, _, _, cumulative_us in sorted(top_level, key=lambda e: e[3], reverse=True)[:top]
+        ],
+        "heavy_modules_loaded": [m for m in HEAVY_MODULES if m in loaded],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cwd", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="Directorio raíz del proyecto (donde está el paquete 'app')")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado como JSON")
+    args = parser.parse_args()
+
+    results = {name: summarize(measure_import(statement, args.cwd), args.top) for name, statement in TARGETS.items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name, summary in results.items():
+        print(f"\n=== {name}: {summary['total_ms']:.1f} ms, {summary['modules_loaded']} módulos ===")
+        for item in summary["heaviest"]:
+            print(f"  {item['cumulative_ms']:9.1f} ms  {item['module']}")
+        if summary["heavy_modules_loaded"]:
+            print(f"  Paquetes pesados cargados: {', '.join(summary['heavy_modules_loaded'])}")
+
+    api_heavy = results["api"]["heavy_modules_loaded"]
+    if api_heavy:
+        print(f"\n[WARN] La API importa paquetes del stack de medios al arrancar: {', '.join(api_heavy)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# tests/conftest.py
+# Las pruebas importan el paquete app desde la raíz del repositorio (igual que benchmarks/).
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+# tests/test_script_manifest_service.py
+"""Ida y vuelta del manifiesto (write_manifest -> ManifestReader) y de la migración de script_data.json."""
+import json
+
+import pytest
+
+pytest.importorskip("msgpack")
+
+from app.services import script_manifest_service, storage_service # noqa: E402
+
+PROJECT_ID = "p1"
+
+
+@pytest.fixture(autouse=True)
+def local_storage(tmp_path, monkeypatch):
+    storage = storage_service.LocalStorageBackend(base_dir=str(tmp_path))
+    monkeypatch.setattr(storage_service, "get_storage", lambda: storage)
+    return storage
+
+
+def _segment(order: int, source_type: str, text: str, prompt, **fields):
+    segment = {
+        "id": f"seg_{PROJECT_ID}_{order:03d}",
+        "segment_order": order,
+        "text_chunk": text,
+        "actual_tts_audio_url": f"outputs/audio/{PROJECT_ID}/{source_type}/segment_{order:03d}.mp3",
+        "actual_tts_duration_ms": 1000 + order,
+        "audio_offset_ms": 0,
+        "source_type": source_type,
+        "visual_type": "static_video",
+        "visual_asset_url": f"outputs/videos/{PROJECT_ID}/{source_type}.mp4",
+        "visual_asset_url_is_loopable": True,
+        "visual_prompt_or_keyword": prompt,
+        "visual_duration_ms": 1000 + order,
+        "transition_to_next": "cut", "subtitles_enabled": True, "voice_options": None,
+    }
+    segment.update(fields)
+    return segment
+
+
+def _read_back():
+    return script_manifest_service.open_project_manifest(PROJECT_ID).load_all_segments()
+
+
+def test_round_trip_keeps_every_segment_field():
+    segments = [
+        _segment(1, "title", "Un título", "gatos, ciudad"),
+        # Prompt igual al inicio del texto en una escena con keywords: no debe leerse como las keywords
+        _segment(2, "title", "Una frase del título", "Una frase del título"),
+        _segment(3, "title", "Sin prompt", None),
+        _segment(4, "comment_1", "Comentario sin keywords", "Comentario sin keywords"),
+        _segment(5, "comment_1", "Otra frase", "Otra frase", mood="tenso", transition_to_next="fade"),
+    ]
+    assert script_manifest_service.write_manifest(PROJECT_ID, segments)
+    assert _read_back() == segments
+
+
+def test_migration_keeps_unknown_segment_and_top_level_fields(local_storage):
+    segments = [_segment(1, "title", "Un título", "gatos", legacy_score=0.7)]
+    json_key = script_manifest_service.legacy_json_key(PROJECT_ID)
+    with open(local_storage.local_path(json_key), "w", encoding="utf-8") as f:
+        json.dump({"post_id": "abc123", "segments": segments}, f)
+
+    manifest = script_manifest_service.open_project_manifest(PROJECT_ID)
+    assert manifest.extra == {"post_id": "abc123"}
+    assert manifest.load_all_segments() == segments
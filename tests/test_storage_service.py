@@ -0,0 +1,105 @@
+# tests/test_storage_service.py
+"""
+Ida y vuelta del backend S3 contra un bucket simulado con moto: dos nodos con su propia cache
+local leen y escriben las mismas claves.
+
+Uso: pip install -r requirements-dev.txt && python -m pytest tests/
+"""
+import os
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from app.services import storage_service # noqa: E402
+
+BUCKET = "video-generator-test"
+REGION = "us-east-1"
+mock_s3 = getattr(moto, "mock_aws", None) or moto.mock_s3 # moto >= 5 / anteriores
+
+
+def _node(cache_dir) -> storage_service.S3StorageBackend:
+    return storage_service.S3StorageBackend(
+        bucket=BUCKET, endpoint_url=None, region=REGION,
+        access_key_id="testing", secret_access_key="testing", cache_dir=str(cache_dir),
+    )
+
+
+@pytest.fixture
+def s3_nodes(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_s3():
+        boto3.client("s3", region_name=REGION).create_bucket(Bucket=BUCKET)
+        yield _node(tmp_path / "node_a"), _node(tmp_path / "node_b")
+
+
+def _put(node, key: str, content: str):
+    with open(node.local_path(key), "w", encoding="utf-8") as f:
+        f.write(content)
+    assert node.save_file(key)
+
+
+def _read(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_put_and_ensure_local_downloads_into_the_other_node_cache(s3_nodes):
+    writer, reader = s3_nodes
+    key = "outputs/scripts/p1/script_manifest.bin"
+    _put(writer, key, "contenido")
+
+    assert writer.exists(key)
+    path = reader.ensure_local(key)
+    assert path == os.path.join(reader.cache_dir, key)
+    assert _read(path) == "contenido"
+
+
+def test_ensure_local_revalidates_with_etag_after_overwrite(s3_nodes):
+    writer, reader = s3_nodes
+    key = "outputs/calibration/tts_speaking_rate.json"
+    _put(writer, key, "v1")
+    assert _read(reader.ensure_local(key)) == "v1"
+
+    _put(writer, key, "v2 (sobrescrito)")
+    # Sin refresh se sirve la copia en cache del nodo; con refresh el ETag cambió y se descarga de nuevo
+    assert _read(reader.ensure_local(key)) == "v1"
+    assert _read(reader.ensure_local(key, refresh=True)) == "v2 (sobrescrito)"
+    # Mismo ETag: la copia local se reutiliza
+    assert _read(reader.ensure_local(key, refresh=True)) == "v2 (sobrescrito)"
+
+
+def test_delete_removes_object_and_refresh_drops_stale_cache_on_other_nodes(s3_nodes):
+    writer, reader = s3_nodes
+    key = "outputs/videos/p1/final_video.mp4"
+    _put(writer, key, "video")
+    cached_path = reader.ensure_local(key)
+
+    assert writer.delete(key)
+    assert not writer.exists(key)
+    assert not os.path.exists(os.path.join(writer.cache_dir, key))
+    # delete solo borra la cache del nodo que borra: el otro nodo la sigue sirviendo hasta revalidar
+    assert reader.ensure_local(key) == cached_path
+    assert reader.ensure_local(key, refresh=True) is None
+    assert not os.path.exists(cached_path)
+
+
+def test_key_stats_lists_sizes_under_prefix(s3_nodes):
+    writer, _ = s3_nodes
+    _put(writer, "outputs/audio/p1/title/segment_001.mp3", "abc")
+    _put(writer, "outputs/audio/p1/title/segment_002.mp3", "abcdef")
+    _put(writer, "outputs/audio/p2/title/segment_001.mp3", "x")
+
+    stats = writer.key_stats("outputs/audio/p1/")
+    assert {key: size for key, (size, _) in stats.items()} == {
+        "outputs/audio/p1/title/segment_001.mp3": 3,
+        "outputs/audio/p1/title/segment_002.mp3": 6,
+    }
+    assert all(modified_at > 0 for _, modified_at in stats.values())
+
+
+def test_ensure_local_missing_key_returns_none(s3_nodes):
+    _, reader = s3_nodes
+    assert reader.ensure_local("outputs/scripts/nope/script_manifest.bin") is None